@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import numpy as np
+
+import data_test
+
+# analyze_symbol_async con fuentes falsas: las cuatro descargas van en paralelo,
+# los extras que fallan no tumban el analisis y sin velas hay error.
+
+DAY = 86400
+DELAY = 0.2
+
+
+def bars(n=300):
+    times = np.arange(n, dtype=np.int64) * DAY + 1_700_000_000 // DAY * DAY
+    closes = 100 + np.cumsum(np.random.default_rng(5).normal(0, 1, n))
+    return {"time": times, "open": closes, "high": closes + 1, "low": closes - 1, "close": closes,
+            "volume": np.full(n, 1000, dtype=np.int64)}
+
+
+def fake_sources(monkeypatch, chart=None, news=None):
+    def fundamentals(symbol):
+        time.sleep(DELAY)
+        return [], True
+
+    async def load_bars(symbol, interval):
+        await asyncio.sleep(DELAY)
+        if isinstance(chart, Exception):
+            raise chart
+        return bars() if chart is None else chart
+
+    async def recommendations(symbol):
+        await asyncio.sleep(DELAY)
+        return {"buy": 3}
+
+    async def fetch_news(symbol):
+        await asyncio.sleep(DELAY)
+        if news is not None:
+            raise news
+        return [{"title": "Headline"}]
+
+    monkeypatch.setattr(data_test, "load_fundamentals_and_quality", fundamentals)
+    monkeypatch.setattr(data_test, "load_bars_async", load_bars)
+    monkeypatch.setattr(data_test, "fetch_recommendations_async", recommendations)
+    monkeypatch.setattr(data_test, "fetch_news_async", fetch_news)
+
+
+def test_fetches_run_in_parallel(monkeypatch):
+    fake_sources(monkeypatch)
+    started = time.perf_counter()
+    result = asyncio.run(data_test.analyze_symbol_async("PAR1"))
+    elapsed = time.perf_counter() - started
+    assert result["status"] == "ok" and result["interval"] == "1d"
+    assert result["recommendations"] == {"buy": 3} and result["news"] == [{"title": "Headline"}]
+    assert result["buffett_certified"] is True
+    assert elapsed < 3 * DELAY  # en serie serian 4 * DELAY
+
+
+def test_extras_failures_are_isolated(monkeypatch):
+    fake_sources(monkeypatch, news=ValueError("search down"))
+    result = asyncio.run(data_test.analyze_symbol_async("PAR2"))
+    assert result["status"] == "ok" and result["news"] == []
+
+
+def test_chart_failures(monkeypatch):
+    fake_sources(monkeypatch, chart=ValueError("No valid data found"))
+    result = asyncio.run(data_test.analyze_symbol_async("PAR3"))
+    assert result["status"] == "error" and result["detail"] == "No valid data found"
+
+    fake_sources(monkeypatch)
+    monkeypatch.setattr(data_test, "CHART_TIMEOUT", DELAY / 4)
+    result = asyncio.run(data_test.analyze_symbol_async("PAR4"))
+    assert result["status"] == "error" and result["detail"] == "Timeout fetching chart data"
@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import indicators
+
+# Backtest de las reglas del dashboard sobre las velas guardadas:
+#   Entrada: senal BUY (RSI + Bollinger, indicators.signal_masks) al cierre.
+#   Salida:  lo primero que ocurra de
+#            - stop loss del trade setup (4% en tendencia alcista, 3% en bajista),
+#            - take profit del trade setup (banda superior si es alcista, SMA 50 si no),
+#            - senal SELL (al cierre),
+#            - max_hold velas sin salida (al cierre) o fin de datos.
+#   Stop y objetivo tocados en la misma vela cuentan como stop (conservador);
+#   si la vela abre mas alla del nivel, se ejecuta a la apertura.
+#   Solo largos y un trade a la vez.
+#
+# Las salidas de todas las entradas candidatas se calculan a la vez con arrays
+# (entradas x horizonte); el unico bucle es el encadenado de trades (uno por
+# trade, no por vela). Los indicadores se calculan una vez por simbolo y se
+# reutilizan en toda la rejilla de parametros.
+
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", str(os.cpu_count() or 2)))
+BACKTEST_CONCURRENCY = int(os.environ.get("BACKTEST_CONCURRENCY", "16"))
+BACKTEST_MAX_COMBOS = 256
+MAX_HOLD = 120
+# Tope de max_hold: la matriz de salidas es entradas x max_hold
+MAX_HOLD_LIMIT = 1000
+FETCH_TIMEOUT = 15
+
+DEFAULT_PARAMS = {"buy_rsi": 40.0, "sell_rsi": 60.0, "buy_margin": 0.02, "sell_margin": 0.02}
+
+# Trade setup: riesgo del stop segun tendencia
+BULLISH_STOP = 0.04
+BEARISH_STOP = 0.03
+
+
+def param_grid(**values):
+    # param_grid(buy_rsi=[35, 40]) -> combinaciones (el resto, por defecto)
+    keys = list(DEFAULT_PARAMS)
+    lists = [values.get(k) or [DEFAULT_PARAMS[k]] for k in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*lists)]
+
+
+def prepare(bars):
+    # Estadisticas compartidas por toda la rejilla (no dependen de los parametros)
+    close = np.array(bars["close"], dtype=np.float64)
+    sma_50 = indicators.sma(close, 50)
+    _, upper, lower = indicators.bollinger(close, 20, 2)
+    bullish = close > sma_50  # NaN -> False: sin SMA 50 cuenta como bajista, igual que el trade setup
+    with np.errstate(invalid="ignore"):
+        stop = close * (1 - np.where(bullish, BULLISH_STOP, BEARISH_STOP))
+        target = np.where(bullish, upper, sma_50)
+    target = np.where(np.isnan(target), upper, target)
+    return {
+        "time": np.array(bars["time"], dtype=np.int64),
+        "open": np.array(bars["open"], dtype=np.float64),
+        "high": np.array(bars["high"], dtype=np.float64),
+        "low": np.array(bars["low"], dtype=np.float64),
+        "close": close,
+        "rsi": indicators.rsi(close, 14),
+        "upper": upper,
+        "lower": lower,
+        "stop": stop,
+        "target": target,
+    }
+
+
+def _exits(stats, entries, sell, max_hold):
+    # Vela, precio y motivo de salida de cada entrada candidata (vectorizado)
+    n = len(stats["close"])
+    # Mas alla del final de los datos no hay velas: el horizonte nunca pasa de n
+    horizon = np.arange(1, min(max_hold, n) + 1)
+    idx = entries[:, None] + horizon[None, :]
+    valid = idx < n
+    idx = np.minimum(idx, n - 1)
+
+    stop = stats["stop"][entries][:, None]
+    target = stats["target"][entries][:, None]
+    with np.errstate(invalid="ignore"):
+        hit_stop = valid & (stats["low"][idx] <= stop)
+        hit_target = valid & (stats["high"][idx] >= target)
+    hit_sell = valid & sell[idx]
+    hit = hit_stop | hit_target | hit_sell
+
+    rows = np.arange(len(entries))
+    any_hit = hit.any(axis=1)
+    first = np.where(any_hit, hit.argmax(axis=1), valid.sum(axis=1) - 1)
+    exit_idx = entries + 1 + first
+
+    j = idx[rows, first]
+    opens = stats["open"][j]
+    stop_px = np.minimum(stop[:, 0], np.where(np.isnan(opens), np.inf, opens))
+    target_px = np.maximum(target[:, 0], np.where(np.isnan(opens), -np.inf, opens))
+    by_stop = any_hit & hit_stop[rows, first]
+    by_target = any_hit & ~by_stop & hit_target[rows, first]
+    by_sell = any_hit & ~by_stop & ~by_target
+    exit_price = np.where(by_stop, stop_px, np.where(by_target, target_px, stats["close"][exit_idx]))
+    reason = np.where(by_stop, "stop", np.where(by_target, "target", np.where(by_sell, "sell",
+                      np.where(exit_idx == n - 1, "end", "time"))))
+    return exit_idx, exit_price, reason
+
+
+def simulate(stats, params, max_hold=MAX_HOLD, with_trades=False):
+    close = stats["close"]
+    n = len(close)
+    buy, sell = indicators.signal_masks(close, stats["rsi"], stats["upper"], stats["lower"], **params)
+    # Una entrada en la ultima vela no tiene con que salir
+    entries = np.flatnonzero(buy[:-1])
+
+    if len(entries):
+        exit_idx, exit_price, reason = _exits(stats, entries, sell, max_hold)
+        # Encadenar trades sin solapamiento: la siguiente entrada, despues de la salida
+        chosen = []
+        pos = 0
+        while pos < len(entries):
+            chosen.append(pos)
+            pos = int(np.searchsorted(entries, exit_idx[pos], side="right"))
+        chosen = np.array(chosen)
+        entries, exit_idx, exit_price, reason = entries[chosen], exit_idx[chosen], exit_price[chosen], reason[chosen]
+    else:
+        exit_idx = entries
+        exit_price = np.empty(0)
+        reason = np.empty(0, dtype=str)
+
+    entry_price = close[entries]
+    trade_ret = exit_price / entry_price - 1
+
+    # Curva de capital vela a vela: dentro de un trade se sigue el cierre,
+    # en la vela de salida el precio de salida
+    delta = np.zeros(n + 1)
+    np.add.at(delta, entries + 1, 1)
+    np.add.at(delta, exit_idx + 1, -1)
+    holding = np.cumsum(delta)[:n] > 0
+    bar_ret = np.zeros(n)
+    bar_ret[1:] = np.where(holding[1:], close[1:] / close[:-1] - 1, 0.0)
+    if len(exit_idx):
+        bar_ret[exit_idx] = exit_price / close[exit_idx - 1] - 1
+    equity = np.cumprod(1 + bar_ret)
+    drawdown = 1 - equity / np.maximum.accumulate(equity)
+
+    result = dict(params)
+    result.update({
+        "trades": int(len(entries)),
+        "total_return": float(equity[-1] - 1),
+        "win_rate": float((trade_ret > 0).mean()) if len(entries) else None,
+        "avg_return": float(trade_ret.mean()) if len(entries) else None,
+        "max_drawdown": float(drawdown.max()),
+        "exposure": float(holding.mean()),
+        "exits": {r: int((reason == r).sum()) for r in ("stop", "target", "sell", "time", "end") if (reason == r).any()},
+    })
+    if with_trades:
+        times = stats["time"]
+        result["trade_list"] = [
+            {"entry_time": int(times[e]), "entry_price": float(close[e]), "exit_time": int(times[x]),
+             "exit_price": float(p), "return": float(r), "reason": str(why)}
+            for e, x, p, r, why in zip(entries, exit_idx, exit_price, trade_ret, reason)
+        ]
+    return result
+
+
+def backtest_symbol(symbol, bars, grid, max_hold=MAX_HOLD, with_trades=False):
+    # Corre en el pool de procesos
+    if len(bars["close"]) < 2:
+        return {"symbol": symbol, "status": "error", "detail": "Not enough data"}
+    stats = prepare(bars)
+    results = [simulate(stats, params, max_hold, with_trades) for params in grid]
+    close = stats["close"]
+    return {
+        "symbol": symbol,
+        "status": "ok",
+        "bars": int(len(close)),
+        "buy_hold_return": float(close[-1] / close[0] - 1),
+        "results": results,
+        "best": max(range(len(results)), key=lambda i: results[i]["total_return"]),
+    }
+
+
+def summarize(symbol_results, grid):
+    # Agregado por combinacion de parametros sobre todos los simbolos
+    ok = [r for r in symbol_results if r.get("status") == "ok"]
+    summary = []
+    for i, params in enumerate(grid):
+        runs = [r["results"][i] for r in ok]
+        trades = sum(run["trades"] for run in runs)
+        wins = sum(run["win_rate"] * run["trades"] for run in runs if run["trades"])
+        row = dict(params)
+        row.update({
+            "symbols": len(runs),
+            "trades": trades,
+            "mean_return": float(np.mean([run["total_return"] for run in runs])) if runs else None,
+            "win_rate": wins / trades if trades else None,
+            "mean_max_drawdown": float(np.mean([run["max_drawdown"] for run in runs])) if runs else None,
+            "mean_exposure": float(np.mean([run["exposure"] for run in runs])) if runs else None,
+        })
+        summary.append(row)
+    return summary
+
+
+class Backtester:
+    def __init__(self, load_bars, workers=BACKTEST_WORKERS, concurrency=BACKTEST_CONCURRENCY):
+        # load_bars(symbol, interval) -> corrutina con las velas (bar_store)
+        self.load_bars = load_bars
+        self.workers = workers
+        self.concurrency = concurrency
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run_symbol(self, symbol, interval, grid, max_hold, with_trades, semaphore):
+        try:
+            async with semaphore:
+                bars = await asyncio.wait_for(self.load_bars(symbol, interval), FETCH_TIMEOUT)
+        except Exception as e:
+            detail = "Timeout fetching chart data" if isinstance(e, asyncio.TimeoutError) else str(e)
+            return {"symbol": symbol, "status": "error", "detail": detail}
+        # Copia de las columnas del memmap: se envian al pool
+        bars = {name: np.array(col) for name, col in bars.items()}
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool(), backtest_symbol, symbol, bars, grid, max_hold, with_trades)
+
+    async def run(self, symbols, interval="1d", grid=None, max_hold=MAX_HOLD, with_trades=False):
+        grid = grid or param_grid()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._run_symbol(s, interval, grid, max_hold, with_trades, semaphore)
+                                         for s in symbols))
+        return {
+            "interval": interval,
+            "max_hold": max_hold,
+            "grid": grid,
+            "summary": summarize(results, grid),
+            "symbols": results,
+        }
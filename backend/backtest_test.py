@@ -0,0 +1,90 @@
+import math
+import random
+
+import numpy as np
+
+import backtest
+import indicators
+
+# Equivalencia del backtest vectorizado contra una simulacion vela a vela.
+
+
+def make_bars(n, seed, vol=0.02):
+    rng = random.Random(seed)
+    p = 100.0
+    bars = {"time": [], "open": [], "high": [], "low": [], "close": [], "volume": []}
+    for i in range(n):
+        o = p
+        p = p * (1 + rng.gauss(0, vol))
+        bars["time"].append(i * 86400)
+        bars["open"].append(o * (1 + rng.gauss(0, vol / 4)))
+        bars["high"].append(max(o, p) * (1 + abs(rng.gauss(0, vol / 2))))
+        bars["low"].append(min(o, p) * (1 - abs(rng.gauss(0, vol / 2))))
+        bars["close"].append(p)
+        bars["volume"].append(1000)
+    return {k: np.array(v) for k, v in bars.items()}
+
+
+def ref_simulate(stats, params, max_hold):
+    close, opens, high, low = stats["close"], stats["open"], stats["high"], stats["low"]
+    n = len(close)
+    buy, sell = indicators.signal_masks(close, stats["rsi"], stats["upper"], stats["lower"], **params)
+    trades = []
+    i = 0
+    while i < n - 1:
+        if not buy[i]:
+            i += 1
+            continue
+        stop, target = stats["stop"][i], stats["target"][i]
+        last = min(i + max_hold, n - 1)
+        for j in range(i + 1, last + 1):
+            if low[j] <= stop:
+                trades.append((i, j, min(stop, opens[j]), "stop"))
+                break
+            if high[j] >= target:
+                trades.append((i, j, max(target, opens[j]), "target"))
+                break
+            if sell[j]:
+                trades.append((i, j, close[j], "sell"))
+                break
+        else:
+            trades.append((i, last, close[last], "end" if last == n - 1 else "time"))
+        i = trades[-1][1] + 1
+    return trades
+
+
+def check(bars, params, max_hold):
+    stats = backtest.prepare(bars)
+    got = backtest.simulate(stats, params, max_hold, with_trades=True)
+    want = ref_simulate(stats, params, max_hold)
+    assert got["trades"] == len(want)
+    for t, (e, x, px, why) in zip(got["trade_list"], want):
+        assert t["entry_time"] == bars["time"][e] and t["exit_time"] == bars["time"][x]
+        assert math.isclose(t["exit_price"], px, rel_tol=1e-12) and t["reason"] == why
+    total = math.prod(1 + px / bars["close"][e] - 1 for e, _, px, _ in want) - 1
+    assert math.isclose(got["total_return"], total, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_default_rules_match_reference():
+    for seed in range(5):
+        check(make_bars(1500, seed), backtest.DEFAULT_PARAMS, backtest.MAX_HOLD)
+
+
+def test_grid_and_short_holds_match_reference():
+    bars = make_bars(800, 42, vol=0.03)
+    for params in backtest.param_grid(buy_rsi=[30, 45], sell_rsi=[55, 70], buy_margin=[0.0, 0.05]):
+        for max_hold in (1, 5, 60):
+            check(bars, params, max_hold)
+
+
+def test_hold_longer_than_history():
+    # El horizonte se recorta a las velas que hay: mismo resultado que la referencia
+    bars = make_bars(300, 7)
+    check(bars, backtest.DEFAULT_PARAMS, 10**7)
+
+
+def test_no_signals():
+    bars = make_bars(30, 1)
+    result = backtest.backtest_symbol("X", bars, backtest.param_grid(buy_rsi=[0]))
+    run = result["results"][0]
+    assert run["trades"] == 0 and run["total_return"] == 0 and run["exposure"] == 0
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Almacen local de velas OHLCV por (symbol, interval). Cada columna es un fichero
+# binario plano que se lee con np.memmap (sin copia). Las actualizaciones solo
+# anaden filas o sobrescriben la ultima (vela en formacion); un refresco completo
+# escribe ficheros nuevos y los sustituye con os.replace, asi los mapas abiertos
+# por otros lectores nunca ven un fichero truncado.
+
+DATA_DIR = os.environ.get("TRADE_DATA_DIR", os.path.join(tempfile.gettempdir(), "trade-dashboard"))
+BARS_DIR = os.path.join(DATA_DIR, "bars")
+# Series abiertas en memoria (LRU); las que salen se releen del disco si vuelven
+MAX_SERIES = int(os.environ.get("BAR_SERIES_CACHE", "1024"))
+
+COLUMNS = {
+    "time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+
+
+def empty_bars():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+class BarSeries:
+    def __init__(self, symbol, interval, root=BARS_DIR):
+        safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", f"{symbol}_{interval}")
+        self.path = os.path.join(root, safe)
+        self.symbol = symbol
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.meta = self._read_meta()
+        self._meta_mtime = None
+
+    # --- Metadatos ---
+
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"rows": 0, "synced_at": 0, "full_synced_at": 0}
+
+    def _write_meta(self):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path())
+
+    def sync_meta(self):
+        # Con varios workers otro proceso puede haber actualizado la serie:
+        # meta.json solo se relee si ha cambiado (un stat por llamada)
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            self.meta = self._read_meta()
+            self._meta_mtime = mtime
+
+    def _col_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    def last_time(self):
+        if not self.rows:
+            return None
+        return int(np.memmap(self._col_path("time"), dtype=np.int64, mode="r", offset=(self.rows - 1) * 8, shape=(1,))[0])
+
+    def age(self):
+        return time.time() - self.meta.get("synced_at", 0)
+
+    def full_age(self):
+        return time.time() - self.meta.get("full_synced_at", 0)
+
+    # --- Lectura (sin copia) ---
+
+    def read(self):
+        self.meta = self._read_meta()
+        n = self.rows
+        if not n:
+            return empty_bars()
+        return {name: np.memmap(self._col_path(name), dtype=dtype, mode="r", shape=(n,))
+                for name, dtype in COLUMNS.items()}
+
+    # --- Escritura ---
+
+    def _file_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        return _FileLock(os.path.join(self.path, ".lock"))
+
+    def replace(self, bars, **info):
+        # Refresco completo: ficheros nuevos + os.replace.
+        # info: datos de la descarga que se guardan en meta.json (range, gmtoffset)
+        with self.lock, self._file_lock():
+            for name, dtype in COLUMNS.items():
+                tmp = self._col_path(name) + ".tmp"
+                np.ascontiguousarray(bars[name], dtype=dtype).tofile(tmp)
+                os.replace(tmp, self._col_path(name))
+            now = time.time()
+            self.meta = {"rows": len(bars["time"]), "synced_at": now, "full_synced_at": now, **info}
+            self._write_meta()
+
+    def merge(self, bars, **info):
+        # Fusiona velas nuevas: las que empiezan en o antes de la ultima guardada
+        # la sobrescriben (correccion de la vela en formacion), el resto se anade.
+        with self.lock, self._file_lock():
+            self.meta = self._read_meta()
+            n = self.rows
+            new_times = np.asarray(bars["time"], dtype=np.int64)
+            if len(new_times):
+                stored = np.memmap(self._col_path("time"), dtype=np.int64, mode="r", shape=(n,)) if n else new_times[:0]
+                start = int(np.searchsorted(stored, new_times[0], side="left"))
+                # Nunca se encoge el fichero (los lectores pueden tenerlo mapeado)
+                keep = max(0, n - start - len(new_times))
+                for name, dtype in COLUMNS.items():
+                    data = np.ascontiguousarray(bars[name], dtype=dtype)
+                    with open(self._col_path(name), "r+b" if n else "wb") as f:
+                        f.seek(start * data.itemsize)
+                        f.write(data.tobytes())
+                self.meta["rows"] = start + len(new_times) + keep
+            self.meta["synced_at"] = time.time()
+            self.meta.update(info)
+            self._write_meta()
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.fd.close()
+
+
+_series = OrderedDict()  # (symbol, interval) -> BarSeries, LRU
+_series_lock = threading.Lock()
+
+
+def get_series(symbol, interval):
+    # Una serie que sale del LRU y sigue en uso no se corrompe: las escrituras
+    # de dos BarSeries del mismo directorio se serializan con el lock de fichero
+    with _series_lock:
+        series = _series.get((symbol, interval))
+        if series is None:
+            series = _series[(symbol, interval)] = BarSeries(symbol, interval)
+            if len(_series) > MAX_SERIES:
+                _series.popitem(last=False)
+        else:
+            _series.move_to_end((symbol, interval))
+        return series
+
+
+def window(bars, seconds):
+    # Vista de las velas de los ultimos `seconds` segundos (slicing sin copia)
+    times = bars["time"]
+    if not len(times) or not seconds:
+        return bars
+    start = int(np.searchsorted(times, times[-1] - seconds, side="left"))
+    return {name: col[start:] for name, col in bars.items()}
@@ -0,0 +1,94 @@
+import tempfile
+
+import numpy as np
+
+import bar_store
+from bar_store import BarSeries
+
+# Almacen de velas en disco: refresco completo, fusion de velas nuevas (con la
+# ultima corregida), huecos, serie vacia, ventana por tiempo y series abiertas
+# acotadas (LRU).
+
+DAY = 86400
+
+
+def bars(days, close=None):
+    times = np.asarray(days, dtype=np.int64) * DAY
+    closes = times / DAY + 100.0 if close is None else np.full(len(times), close, dtype=np.float64)
+    return {"time": times, "open": closes, "high": closes + 1, "low": closes - 1, "close": closes,
+            "volume": np.full(len(times), 10, dtype=np.int64)}
+
+
+def days(series):
+    return list(series.read()["time"] // DAY)
+
+
+def test_empty_series():
+    with tempfile.TemporaryDirectory() as root:
+        series = BarSeries("AAPL", "1d", root)
+        assert series.rows == 0 and series.last_time() is None
+        assert all(len(col) == 0 for col in series.read().values())
+        # Fusion sobre una serie sin ficheros: se crea
+        series.merge(bars(range(3)))
+        assert days(series) == [0, 1, 2] and series.last_time() == 2 * DAY
+
+
+def test_replace_and_read_back():
+    with tempfile.TemporaryDirectory() as root:
+        series = BarSeries("BRK.B", "1d", root)
+        series.replace(bars(range(10)), range="2y", gmtoffset=-14400)
+        read = series.read()
+        assert series.rows == 10 and series.meta["range"] == "2y" and series.meta["gmtoffset"] == -14400
+        assert list(read["close"]) == [100.0 + d for d in range(10)] and read["volume"].dtype == np.int64
+        # Otro proceso (otra instancia) ve lo mismo; un refresco mas corto no deja filas viejas
+        series.replace(bars(range(5, 8)))
+        assert days(BarSeries("BRK.B", "1d", root)) == [5, 6, 7]
+        assert days(series) == [5, 6, 7]
+
+
+def test_merge_overlap_and_append():
+    with tempfile.TemporaryDirectory() as root:
+        series = BarSeries("AAPL", "1d", root)
+        series.replace(bars(range(5)))
+        before = series.read()
+        # La ultima vela (en formacion) se corrige y se anaden dos nuevas
+        series.merge(bars([4, 5, 6], close=7.0))
+        read = series.read()
+        assert days(series) == [0, 1, 2, 3, 4, 5, 6]
+        assert list(read["close"][3:]) == [103.0, 7.0, 7.0, 7.0]
+        assert list(before["time"] // DAY) == [0, 1, 2, 3, 4]  # el mapa anterior sigue valido
+
+        # Solo velas nuevas, mas alla del final
+        series.merge(bars([7, 8]))
+        assert days(series) == list(range(9)) and series.last_time() == 8 * DAY
+
+        # Sin velas: solo se marca la sincronizacion
+        synced = series.meta["synced_at"]
+        series.merge(bars([]))
+        assert series.rows == 9 and series.meta["synced_at"] >= synced
+
+
+def test_merge_with_gap_and_window():
+    with tempfile.TemporaryDirectory() as root:
+        series = BarSeries("AAPL", "1d", root)
+        series.replace(bars(range(3)))
+        # Dias sin cotizacion entre lo guardado y lo nuevo: se anade tal cual
+        series.merge(bars([10, 11]))
+        assert days(series) == [0, 1, 2, 10, 11]
+
+        read = series.read()
+        recent = bar_store.window(read, 2 * DAY)
+        assert list(recent["time"] // DAY) == [10, 11]
+        assert np.shares_memory(recent["close"], read["close"])  # vista, sin copia
+        assert bar_store.window(read, None) is read
+        assert len(bar_store.window(bar_store.empty_bars(), DAY)["time"]) == 0
+
+
+def test_open_series_bounded(monkeypatch):
+    monkeypatch.setattr(bar_store, "MAX_SERIES", 2)
+    monkeypatch.setattr(bar_store, "_series", bar_store.OrderedDict())
+    aapl = bar_store.get_series("AAPL", "1d")
+    bar_store.get_series("MSFT", "1d")
+    assert bar_store.get_series("AAPL", "1d") is aapl  # usada: pasa al final
+    bar_store.get_series("NVDA", "1d")
+    assert list(bar_store._series) == [("AAPL", "1d"), ("NVDA", "1d")]
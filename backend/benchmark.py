@@ -0,0 +1,444 @@
+import argparse
+import calendar
+import contextlib
+import gc
+import glob
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_test
+import formats
+from indicators import LiveIndicators
+
+# Benchmark reproducible de analyze_symbol por etapas, sin red: las respuestas
+# de Yahoo (chart, quoteSummary, search) y de yfinance (info, balance, resultados)
+# salen de fixtures. Hay casos sinteticos deterministas (semilla fija) con los
+# tamaños de los rangos reales y uno de 100k velas; `--record SYMBOL` guarda
+# respuestas reales en benchmarks/fixtures/ y se miden como casos extra.
+#
+# El caso cold_start mide el arranque en frio en procesos nuevos (import de main
+# + primera request a /) y la memoria maxima, como en una invocacion serverless.
+#
+#   python benchmark.py                              # JSON por stdout, compara con baseline.json
+#   python benchmark.py --save-baseline              # fija el baseline actual
+#   python benchmark.py --fail-on-regression         # exit 1 si alguna etapa empeora
+#   python benchmark.py --record AAPL --interval 1wk # graba un fixture real
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+REPEAT = 20
+# Una etapa es regresion si su mediana supera la del baseline en este factor
+# (y en mas de NOISE_MS, para no marcar ruido en etapas de microsegundos)
+THRESHOLD = 1.25
+NOISE_MS = 0.05
+
+END_TS = 1_760_000_000  # ultima vela de los casos sinteticos
+
+# nombre -> (intervalo, velas, segundos entre velas)
+SYNTHETIC_CASES = {
+    "1d_2y": ("1d", 504, 86400),
+    "1wk_5y": ("1wk", 261, 7 * 86400),
+    "1mo_10y": ("1mo", 120, 30 * 86400),
+    "synthetic_100k": ("1h", 100_000, 3600),
+}
+
+COLD_START = "cold_start"
+COLD_START_REPEAT = 5
+# Modulos que no deberian cargarse al arrancar (solo en el respaldo de fundamentales)
+HEAVY_MODULES = ("pandas", "yfinance")
+
+
+# --- Fixtures ---
+
+def synthetic_chart(n, step, seed):
+    # Mismo formato que /v8/finance/chart, con algun hueco (None) como los dias sin trading
+    rng = random.Random(seed)
+    price = 100.0
+    quote = {"open": [], "high": [], "low": [], "close": [], "volume": []}
+    for _ in range(n):
+        open_ = price
+        price = max(price * (1 + rng.gauss(0.0003, 0.02)), 0.01)
+        if rng.random() < 0.002:
+            for values in quote.values():
+                values.append(None)
+            continue
+        quote["open"].append(round(open_, 4))
+        quote["high"].append(round(max(open_, price) * (1 + abs(rng.gauss(0, 0.005))), 4))
+        quote["low"].append(round(min(open_, price) * (1 - abs(rng.gauss(0, 0.005))), 4))
+        quote["close"].append(round(price, 4))
+        quote["volume"].append(rng.randint(100_000, 5_000_000))
+    return {"chart": {"result": [{
+        "meta": {"currency": "USD", "symbol": "BENCH", "dataGranularity": ""},
+        "timestamp": [END_TS - (n - 1 - i) * step for i in range(n)],
+        "indicators": {"quote": [quote]},
+    }], "error": None}}
+
+
+def summary_json(info, balance_sheet, income_stmt):
+    # quoteSummary (defaultKeyStatistics, financialData, estados anuales) con los
+    # mismos datos que las tablas de yfinance
+    def raw(value):
+        return {} if value is None else {"raw": value, "fmt": str(value)}
+
+    def end_date(day):
+        return raw(calendar.timegm(time.strptime(day, "%Y-%m-%d")))
+
+    stats_keys = ("sharesOutstanding", "impliedSharesOutstanding")
+    return {"quoteSummary": {"result": [{
+        "defaultKeyStatistics": {k: raw(v) for k, v in info.items() if k in stats_keys},
+        "financialData": {k: raw(v) for k, v in info.items() if k not in stats_keys},
+        "incomeStatementHistory": {"incomeStatementHistory": [
+            {"endDate": end_date(day), "netIncome": raw(row.get("Net Income"))} for day, row in income_stmt.items()]},
+        "balanceSheetHistory": {"balanceSheetStatements": [
+            {"endDate": end_date(day), "totalStockholderEquity": raw(row.get("Stockholders Equity"))}
+            for day, row in balance_sheet.items()]},
+    }], "error": None}}
+
+
+def synthetic_fixture(name, interval, n, step, seed):
+    rng = random.Random(seed + 1)
+    years = [time.gmtime(END_TS).tm_year - k for k in range(1, 5)]
+    report_dates = [f"{y}-09-30" for y in years]
+    fixture = {
+        "symbol": "BENCH",
+        "interval": interval,
+        "source": "synthetic",
+        "chart": synthetic_chart(n, step, seed),
+        "recommendations": {"quoteSummary": {"result": [{"recommendationTrend": {"trend": [
+            {"period": "0m", "strongBuy": 8, "buy": 20, "hold": 9, "sell": 1, "strongSell": 0}]}}], "error": None}},
+        "search": {"news": [{
+            "uuid": f"n{i}", "title": f"Headline {i}", "publisher": "Wire",
+            "link": f"https://example.com/{i}", "providerPublishTime": END_TS - i * 3600,
+        } for i in range(8)]},
+        "info": {"sharesOutstanding": 15_000_000_000, "earningsGrowth": 0.12,
+                 "returnOnEquity": 1.45, "debtToEquity": 180.0},
+        "balance_sheet": {d: {"Stockholders Equity": rng.uniform(5e10, 8e10), "Total Assets": rng.uniform(3e11, 4e11)}
+                          for d in report_dates},
+        "income_stmt": {d: {"Net Income": rng.uniform(9e10, 1.1e11), "Total Revenue": rng.uniform(3.5e11, 4e11)}
+                        for d in report_dates},
+    }
+    fixture["summary"] = summary_json(fixture["info"], fixture["balance_sheet"], fixture["income_stmt"])
+    return fixture
+
+
+def _frame(table):
+    # {fecha ISO: {fila: valor}} -> DataFrame como los de yfinance (columnas = fechas)
+    frame = pd.DataFrame(table)
+    frame.columns = pd.to_datetime(frame.columns)
+    return frame
+
+
+def _table(frame):
+    return {col.strftime("%Y-%m-%d"): {k: (None if pd.isna(v) else float(v)) for k, v in frame[col].items()}
+            for col in frame.columns}
+
+
+def load_cases(names=None):
+    cases = {}
+    for seed, (name, (interval, n, step)) in enumerate(SYNTHETIC_CASES.items()):
+        cases[name] = synthetic_fixture(name, interval, n, step, seed)
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.json"))):
+        with open(path) as f:
+            cases[os.path.basename(path)[:-5]] = json.load(f)
+    if names:
+        missing = [n for n in names if n not in cases]
+        if missing:
+            raise SystemExit(f"Unknown cases: {', '.join(missing)} (available: {', '.join(cases)})")
+        cases = {n: cases[n] for n in names}
+    return cases
+
+
+def record(symbol, interval):
+    # Graba las respuestas reales de un simbolo como fixture (necesita red)
+    range_val = data_test.chart_range(interval)
+    ticker = data_test._ticker(symbol)
+    fixture = {
+        "symbol": symbol,
+        "interval": interval,
+        "source": "recorded",
+        "recorded_at": int(time.time()),
+        "chart": data_test._get_json(data_test._chart_url(symbol, interval, range_val), data_test.CHART_TIMEOUT),
+        "recommendations": data_test._get_json(data_test._recommendations_url(symbol), data_test.EXTRA_TIMEOUT),
+        "search": data_test._get_json(data_test._news_url(symbol), data_test.EXTRA_TIMEOUT),
+        "summary": data_test._get_json(data_test._summary_url(symbol), data_test.EXTRA_TIMEOUT),
+        "info": json.loads(json.dumps(ticker.info, default=str)),
+        "balance_sheet": _table(ticker.balance_sheet),
+        "income_stmt": _table(ticker.income_stmt),
+    }
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, f"{symbol.replace('^', '').replace('=', '_')}_{interval}_{range_val}.json")
+    with open(path, "w") as f:
+        json.dump(fixture, f)
+    return path
+
+
+# --- Medicion ---
+
+def timed(fn, repeat):
+    fn()  # calentamiento
+    samples = []
+    gc.collect()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    return {
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+    }
+
+
+def _use_fixture(fixture):
+    # scrape_fundamentals lee el quoteSummary via fetch_summary y, de respaldo,
+    # yfinance via fetch_info / fetch_financials
+    frames = (_frame(fixture["balance_sheet"]), _frame(fixture["income_stmt"]))
+    data_test.fetch_info = lambda symbol: fixture["info"]
+    data_test.fetch_financials = lambda symbol: frames
+
+    def fetch_summary(symbol):
+        if "summary" not in fixture:
+            raise ValueError("fixture without quoteSummary")
+        return data_test.parse_summary(fixture["summary"])
+    data_test.fetch_summary = fetch_summary
+
+
+def _scrape_yfinance(symbol):
+    source = data_test.FUNDAMENTALS_SOURCE
+    data_test.FUNDAMENTALS_SOURCE = "yfinance"
+    try:
+        return data_test.scrape_fundamentals(symbol)
+    finally:
+        data_test.FUNDAMENTALS_SOURCE = source
+
+
+def _cold_build(symbol, interval, bars, fundamentals, buffett):
+    data_test._live_states.clear()
+    return data_test.build_analysis(symbol, interval, bars, fundamentals, buffett)
+
+
+def bench_case(fixture, repeat):
+    symbol, interval = fixture["symbol"], fixture["interval"]
+    _use_fixture(fixture)
+    stages = {}
+
+    stages["parse_chart"] = timed(lambda: data_test.parse_chart(fixture["chart"]), repeat)
+    bars = data_test.parse_chart(fixture["chart"])
+    times, prices = bars["time"].tolist(), bars["close"].tolist()
+
+    stages["indicators"] = timed(lambda: LiveIndicators(times, prices).snapshot(), repeat)
+    live = LiveIndicators(times, prices)
+    # Modo live: la ultima vela cambia en cada tick y se actualiza solo la cola
+    ticks = itertools.cycle((prices[:-1] + [prices[-1] * 1.001], prices))
+    stages["indicators_live"] = timed(lambda: (live.sync(times, next(ticks)), live.snapshot()), repeat)
+    series = LiveIndicators(times, prices).snapshot()
+
+    if "summary" in fixture:
+        stages["fundamentals_parse"] = timed(lambda: data_test.parse_summary(fixture["summary"]), repeat)
+    stages["fundamentals_scrape"] = timed(lambda: data_test.scrape_fundamentals(symbol), repeat)
+    stages["fundamentals_scrape_yfinance"] = timed(lambda: _scrape_yfinance(symbol), repeat)
+    snapshot = data_test.scrape_fundamentals(symbol)
+    fundamentals, buffett = snapshot["fundamentals"], snapshot["buffett_certified"]
+
+    stages["fundamentals_overlay"] = timed(lambda: data_test.fundamentals_columns(bars["time"], fundamentals), repeat)
+    stages["signals"] = timed(
+        lambda: data_test.signal_column(bars["close"], series["rsi"], series["upper_band"], series["lower_band"]),
+        repeat)
+    stages["history"] = timed(lambda: data_test.assemble_history(bars, series, fundamentals), repeat)
+    history = data_test.assemble_history(bars, series, fundamentals)
+    stages["trade_setup"] = timed(
+        lambda: data_test.apply_trade_setup({}, prices, series, history["lynch_line"][-1], buffett), repeat)
+    stages["extras_parse"] = timed(lambda: (data_test._parse_recommendations(fixture["recommendations"]),
+                                            data_test._parse_news(fixture["search"])), repeat)
+    stages["build_analysis"] = timed(lambda: _cold_build(symbol, interval, bars, fundamentals, buffett), repeat)
+
+    result = _cold_build(symbol, interval, bars, fundamentals, buffett)
+    result["recommendations"] = data_test._parse_recommendations(fixture["recommendations"])
+    result["news"] = data_test._parse_news(fixture["search"])
+    sizes = {}
+    for fmt in formats.FORMATS:
+        stages[f"format_{fmt}"] = timed(lambda: formats.format_result(result, fmt), repeat)
+        payload = formats.format_result(result, fmt)
+        stages[f"encode_{fmt}_json"] = timed(lambda: formats.encode(payload), repeat)
+        sizes[f"{fmt}_json"] = len(formats.encode(payload))
+        if formats.msgpack is not None:
+            stages[f"encode_{fmt}_msgpack"] = timed(lambda: formats.encode(payload, "msgpack"), repeat)
+            sizes[f"{fmt}_msgpack"] = len(formats.encode(payload, "msgpack"))
+
+    return {
+        "symbol": symbol,
+        "interval": interval,
+        "source": fixture.get("source", "recorded"),
+        "bars": int(len(bars["time"])),
+        "payload_bytes": sizes,
+        "stages": stages,
+    }
+
+
+# --- Arranque en frio ---
+
+_COLD_START_SCRIPT = '''
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def first_request():
+    sent = []
+    scope = {"type": "http", "method": "GET", "path": "/", "raw_path": b"/", "query_string": b"",
+             "headers": [], "http_version": "1.1", "scheme": "http", "root_path": "",
+             "server": ("bench", 80), "client": ("bench", 1)}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        sent.append(message)
+    await main.app(scope, receive, send)
+    return sent[0]["status"]
+
+status = asyncio.run(first_request())
+done = time.perf_counter()
+
+def peak_rss_mb():
+    # VmHWM es del proceso actual; ru_maxrss (KB en Linux) arrastra el del padre tras fork
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_request_ms": (done - imported) * 1000,
+                  "total_ms": (done - start) * 1000, "status": status,
+                  "peak_rss_mb": peak_rss_mb(),
+                  "heavy_modules": [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+
+def bench_cold_start(repeat=COLD_START_REPEAT):
+    # Un proceso nuevo por muestra
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", _COLD_START_SCRIPT], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        if proc.returncode != 0:
+            raise SystemExit(f"cold start failed:\n{proc.stderr}")
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "source": "subprocess",
+        "stages": {stage: summarize([r[f"{stage}_ms"] for r in runs]) for stage in ("import", "first_request", "total")},
+        "peak_rss_mb": round(statistics.median(r["peak_rss_mb"] for r in runs), 1),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "orjson": formats.orjson is not None,
+        "msgpack": formats.msgpack is not None,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(report, baseline, threshold=THRESHOLD):
+    # Ratio de medianas actual/baseline por caso y etapa
+    rows, regressions = [], []
+    for name, case in report["cases"].items():
+        base_case = baseline.get("cases", {}).get(name)
+        if not base_case:
+            continue
+        for stage, stats in case["stages"].items():
+            base = base_case["stages"].get(stage)
+            if not base:
+                continue
+            current, previous = stats["median_ms"], base["median_ms"]
+            ratio = current / previous if previous else math.inf
+            row = {"case": name, "stage": stage, "baseline_ms": previous, "current_ms": current,
+                   "ratio": round(ratio, 3)}
+            row["regression"] = ratio > threshold and current - previous > NOISE_MS
+            rows.append(row)
+            if row["regression"]:
+                regressions.append(f"{name}/{stage}")
+    return {"threshold": threshold, "stages": rows, "regressions": regressions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the analysis pipeline")
+    parser.add_argument("--cases", nargs="*", help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--cold-start-repeat", type=int, default=COLD_START_REPEAT)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--record", metavar="SYMBOL", help="record live Yahoo responses as a fixture and exit")
+    parser.add_argument("--interval", default="1d", help="interval for --record")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        print(record(args.record.upper(), args.interval))
+        return 0
+
+    report = {"created_at": int(time.time()), "repeat": args.repeat, "environment": environment(), "cases": {}}
+    # Los print del pipeline van a stderr: stdout queda solo para el JSON
+    names = [n for n in args.cases or [] if n != COLD_START]
+    with contextlib.redirect_stdout(sys.stderr):
+        if names or not args.cases:
+            for name, fixture in load_cases(names).items():
+                print(f"Benchmarking {name}...")
+                report["cases"][name] = bench_case(fixture, args.repeat)
+        if not args.cases or COLD_START in args.cases:
+            print(f"Benchmarking {COLD_START}...")
+            report["cases"][COLD_START] = bench_cold_start(args.cold_start_repeat)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"path": args.baseline, "environment": baseline.get("environment")}
+        report["comparison"] = compare(report, baseline, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    regressions = report.get("comparison", {}).get("regressions", [])
+    if regressions:
+        print(f"Regressions (> {args.threshold}x): {', '.join(regressions)}", file=sys.stderr)
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
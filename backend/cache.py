@@ -0,0 +1,246 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import shared_cache
+import throttle
+
+# Cache en memoria para respuestas de Yahoo: TTL por tipo de dato, tamano
+# acotado con expulsion LRU y "stale-while-revalidate" (una entrada expirada se
+# sigue sirviendo mientras se refresca en segundo plano).
+#
+# "stale-if-error": si la descarga falla (Yahoo limitando, breaker abierto en
+# throttle) y aun queda la entrada, se sirve aunque haya pasado la ventana de
+# stale. Las revalidaciones de fondo van con prioridad BACKGROUND.
+#
+# Con varios workers (CACHE_BACKEND=sqlite) la memoria de cada proceso es un
+# primer nivel delante de shared_cache: un fallo local mira primero lo que haya
+# guardado otro worker, y descargas y revalidaciones pasan por su lease, asi que
+# cada respuesta de Yahoo se pide una vez para todos los procesos.
+
+# TTL por tipo de dato (segundos)
+DEFAULT_TTLS = {
+    "chart": 15,                   # Precios: segundos
+    "info": 6 * 3600,              # ticker.info (acciones en circulacion, ROE, deuda)
+    "summary": 6 * 3600,           # quoteSummary de fundamentales (info + estados anuales)
+    "financials": 12 * 3600,       # Balance y cuenta de resultados anuales
+    "recommendations": 6 * 3600,   # recommendationTrend
+    "news": 3600,                  # Noticias
+}
+DEFAULT_TTL = 60
+
+# Una entrada expirada se sirve (y se revalida) hasta ttl * STALE_FACTOR;
+# despues se considera un fallo y se bloquea en la descarga.
+STALE_FACTOR = 4
+
+
+class TTLCache:
+    def __init__(self, maxsize=2048, ttls=None, default_ttl=DEFAULT_TTL, stale_factor=STALE_FACTOR, workers=4,
+                 shared=None):
+        self.maxsize = maxsize
+        self.shared = shared
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.stale_factor = stale_factor
+        self._data = OrderedDict()  # (kind, key) -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-revalidate")
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0,
+                       "revalidations": 0, "revalidation_errors": 0, "stale_if_error": 0, "shared_hits": 0}
+        self._kind_stats = {}
+
+    def ttl_for(self, kind):
+        return self.ttls.get(kind, self.default_ttl)
+
+    def _count(self, kind, name):
+        self._stats[name] += 1
+        per_kind = self._kind_stats.setdefault(kind, {"hits": 0, "stale_hits": 0, "misses": 0})
+        if name in per_kind:
+            per_kind[name] += 1
+
+    def get(self, kind, key):
+        # Devuelve (valor, estado) con estado "fresh", "stale" o None (fallo)
+        with self._lock:
+            entry = self._data.get((kind, key))
+            if entry is None:
+                return None, None
+            value, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.ttl_for(kind)
+            if age > ttl * self.stale_factor:
+                return None, None
+            self._data.move_to_end((kind, key))
+            return value, "fresh" if age <= ttl else "stale"
+
+    def set(self, kind, key, value, stored_at=None, publish=True):
+        # stored_at: hora original si el valor viene de otro worker (mismo TTL para todos)
+        with self._lock:
+            self._data[(kind, key)] = (value, time.time() if stored_at is None else stored_at)
+            self._data.move_to_end((kind, key))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+        if publish and self.shared is not None:
+            try:
+                self.shared.set(kind, key, value, stored_at)
+            except Exception as e:
+                print(f"Shared cache write error ({kind} {key}): {e}")
+
+    def invalidate(self, kind, key):
+        with self._lock:
+            self._data.pop((kind, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _lookup(self, kind, key):
+        value, state = self.get(kind, key)
+        if state != "fresh" and self.shared is not None and self._promote(kind, key):
+            value, state = self.get(kind, key)
+        self._record(kind, state)
+        return value, state
+
+    async def _alookup(self, kind, key):
+        value, state = self.get(kind, key)
+        if state != "fresh" and self.shared is not None and await asyncio.to_thread(self._promote, kind, key):
+            value, state = self.get(kind, key)
+        self._record(kind, state)
+        return value, state
+
+    def _record(self, kind, state):
+        with self._lock:
+            self._count(kind, {"fresh": "hits", "stale": "stale_hits"}.get(state, "misses"))
+
+    def _promote(self, kind, key):
+        # Entrada de otro worker mas reciente que la local -> a la memoria local
+        try:
+            hit = self.shared.get(kind, key)
+        except Exception as e:
+            print(f"Shared cache read error ({kind} {key}): {e}")
+            return False
+        if hit is None:
+            return False
+        with self._lock:
+            entry = self._data.get((kind, key))
+            if entry is not None and entry[1] >= hit[1]:
+                return False
+            self._stats["shared_hits"] += 1
+        self.set(kind, key, hit[0], hit[1], publish=False)
+        return True
+
+    def _fetch(self, kind, key, fetch):
+        # (valor, stored_at); con almacen compartido solo un worker descarga
+        if self.shared is None:
+            return fetch(), None
+        return self.shared.get_or_compute(kind, key, self.ttl_for(kind), fetch)
+
+    async def _afetch(self, kind, key, fetch):
+        if self.shared is None:
+            return await fetch(), None
+        return await self.shared.aget_or_compute(kind, key, self.ttl_for(kind), fetch)
+
+    def get_or_fetch(self, kind, key, fetch):
+        # `fetch` se llama sin argumentos; si lanza una excepcion no se guarda nada
+        value, state = self._lookup(kind, key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            self.revalidate(kind, key, fetch)
+            return value
+
+        try:
+            value, stored_at = self._fetch(kind, key, fetch)
+        except Exception as e:
+            return self._fallback(kind, key, e)
+        self.set(kind, key, value, stored_at, publish=False)
+        return value
+
+    async def aget_or_fetch(self, kind, key, fetch):
+        # Variante async: `fetch` devuelve una corrutina
+        value, state = await self._alookup(kind, key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            if self._start_revalidation(kind, key):
+                task = asyncio.get_running_loop().create_task(self._arevalidate(kind, key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+
+        try:
+            value, stored_at = await self._afetch(kind, key, fetch)
+        except Exception as e:
+            return self._fallback(kind, key, e)
+        self.set(kind, key, value, stored_at, publish=False)
+        return value
+
+    def _fallback(self, kind, key, error):
+        # Entrada demasiado vieja para servirla normalmente, pero mejor que un error
+        with self._lock:
+            entry = self._data.get((kind, key))
+            if entry is None:
+                raise error
+            self._stats["stale_if_error"] += 1
+        print(f"Serving expired {kind} {key} after upstream error: {error}")
+        return entry[0]
+
+    def _start_revalidation(self, kind, key):
+        with self._lock:
+            if (kind, key) in self._revalidating:
+                return False
+            self._revalidating.add((kind, key))
+            self._stats["revalidations"] += 1
+            return True
+
+    def revalidate(self, kind, key, fetch):
+        if self._start_revalidation(kind, key):
+            self._executor.submit(self._revalidate, kind, key, fetch)
+
+    def _revalidate(self, kind, key, fetch):
+        throttle.set_priority(throttle.BACKGROUND)
+        try:
+            value, stored_at = self._fetch(kind, key, fetch)
+            self.set(kind, key, value, stored_at, publish=False)
+        except Exception as e:
+            self._revalidation_failed(kind, key, e)
+        finally:
+            self._end_revalidation(kind, key)
+
+    async def _arevalidate(self, kind, key, fetch):
+        throttle.set_priority(throttle.BACKGROUND)
+        try:
+            value, stored_at = await self._afetch(kind, key, fetch)
+            self.set(kind, key, value, stored_at, publish=False)
+        except Exception as e:
+            self._revalidation_failed(kind, key, e)
+        finally:
+            self._end_revalidation(kind, key)
+
+    def _revalidation_failed(self, kind, key, e):
+        print(f"Cache revalidation error ({kind} {key}): {e}")
+        with self._lock:
+            self._stats["revalidation_errors"] += 1
+
+    def _end_revalidation(self, kind, key):
+        with self._lock:
+            self._revalidating.discard((kind, key))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+            stats["size"] = len(self._data)
+            stats["maxsize"] = self.maxsize
+            stats["shared"] = self.shared is not None
+            stats["hit_ratio"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+            stats["by_kind"] = {kind: dict(v) for kind, v in self._kind_stats.items()}
+            return stats
+
+
+# Cache compartida por todo el proceso para las llamadas a Yahoo
+upstream_cache = TTLCache(shared=shared_cache.shared_store)
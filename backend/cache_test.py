@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache import TTLCache
+
+# Cache de respuestas de Yahoo: TTL por tipo, LRU, stale-while-revalidate con
+# una sola revalidacion por clave y stale-if-error.
+
+
+def wait_revalidations(cache):
+    for _ in range(200):
+        with cache._lock:
+            if not cache._revalidating:
+                return
+        time.sleep(0.01)
+    raise AssertionError("revalidation did not finish")
+
+
+def test_ttl_per_kind_and_lru():
+    cache = TTLCache(maxsize=2, ttls={"chart": 0.05, "news": 60})
+    calls = []
+    fetch = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_fetch("chart", "AAPL", fetch) == 1
+    assert cache.get_or_fetch("chart", "AAPL", fetch) == 1  # fresco
+    assert cache.ttl_for("news") == 60 and cache.ttl_for("other") == cache.default_ttl
+
+    cache.set("news", "A", ["a"])
+    cache.set("news", "B", ["b"])  # tercera entrada: sale la menos usada (chart AAPL)
+    assert cache.get("chart", "AAPL") == (None, None) and cache.get("news", "A") == (["a"], "fresh")
+    cache.set("news", "C", ["c"])  # A se acaba de usar: sale B
+    assert cache.get("news", "B") == (None, None) and cache.get("news", "A")[0] == ["a"]
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["size"] == 2 and stats["by_kind"]["chart"]["hits"] == 1
+
+
+def test_stale_served_and_revalidated_once():
+    cache = TTLCache(ttls={"chart": 0.05}, stale_factor=100)
+    cache.set("chart", "AAPL", "old")
+    time.sleep(0.06)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return "new"
+
+    # Caducada pero dentro de la ventana stale: se sirve al momento y se
+    # revalida en segundo plano una sola vez, aunque la pidan varios
+    assert [cache.get_or_fetch("chart", "AAPL", fetch) for _ in range(5)] == ["old"] * 5
+    release.set()
+    wait_revalidations(cache)
+    assert calls == [1] and cache.get("chart", "AAPL") == ("new", "fresh")
+    stats = cache.stats()
+    assert stats["stale_hits"] == 5 and stats["revalidations"] == 1
+
+    # Revalidacion fallida: se conserva la entrada y se cuenta el error
+    time.sleep(0.06)
+
+    def failing():
+        raise ValueError("upstream down")
+    assert cache.get_or_fetch("chart", "AAPL", failing) == "new"
+    wait_revalidations(cache)
+    assert cache.stats()["revalidation_errors"] == 1 and cache.get("chart", "AAPL") == ("new", "stale")
+
+
+def test_async_stale_revalidates_once():
+    cache = TTLCache(ttls={"news": 0.05}, stale_factor=100)
+    cache.set("news", "AAPL", ["old"])
+    time.sleep(0.06)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["new"]
+
+    async def main():
+        served = await asyncio.gather(*(cache.aget_or_fetch("news", "AAPL", fetch) for _ in range(4)))
+        assert served == [["old"]] * 4
+        await asyncio.gather(*cache._tasks)
+        assert await cache.aget_or_fetch("news", "AAPL", fetch) == ["new"]
+
+    asyncio.run(main())
+    assert calls == [1]
+
+
+def test_expired_entry_served_if_fetch_fails():
+    cache = TTLCache(ttls={"chart": 0.01}, stale_factor=1)
+    cache.set("chart", "AAPL", "old")
+    time.sleep(0.03)
+
+    def failing():
+        raise ValueError("upstream down")
+
+    # Demasiado vieja para servirla sin mas: se intenta descargar y, si falla, mejor lo viejo
+    assert cache.get("chart", "AAPL") == (None, None)
+    assert cache.get_or_fetch("chart", "AAPL", failing) == "old"
+
+    async def afailing():
+        raise ValueError("upstream down")
+    assert asyncio.run(cache.aget_or_fetch("chart", "AAPL", afailing)) == "old"
+    assert cache.stats()["stale_if_error"] == 2
+
+    # Sin nada guardado el error llega al llamador y no se guarda nada
+    with pytest.raises(ValueError):
+        cache.get_or_fetch("chart", "MSFT", failing)
+    assert cache.get_or_fetch("chart", "MSFT", lambda: "fresh") == "fresh"
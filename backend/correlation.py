@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from intraday_store import INTRADAY
+
+# Correlacion y covarianza de rendimientos entre los simbolos de una cartera
+# (20-100 valores). Los cierres se alinean en un indice comun de tiempos y las
+# dos matrices salen de cuatro productos de matrices (T x N) sobre la ventana
+# movil de las ultimas `window` velas, sin bucles por pareja.
+#
+#   - Indice: velas diarias o mas largas por dia UTC (cada bolsa fecha su vela
+#     a su hora de apertura); intradia, por timestamp exacto.
+#   - Rendimientos logaritmicos entre velas consecutivas de cada simbolo. Un
+#     dia sin vela (festivo de su bolsa, aun no cotizaba) queda como hueco y
+#     cada pareja usa solo las filas en las que cotizan los dos.
+#   - Parejas con menos de MIN_OBSERVATIONS filas comunes -> null.
+#
+# Resultado en cache por (simbolos, intervalo, ventana, ultima vela de cada
+# simbolo): mientras no llegue una vela nueva (o cambie la que se esta
+# formando) no se recalcula.
+
+CORRELATION_MAX_SYMBOLS = int(os.environ.get("CORRELATION_MAX_SYMBOLS", "100"))
+CORRELATION_CONCURRENCY = int(os.environ.get("CORRELATION_CONCURRENCY", "16"))
+CORRELATION_CACHE_SIZE = 64
+FETCH_TIMEOUT = 15
+# Ventana por defecto (velas): ~1 ano en diario/semanal/mensual
+DEFAULT_WINDOWS = {"1d": 252, "1wk": 104, "1mo": 60}
+DEFAULT_WINDOW = 252
+MIN_OBSERVATIONS = 20
+DAY = 86400
+DAILY_INTERVALS = ("1d", "1wk", "1mo")
+INTERVALS = tuple(INTRADAY) + DAILY_INTERVALS
+
+
+def align_closes(bars_list, interval):
+    # -> (indice de tiempos, cierres T x N con NaN donde un simbolo no tiene vela)
+    keys = []
+    for bars in bars_list:
+        times = np.asarray(bars["time"], dtype=np.int64)
+        keys.append(times // DAY * DAY if interval in DAILY_INTERVALS else times)
+    index = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+    closes = np.full((len(index), len(bars_list)), np.nan)
+    for j, (key, bars) in enumerate(zip(keys, bars_list)):
+        closes[np.searchsorted(index, key), j] = np.asarray(bars["close"], dtype=np.float64)
+    return index, closes
+
+
+def log_returns(closes):
+    # Rendimiento de cada simbolo desde su vela anterior, en la fila de la nueva;
+    # NaN donde no cotiza (o en su primera vela)
+    rows = np.arange(len(closes))[:, None]
+    valid = ~np.isnan(closes) & (closes > 0)
+    last = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    prev = np.vstack([np.full((1, closes.shape[1]), -1), last[:-1]])
+    cols = np.arange(closes.shape[1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = np.log(closes / closes[np.maximum(prev, 0), cols])
+    returns[~valid | (prev < 0)] = np.nan
+    return returns
+
+
+def pairwise_matrices(returns, min_periods=MIN_OBSERVATIONS):
+    # Correlacion y covarianza (muestral) de cada pareja sobre sus filas comunes.
+    # sx[i, j] = suma de los rendimientos de i en las filas en que j tambien cotiza
+    valid = ~np.isnan(returns)
+    mask = valid.astype(np.float64)
+    x = np.where(valid, returns, 0.0)
+    n = mask.T @ mask
+    sx = x.T @ mask
+    sxx = (x * x).T @ mask
+    sxy = x.T @ x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (sxy - sx * sx.T / n) / (n - 1)
+        var = (sxx - sx * sx / n) / (n - 1)
+        corr = np.clip(cov / np.sqrt(var * var.T), -1.0, 1.0)
+    short = n < max(min_periods, 2)
+    cov[short] = np.nan
+    corr[short] = np.nan
+    diagonal = np.diag_indices_from(corr)
+    corr[diagonal] = np.where(short[diagonal], np.nan, 1.0)
+    return corr, cov, n
+
+
+def correlation_matrices(bars_list, interval, window):
+    # Todo el calculo sobre arrays: se ejecuta en un hilo (numpy suelta el GIL)
+    index, closes = align_closes(bars_list, interval)
+    returns = log_returns(closes)[1:]
+    index = index[1:]
+    if window:
+        returns, index = returns[-window:], index[-window:]
+    corr, cov, n = pairwise_matrices(returns)
+    return {
+        "start": int(index[0]) if len(index) else None,
+        "end": int(index[-1]) if len(index) else None,
+        "rows": len(index),
+        "correlation": corr,
+        "covariance": cov,
+        "observations": n.astype(np.int64),
+    }
+
+
+def _matrix(values):
+    # NaN -> None (null en JSON)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+class Correlator:
+    def __init__(self, load_bars, concurrency=CORRELATION_CONCURRENCY, cache_size=CORRELATION_CACHE_SIZE):
+        # load_bars(symbol, interval) -> corrutina con las velas (bar_store)
+        self.load_bars = load_bars
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "hits": 0, "misses": 0}
+
+    async def _load(self, symbol, interval, semaphore):
+        try:
+            async with semaphore:
+                bars = await asyncio.wait_for(self.load_bars(symbol, interval), FETCH_TIMEOUT)
+        except Exception as e:
+            detail = "Timeout fetching chart data" if isinstance(e, asyncio.TimeoutError) else str(e)
+            return symbol, None, detail
+        if len(bars["time"]) < 2:
+            return symbol, None, "Not enough data"
+        return symbol, bars, None
+
+    def _cached(self, key):
+        with self._lock:
+            self._stats["runs"] += 1
+            entry = self._cache.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._cache.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def run(self, symbols, interval="1d", window=None):
+        window = DEFAULT_WINDOWS.get(interval, DEFAULT_WINDOW) if window is None else window
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loaded = await asyncio.gather(*(self._load(s, interval, semaphore) for s in symbols))
+        errors = [{"symbol": s, "status": "error", "detail": detail} for s, _, detail in loaded if detail]
+        ok = sorted((s, bars) for s, bars, detail in loaded if not detail)
+
+        # Orden canonico (ordenados) en la cache; la respuesta sigue el orden pedido
+        key = (interval, window, tuple((s, int(bars["time"][-1]), float(bars["close"][-1])) for s, bars in ok))
+        entry = self._cached(key)
+        if entry is None:
+            entry = await asyncio.to_thread(correlation_matrices, [bars for _, bars in ok], interval, window)
+            self._store(key, entry)
+        position = {s: i for i, (s, _) in enumerate(ok)}
+        order = np.array([position[s] for s in symbols if s in position], dtype=np.int64)
+        pick = np.ix_(order, order)
+        return {
+            "interval": interval,
+            "window": window,
+            "returns": "log",
+            "symbols": [s for s in symbols if s in position],
+            "start": entry["start"],
+            "end": entry["end"],
+            "rows": entry["rows"],
+            "min_observations": MIN_OBSERVATIONS,
+            "correlation": _matrix(entry["correlation"][pick]),
+            "covariance": _matrix(entry["covariance"][pick]),
+            "observations": entry["observations"][pick].tolist(),
+            "errors": errors,
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._cache)
+            return stats
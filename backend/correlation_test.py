@@ -0,0 +1,85 @@
+import asyncio
+
+import numpy as np
+
+import correlation
+
+# Matrices vectorizadas frente a un calculo pareja a pareja, alineado de bolsas
+# con horarios y festivos distintos y cache del Correlator.
+
+DAY = 86400
+START = 1_700_000_000 // DAY * DAY
+
+
+def bars(days, closes, hour=14):
+    times = START + np.asarray(days, dtype=np.int64) * DAY + hour * 3600
+    return {"time": times, "close": np.asarray(closes, dtype=np.float64)}
+
+
+def reference(returns, min_periods):
+    # Pareja a pareja, solo filas en las que cotizan los dos
+    n = returns.shape[1]
+    corr, cov = np.full((n, n), np.nan), np.full((n, n), np.nan)
+    for i in range(n):
+        for j in range(n):
+            both = ~np.isnan(returns[:, i]) & ~np.isnan(returns[:, j])
+            if both.sum() < min_periods:
+                continue
+            a, b = returns[both, i], returns[both, j]
+            cov[i, j] = np.cov(a, b)[0, 1]
+            corr[i, j] = np.corrcoef(a, b)[0, 1]
+    return corr, cov
+
+
+def test_matches_pairwise_reference():
+    rng = np.random.default_rng(7)
+    returns = rng.normal(0, 0.01, (400, 12))
+    returns[:, 1] += returns[:, 0]  # una pareja muy correlada
+    returns[rng.random(returns.shape) < 0.1] = np.nan
+    returns[:380, 11] = np.nan      # simbolo recien salido a bolsa: pocas filas
+    corr, cov, n = correlation.pairwise_matrices(returns, min_periods=30)
+    ref_corr, ref_cov = reference(returns, 30)
+    assert np.allclose(corr, ref_corr, equal_nan=True, atol=1e-9)
+    assert np.allclose(cov, ref_cov, equal_nan=True, atol=1e-12)
+    assert corr[0, 1] > 0.6 and np.isnan(corr[0, 11]) and np.isnan(corr[11, 11])
+    assert (n == n.T).all()
+
+
+def test_align_across_exchanges():
+    # Misma fecha a horas distintas (Madrid y Nueva York); festivo el dia 2 en Madrid
+    us = bars([0, 1, 2, 3, 4], [100, 101, 102, 101, 103], hour=14)
+    eu = bars([0, 1, 3, 4], [10, 10.1, 10.2, 10.3], hour=8)
+    index, closes = correlation.align_closes([us, eu], "1d")
+    assert list((index - START) // DAY) == [0, 1, 2, 3, 4]
+    returns = correlation.log_returns(closes)
+    assert np.isnan(returns[2, 1])
+    # Tras el festivo, el rendimiento es desde su ultima vela (dia 1)
+    assert np.isclose(returns[3, 1], np.log(10.2 / 10.1))
+    assert np.isclose(returns[3, 0], np.log(101 / 102))
+
+
+def test_correlator_cache_and_order():
+    rng = np.random.default_rng(1)
+    days = np.arange(300)
+    series = {s: bars(days, 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 300)))) for s in ("AAA", "BBB", "CCC")}
+    loads = []
+
+    async def load_bars(symbol, interval):
+        loads.append(symbol)
+        if symbol == "BAD":
+            raise ValueError("No valid data found")
+        return series[symbol]
+
+    correlator = correlation.Correlator(load_bars)
+    first = asyncio.run(correlator.run(["CCC", "AAA", "BAD", "BBB"], "1d", 100))
+    second = asyncio.run(correlator.run(["AAA", "BBB", "CCC"], "1d", 100))
+    assert first["symbols"] == ["CCC", "AAA", "BBB"] and first["rows"] == 100
+    assert first["errors"][0]["symbol"] == "BAD"
+    assert first["correlation"][0][1] == second["correlation"][2][0]
+    assert first["correlation"][1][1] == 1.0 and first["observations"][0][0] == 100
+    assert correlator.stats()["hits"] == 1
+
+    # Vela nueva en un simbolo: se recalcula
+    series["AAA"] = bars(np.arange(301), np.append(series["AAA"]["close"], 120))
+    asyncio.run(correlator.run(["AAA", "BBB", "CCC"], "1d", 100))
+    assert correlator.stats()["misses"] == 2
@@ -1,557 +1,957 @@
+import asyncio
+import contextlib
 import json
+import os
 import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from curl_cffi import requests as cffi_requests
-import yfinance as yf
-import pandas as pd
+import numpy as np
+import indicators
+import bar_store
+import resample
+from intraday_store import INTRADAY, intraday_store
+import metrics
+import throttle
+from indicators import to_list, LiveIndicators, DEFAULT_INDICATORS
+from cache import upstream_cache
+from shared_cache import shared_store
+from http_pool import http_pool
+from throttle import UpstreamError, UpstreamUnavailable
+from singleflight import SingleFlight
+from fundamentals_store import FundamentalsStore
+from formats import format_result
+
+# Estado incremental de indicadores por (symbol, interval) para el modo live
+LIVE_STATE_MAX = 256
+_live_states = OrderedDict()
+_live_states_lock = threading.Lock()
+
+# Un solo analisis en curso por (symbol, interval); el resto espera ese resultado
+analysis_flight = SingleFlight()
+
+# Timeouts por fuente (segundos). Si una fuente secundaria no responde a tiempo
+# el analisis sigue sin ella.
+CHART_TIMEOUT = 10
+EXTRA_TIMEOUT = 5
+FUNDAMENTALS_TIMEOUT = 15
+
+# Cada cuanto se vuelve a descargar la historia completa de velas (splits/ajustes)
+FULL_REFRESH_AGE = 24 * 3600
+
+# Con almacen compartido (varios workers): un analisis de otro proceso con menos
+# de estos segundos se reutiliza en vez de recalcularlo
+ANALYSIS_TTL = float(os.environ.get("ANALYSIS_CACHE_SECONDS", "5"))
 
 def calculate_sma(prices, period):
-    if len(prices) < period:
-        return [None] * len(prices)
-    sma = []
-    for i in range(len(prices)):
-        if i < period - 1:
-            sma.append(None)
-        else:
-            window = prices[i - period + 1 : i + 1]
-            sma.append(sum(window) / period)
-    return sma
+    return to_list(indicators.sma(prices, period))
 
 def calculate_ema(data, window):
-    if len(data) < window:
-        return [None] * len(data)
-    
-    # First value is SMA
-    sma_initial = sum(data[:window]) / window
-    ema = [None] * (window - 1) + [sma_initial]
-    
-    multiplier = 2 / (window + 1)
-    
-    for i in range(window, len(data)):
-        val = (data[i] - ema[-1]) * multiplier + ema[-1]
-        ema.append(val)
-    
-    return ema
+    return to_list(indicators.ema(data, window))
 
 def calculate_rsi(prices, period=14):
-    if len(prices) < period + 1:
-        return [None] * len(prices)
-    
-    rsi = [None] * len(prices)
-    deltas = [prices[i] - prices[i-1] for i in range(1, len(prices))]
-    
-    avg_gain = 0
-    avg_loss = 0
+    return to_list(indicators.rsi(prices, period))
+
+def calculate_std_dev(prices, period, sma_values):
+    return to_list(indicators.std_dev(prices, period, sma_values))
+
+def live_indicator_series(symbol, interval, times, prices, specs=DEFAULT_INDICATORS):
+    # Usa el estado caliente si la nueva serie lo continua; si no, recalcula
+    key = (symbol, interval, specs)
+    with _live_states_lock:
+        state = _live_states.get(key)
+        if state is not None:
+            _live_states.move_to_end(key)
+
+    if state is not None:
+        with state.lock:
+            if state.sync(times, prices):
+                return state.snapshot()
+
+    state = LiveIndicators(times, prices, specs)
+    with _live_states_lock:
+        _live_states[key] = state
+        _live_states.move_to_end(key)
+        while len(_live_states) > LIVE_STATE_MAX:
+            _live_states.popitem(last=False)
+    return state.snapshot()
+
+# Usar curl_cffi para imitar Chrome y evitar bloqueos (incluso sin proxy en la nube ayuda).
+# Las sesiones viven en http_pool y se reutilizan entre requests (keep-alive, HTTP/2).
+
+def _upstream_source(url):
+    # Etiqueta de /metrics: chart, quoteSummary o search
+    for source in ("chart", "quoteSummary", "search"):
+        if f"/{source}" in url:
+            return source
+    return "other"
+
+def _get_json(url, timeout):
+    print(f"Fetching {url}...")
+    with metrics.upstream(_upstream_source(url)):
+        resp = http_pool.get(url, timeout=timeout)
+        if resp.status_code != 200:
+            raise UpstreamError(resp.status_code)
+        return resp.json()
+
+async def _aget_json(url, timeout):
+    print(f"Fetching {url}...")
+    with metrics.upstream(_upstream_source(url)):
+        resp = await http_pool.aget(url, timeout=timeout)
+        if resp.status_code != 200:
+            raise UpstreamError(resp.status_code)
+        return resp.json()
+
+def _ticker(symbol):
+    # yfinance comparte la sesion del pool: cookies y crumb se obtienen una vez.
+    # Se importa aqui (arrastra pandas, ~0.6 s): solo lo usa el respaldo de fundamentales
+    import yfinance as yf
+    return yf.Ticker(symbol, session=http_pool.session())
+
+# --- URLs y parseo de Yahoo (compartido por las variantes sync y async) ---
+
+def _chart_url(symbol, interval, range_val):
+    # URL directa a la API de Yahoo Finance (JSON)
+    return f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range={range_val}&interval={interval}"
+
+def _chart_since_url(symbol, interval, period1):
+    # Solo las velas desde `period1` (incluida la ultima guardada, para corregirla)
+    return f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?period1={period1}&period2={int(time.time())}&interval={interval}"
+
+def _recommendations_url(symbol):
+    return f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}?modules=recommendationTrend"
+
+def _news_url(symbol):
+    return f"https://query2.finance.yahoo.com/v1/finance/search?q={symbol}"
+
+def parse_chart(data_json):
+    # Velas limpias como columnas NumPy (time, open, high, low, close, volume)
+    try:
+        result_block = data_json["chart"]["result"][0]
+        timestamps = result_block.get("timestamp") or []
+        quotes = result_block["indicators"]["quote"][0]
+        closes = quotes.get("close") or []
+        if len(closes) != len(timestamps):
+            raise KeyError("close")
+    except (KeyError, TypeError, IndexError):
+        raise ValueError("Invalid data format from API")
     
-    # First Average
-    for i in range(period):
-        if deltas[i] > 0:
-            avg_gain += deltas[i]
-        else:
-            avg_loss += abs(deltas[i])
-            
-    avg_gain /= period
-    avg_loss /= period
+    c = np.array(closes, dtype=np.float64)
+    # Use closes for missing fields if necessary (fallback)
+    def column(name):
+        values = quotes.get(name)
+        if not values:
+            return c.copy()
+        col = np.array(values, dtype=np.float64)
+        return np.where(np.isnan(col), c, col)
+    volumes = np.array(quotes.get("volume") or [0] * len(c), dtype=np.float64)
     
-    if avg_loss == 0:
-        rsi[period] = 100
+    # Filtrar Nones (días sin trading)
+    valid = ~np.isnan(c)
+    return {
+        "time": np.array(timestamps, dtype=np.int64)[valid],
+        "open": column("open")[valid],
+        "high": column("high")[valid],
+        "low": column("low")[valid],
+        "close": c[valid],
+        "volume": np.nan_to_num(volumes, nan=0.0).astype(np.int64)[valid],
+    }
+
+def _parse_recommendations(rec_json):
+    try:
+        trend = rec_json["quoteSummary"]["result"][0]["recommendationTrend"]["trend"][0]
+        return {
+            "strongBuy": trend["strongBuy"],
+            "buy": trend["buy"],
+            "hold": trend["hold"],
+            "sell": trend["sell"],
+            "strongSell": trend["strongSell"]
+        }
+    except (KeyError, TypeError, IndexError):
+        # Sin cobertura de analistas
+        return None
+
+def _parse_news(news_json):
+    news_data = []
+    try:
+        # Extract news from search results
+        items = news_json.get("news", [])
+        for item in items[:5]: # Top 5 noticias
+            news_data.append({
+                "title": item.get("title"),
+                "publisher": item.get("publisher"),
+                "link": item.get("link"),
+                "time": item.get("providerPublishTime")
+            })
+    except (AttributeError, TypeError) as e:
+        print(f"Unexpected news format: {e!r}")
+    return news_data
+
+# --- Descargas de Yahoo (cacheadas por tipo, simbolo e intervalo) ---
+
+# --- Velas: almacen local + descarga incremental ---
+
+# Timeframes que se derivan de las velas diarias guardadas (resample.py) en vez
+# de descargarse aparte: cambiar de timeframe no cuesta llamadas a Yahoo.
+RESAMPLED = {"1wk": "week", "1mo": "month"}
+
+# Timeframes soportados (el resto se rechaza antes de tocar el almacen de velas)
+INTERVALS = tuple(INTRADAY) + ("1d",) + tuple(RESAMPLED)
+
+def _stored_interval(interval):
+    return "1d" if interval in RESAMPLED else interval
+
+def _stored_range(series):
+    # Rango de la ultima descarga completa (las series antiguas no lo guardaban)
+    return series.meta.get("range") or chart_range(series.interval)
+
+def _deep_enough(series, interval):
+    return RANGE_SECONDS[_stored_range(series)] >= RANGE_SECONDS[chart_range(interval)]
+
+def _chart_plan(series, symbol, interval):
+    # Descarga completa si no hay historia, si no llega al rango que pide el
+    # timeframe (1mo necesita 10y de diarias) o si toca refresco por
+    # splits/ajustes; si no, solo las velas posteriores a la ultima guardada.
+    if not series.rows or not _deep_enough(series, interval) or series.full_age() > FULL_REFRESH_AGE:
+        # Nunca se recorta: se mantiene el mayor rango pedido hasta ahora
+        range_val = chart_range(interval)
+        if series.rows and RANGE_SECONDS[_stored_range(series)] > RANGE_SECONDS[range_val]:
+            range_val = _stored_range(series)
+        return _chart_url(symbol, series.interval, range_val), range_val
+    return _chart_since_url(symbol, series.interval, series.last_time()), None
+
+def _chart_fresh(series, interval):
+    return series.rows and series.age() <= upstream_cache.ttl_for("chart") and _deep_enough(series, interval)
+
+def _chart_gmtoffset(data_json):
+    try:
+        return int(data_json["chart"]["result"][0]["meta"].get("gmtoffset") or 0)
+    except (KeyError, TypeError, IndexError, ValueError):
+        return 0
+
+def _store_chart(series, data_json, range_val):
+    # range_val: rango de una descarga completa (None si es incremental)
+    bars = parse_chart(data_json)
+    gmtoffset = _chart_gmtoffset(data_json)
+    if range_val:
+        if not len(bars["time"]):
+            raise ValueError("No valid data found")
+        series.replace(bars, range=range_val, gmtoffset=gmtoffset)
     else:
-        rs = avg_gain / avg_loss
-        rsi[period] = 100 - (100 / (1 + rs))
-        
-    # Smoothed Average
-    for i in range(period + 1, len(prices)):
-        delta = deltas[i-1]
-        gain = delta if delta > 0 else 0
-        loss = abs(delta) if delta < 0 else 0
-        
-        avg_gain = (avg_gain * (period - 1) + gain) / period
-        avg_loss = (avg_loss * (period - 1) + loss) / period
-        
-        if avg_loss == 0:
-            rsi[i] = 100
-        else:
-            rs = avg_gain / avg_loss
-            rsi[i] = 100 - (100 / (1 + rs))
-            
-    return rsi
+        series.merge(bars, gmtoffset=gmtoffset)
 
-def calculate_std_dev(prices, period, sma_values):
-    if len(prices) < period:
-        return [None] * len(prices)
-    std_devs = [None] * len(prices)
-    for i in range(period - 1, len(prices)):
-        window = prices[i - period + 1 : i + 1]
-        mean = sma_values[i]
-        if mean is None: 
-            continue
-        variance = sum([(p - mean) ** 2 for p in window]) / period
-        std_devs[i] = variance ** 0.5
-    return std_devs
+def _chart_window(series, interval):
+    bars = series.read()
+    if interval in RESAMPLED:
+        bars = resample.resample(bars, RESAMPLED[interval], series.meta.get("gmtoffset", 0))
+    return bar_store.window(bars, RANGE_SECONDS[chart_range(interval)])
 
-def analyze_symbol(symbol, interval="1d"):
-    print(f"--- API Fetch: {symbol} [Interval: {interval}] ---")
-    result = {"symbol": symbol, "status": "error", "data": None, "signal": "N/A"}
-    
+def _chart_lease(series):
+    # Con varios workers solo uno descarga cada serie; el resto espera y, al
+    # entrar, la encuentra ya fresca (meta.json la actualiza el que descargo)
+    if shared_store is None:
+        return contextlib.nullcontext()
+    return shared_store.exclusive("chart", (series.symbol, series.interval))
+
+def _achart_lease(series):
+    if shared_store is None:
+        return contextlib.nullcontext()
+    return shared_store.aexclusive("chart", (series.symbol, series.interval))
+
+def _stale_chart(series, interval):
+    series.sync_meta()
+    return not _chart_fresh(series, interval)
+
+# --- Velas intradia (intraday_store, en memoria) ---
+#
+# Mismo esquema que las diarias: descarga completa del rango de Yahoo para el
+# intervalo y, despues, solo las velas desde la ultima del buffer. Cada worker
+# tiene su propio buffer (no pasan por el almacen compartido).
+
+def _intraday_plan(ring, symbol, interval):
+    if not ring.rows or ring.full_age() > FULL_REFRESH_AGE:
+        return _chart_url(symbol, interval, INTRADAY[interval][1]), True
+    return _chart_since_url(symbol, interval, ring.last_time()), False
+
+def _intraday_stale(ring):
+    return not ring.rows or ring.age() > upstream_cache.ttl_for("chart")
+
+def _store_intraday(ring, data_json, full):
+    bars = parse_chart(data_json)
+    if full:
+        if not len(bars["time"]):
+            raise ValueError("No valid data found")
+        ring.replace(bars)
+    else:
+        ring.append(bars)
+
+def load_intraday(symbol, interval):
+    ring = intraday_store.get(symbol, interval)
+    if _intraday_stale(ring):
+        url, full = _intraday_plan(ring, symbol, interval)
+        try:
+            _store_intraday(ring, _get_json(url, CHART_TIMEOUT), full)
+        except Exception as e:
+            if not ring.rows:
+                raise
+            print(f"Intraday refresh failed, using buffered bars: {e}")
+    return ring.view()
+
+async def load_intraday_async(symbol, interval):
+    ring = intraday_store.get(symbol, interval)
+    if _intraday_stale(ring):
+        url, full = _intraday_plan(ring, symbol, interval)
+        try:
+            _store_intraday(ring, await _aget_json(url, CHART_TIMEOUT), full)
+        except Exception as e:
+            if not ring.rows:
+                raise
+            print(f"Intraday refresh failed, using buffered bars: {e!r}")
+    return ring.view()
+
+def load_bars(symbol, interval):
+    if interval in INTRADAY:
+        return load_intraday(symbol, interval)
+    series = bar_store.get_series(symbol, _stored_interval(interval))
+    if _stale_chart(series, interval):
+        with _chart_lease(series):
+            if _stale_chart(series, interval):
+                url, range_val = _chart_plan(series, symbol, interval)
+                try:
+                    _store_chart(series, _get_json(url, CHART_TIMEOUT), range_val)
+                except Exception as e:
+                    # Sin red (o Yahoo caido): se sirve la historia guardada si existe
+                    if not series.rows:
+                        raise
+                    print(f"Chart refresh failed, using stored bars: {e}")
+    return _chart_window(series, interval)
+
+async def load_bars_async(symbol, interval):
+    if interval in INTRADAY:
+        return await load_intraday_async(symbol, interval)
+    series = bar_store.get_series(symbol, _stored_interval(interval))
+    if _stale_chart(series, interval):
+        async with _achart_lease(series):
+            if _stale_chart(series, interval):
+                url, range_val = _chart_plan(series, symbol, interval)
+                try:
+                    _store_chart(series, await _aget_json(url, CHART_TIMEOUT), range_val)
+                except Exception as e:
+                    if not series.rows:
+                        raise
+                    print(f"Chart refresh failed, using stored bars: {e!r}")
+    return _chart_window(series, interval)
+
+def fetch_info(symbol):
+    def fetch():
+        with throttle.scheduler.slot("yfinance"), metrics.upstream("yfinance_info"):
+            return _ticker(symbol).info
+    return upstream_cache.get_or_fetch("info", (symbol, None), fetch)
+
+def fetch_financials(symbol):
+    def fetch():
+        with throttle.scheduler.slot("yfinance"), metrics.upstream("yfinance_financials"):
+            ticker = _ticker(symbol)
+            return ticker.balance_sheet, ticker.income_stmt
+    return upstream_cache.get_or_fetch("financials", (symbol, None), fetch)
+
+def fetch_recommendations(symbol):
+    url = _recommendations_url(symbol)
+    return upstream_cache.get_or_fetch(
+        "recommendations", (symbol, None),
+        lambda: _parse_recommendations(_get_json(url, EXTRA_TIMEOUT)))
+
+def fetch_news(symbol):
+    url = _news_url(symbol)
+    return upstream_cache.get_or_fetch(
+        "news", (symbol, None),
+        lambda: _parse_news(_get_json(url, EXTRA_TIMEOUT)))
+
+async def fetch_recommendations_async(symbol):
+    url = _recommendations_url(symbol)
+    async def fetch():
+        return _parse_recommendations(await _aget_json(url, EXTRA_TIMEOUT))
+    return await upstream_cache.aget_or_fetch("recommendations", (symbol, None), fetch)
+
+async def fetch_news_async(symbol):
+    url = _news_url(symbol)
+    async def fetch():
+        return _parse_news(await _aget_json(url, EXTRA_TIMEOUT))
+    return await upstream_cache.aget_or_fetch("news", (symbol, None), fetch)
+
+# Ventana de analisis (segundos) de cada rango de Yahoo
+RANGE_SECONDS = {"2y": 2 * 365 * 86400, "5y": 5 * 365 * 86400, "10y": 10 * 365 * 86400}
+
+def chart_range(interval):
     # Determinar rango adecuado según el intervalo para asegurar suficientes datos para EMA 200
     range_val = "2y" # Default para 1d
     if interval == "1wk":
         range_val = "5y"
     elif interval == "1mo":
         range_val = "10y"
-    
-    # URL directa a la API de Yahoo Finance (JSON)
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range={range_val}&interval={interval}"
-    
+    return range_val
+
+# --- Fundamentales ---
+#
+# Fuente principal: un solo quoteSummary (JSON, sin pandas). yfinance (y con el
+# pandas) solo se importa si ese JSON no trae los estados financieros completos
+# (Yahoo a veces omite el patrimonio neto) o con FUNDAMENTALS_SOURCE=yfinance.
+# Ambas fuentes se reducen a lo mismo: un dict tipo ticker.info y una lista de
+# (fecha, beneficio neto, patrimonio) por informe anual.
+
+FUNDAMENTALS_SOURCE = os.environ.get("FUNDAMENTALS_SOURCE", "quoteSummary")
+SUMMARY_MODULES = "incomeStatementHistory,balanceSheetHistory,defaultKeyStatistics,financialData"
+
+def _summary_url(symbol):
+    return f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}?modules={SUMMARY_MODULES}"
+
+def _raw(value):
+    # {"raw": 1.5, "fmt": "1.50"} -> 1.5; los campos vacios de Yahoo ({}) -> None
+    if isinstance(value, dict):
+        return value.get("raw")
+    return value
+
+def parse_summary(data_json):
     try:
-        # Usar curl_cffi para imitar Chrome y evitar bloqueos (incluso sin proxy en la nube ayuda)
-        session = cffi_requests.Session(impersonate="chrome")
-        session.verify = False 
-        
-        # --- 1. Fetch Fundamentals History (Graham/Lynch) via yfinance ---
-        fundamentals = []
+        block = data_json["quoteSummary"]["result"][0]
+    except (KeyError, TypeError, IndexError):
+        raise ValueError("Invalid data format from API")
+    info = {}
+    for module in ("defaultKeyStatistics", "financialData"):
+        for key, value in (block.get(module) or {}).items():
+            value = _raw(value)
+            if value is not None and not isinstance(value, (dict, list)):
+                info[key] = value
+    incomes = (block.get("incomeStatementHistory") or {}).get("incomeStatementHistory") or []
+    balance = block.get("balanceSheetHistory") or {}
+    sheets = balance.get("balanceSheetStatements") or balance.get("balanceSheetHistory") or []
+    net_income = {_raw(row.get("endDate")): _raw(row.get("netIncome")) for row in incomes}
+    statements = []
+    for row in sheets:
+        date_ts = _raw(row.get("endDate"))
+        if date_ts is None:
+            continue
+        statements.append((int(date_ts), net_income.get(date_ts), _raw(row.get("totalStockholderEquity"))))
+    return {"info": info, "statements": statements}
+
+def _complete(summary):
+    return any(ni is not None and eq is not None for _, ni, eq in summary["statements"])
+
+def fetch_summary(symbol):
+    url = _summary_url(symbol)
+    return upstream_cache.get_or_fetch("summary", (symbol, None), lambda: parse_summary(_get_json(url, EXTRA_TIMEOUT)))
+
+def _yfinance_summary(symbol):
+    # Misma forma que parse_summary a partir de ticker.info y los DataFrames anuales
+    try:
+        info = fetch_info(symbol)
+    except Exception as e:
+        print(f"yfinance info error ({symbol}): {e!r}")
+        info = {}
+    # Si fallan los estados financieros se lanza la excepcion
+    bs, inc = fetch_financials(symbol)
+    statements = []
+    for d in bs.columns:
         try:
-            # Use yfinance only for fundamentals as it handles cookies/crumbs automatically
-            ticker = yf.Ticker(symbol)
-            
-            # Fast info avoids full scrape sometimes
-            shares_out = 0
-            growth_rate = 0.15 # Default Conservative
-            
-            try:
-                info = ticker.info
-                shares_out = info.get("sharesOutstanding") or info.get("impliedSharesOutstanding")
-                
-                # Fetch Growth for Lynch Formula (Dynamic valuation)
-                g = info.get("earningsGrowth", None)
-                if g is None or g == 0:
-                     g = info.get("revenueGrowth", 0.15)
-                growth_rate = g
-            except:
-                pass
-
-            if not shares_out:
-                shares_out = 1000000 
-            
-            # Lynch Multiplier: "P/E should equal Growth Rate". 
-            # If Growth is 30%, Fair PE is 30.
-            # We cap it between 15 (Defensive floor) and 65 (Hyper-growth ceiling) to avoid outliers.
-            lynch_multiplier = max(15, min(growth_rate * 100, 65))
-            
-            # Financials (Annual)
-            bs = ticker.balance_sheet
-            inc = ticker.income_stmt
-            
-            if not bs.empty:
-                # Iterate over columns (dates)
-                for d in bs.columns:
-                    try:
-                        # Net Income search
-                        ni = 0
-                        if not inc.empty:
-                             # Try to match nearest date column in income stmt if not exact match?
-                             # Usually annual reports match dates.
-                             if d in inc.columns:
-                                 col_inc = inc[d]
-                                 if "Net Income" in col_inc: ni = col_inc["Net Income"]
-                                 elif "Net Income Common Stockholders" in col_inc: ni = col_inc["Net Income Common Stockholders"]
-                        
-                        # Equity search
-                        eq = 0
-                        col_bs = bs[d]
-                        if "Stockholders Equity" in col_bs: eq = col_bs["Stockholders Equity"]
-                        elif "Total Stockholder Equity" in col_bs: eq = col_bs["Total Stockholder Equity"]
-                        
-                        if pd.isna(ni): ni = 0
-                        if pd.isna(eq): eq = 0
-                        
-                        eps = ni / shares_out
-                        bvps = eq / shares_out
-                        
-                        graham_classic = 0
-                        if eps > 0 and bvps > 0:
-                            graham_classic = (22.5 * eps * bvps) ** 0.5
-                            
-                        # Buffett Floor (Modernized Safety for Growth Stocks)
-                        # If the company is High Growth (Lynch > 25x), we respect Earnings Power (EPS * 20) as floor.
-                        # Otherwise, we stick to strict Tangible Assets (Graham Classic).
-                        buffett_floor = eps * 20 if eps > 0 else 0
-                        graham = max(graham_classic, buffett_floor) if lynch_multiplier > 25 else graham_classic
-                            
-                        # Lynch Improved
-                        lynch = eps * lynch_multiplier if eps > 0 else 0
-                        
-                        # Burry "Bubble" Line (3x Fair Value)
-                        burry = lynch * 3 if lynch > 0 else 0
-                        
-                        fundamentals.append({
-                            "date_ts": int(d.timestamp()),
-                            "graham": float(graham),
-                            "lynch": float(lynch),
-                            "burry": float(burry)
-                        })
-                    except Exception as e_row:
-                        continue
-                
-                fundamentals.sort(key=lambda x: x["date_ts"])
-                print(f"Fundamentals Loaded: {len(fundamentals)} snapshots (Growth Multiplier: {lynch_multiplier:.1f}x)")
-                
-        except Exception as e_fund:
-            print(f"Fundamentals Error: {e_fund}")
-
-        print(f"Fetching {url}...")
-        resp = session.get(url, timeout=10)
-        
-        if resp.status_code != 200:
-            result["detail"] = f"HTTP Error {resp.status_code}"
-            return result
-            
-        data_json = resp.json()
-        
-        # Parsear la estructura de Yahoo
+            ni = None
+            if not inc.empty and d in inc.columns:
+                # Usually annual reports match dates.
+                col_inc = inc[d]
+                if "Net Income" in col_inc: ni = col_inc["Net Income"]
+                elif "Net Income Common Stockholders" in col_inc: ni = col_inc["Net Income Common Stockholders"]
+            eq = None
+            col_bs = bs[d]
+            if "Stockholders Equity" in col_bs: eq = col_bs["Stockholders Equity"]
+            elif "Total Stockholder Equity" in col_bs: eq = col_bs["Total Stockholder Equity"]
+            statements.append((int(d.timestamp()), ni, eq))
+        except Exception as e_row:
+            continue
+    return {"info": info, "statements": statements}
+
+def _number_or_zero(value):
+    # None y NaN (celdas vacias de pandas) -> 0
+    return 0 if value is None or value != value else value
+
+def scrape_fundamentals(symbol):
+    # Lento (descarga de estados financieros): solo lo llama fundamentals_store
+    # al refrescar. Si fallan los estados financieros se lanza la excepcion para
+    # no guardar un snapshot vacio por un error transitorio.
+    summary = None
+    if FUNDAMENTALS_SOURCE != "yfinance":
         try:
-            result_block = data_json["chart"]["result"][0]
-            timestamps = result_block["timestamp"]
-            quotes = result_block["indicators"]["quote"][0]
-            closes = quotes["close"]
-            opens = quotes.get("open", closes)
-            highs = quotes.get("high", closes)
-            lows = quotes.get("low", closes)
-            volumes = quotes.get("volume", [0] * len(closes))
-        except (KeyError, TypeError, IndexError):
-            result["detail"] = "Invalid data format from API"
-            return result
-            
-        # Filtrar Nones (días sin trading)
-        clean_data = []
-        for i in range(len(timestamps)):
-            c = closes[i]
-            if c is not None:
-                # Use closes for missing fields if necessary (fallback)
-                o = opens[i] if opens[i] is not None else c
-                h = highs[i] if highs[i] is not None else c
-                l = lows[i] if lows[i] is not None else c
-                clean_data.append({
-                    "time": timestamps[i],
-                    "open": o,
-                    "high": h,
-                    "low": l,
-                    "close": c,
-                    "volume": volumes[i] if volumes[i] is not None else 0
+            summary = fetch_summary(symbol)
+        except Exception as e:
+            print(f"quoteSummary fundamentals error ({symbol}): {e!r}")
+        if summary is not None and not _complete(summary):
+            print(f"quoteSummary without financial statements ({symbol}), falling back to yfinance")
+            summary = None
+    if summary is None:
+        summary = _yfinance_summary(symbol)
+    return fundamentals_snapshot(summary)
+
+def fundamentals_snapshot(summary):
+    # --- Fundamentals History (Graham/Lynch) ---
+    info, statements = summary["info"], summary["statements"]
+    fundamentals = []
+    shares_out = 0
+    growth_rate = 0.15 # Default Conservative
+
+    try:
+        shares_out = info.get("sharesOutstanding") or info.get("impliedSharesOutstanding")
+
+        # Fetch Growth for Lynch Formula (Dynamic valuation)
+        g = info.get("earningsGrowth", None)
+        if g is None or g == 0:
+             g = info.get("revenueGrowth", 0.15)
+        growth_rate = g
+    except (AttributeError, TypeError):
+        pass
+
+    if not shares_out:
+        shares_out = 1000000 
+
+    # Lynch Multiplier: "P/E should equal Growth Rate". 
+    # If Growth is 30%, Fair PE is 30.
+    # We cap it between 15 (Defensive floor) and 65 (Hyper-growth ceiling) to avoid outliers.
+    lynch_multiplier = max(15, min(growth_rate * 100, 65))
+
+    if statements:
+        for date_ts, ni, eq in statements:
+            try:
+                ni = _number_or_zero(ni)
+                eq = _number_or_zero(eq)
+
+                eps = ni / shares_out
+                bvps = eq / shares_out
+
+                graham_classic = 0
+                if eps > 0 and bvps > 0:
+                    graham_classic = (22.5 * eps * bvps) ** 0.5
+
+                # Buffett Floor (Modernized Safety for Growth Stocks)
+                # If the company is High Growth (Lynch > 25x), we respect Earnings Power (EPS * 20) as floor.
+                # Otherwise, we stick to strict Tangible Assets (Graham Classic).
+                buffett_floor = eps * 20 if eps > 0 else 0
+                graham = max(graham_classic, buffett_floor) if lynch_multiplier > 25 else graham_classic
+
+                # Lynch Improved
+                lynch = eps * lynch_multiplier if eps > 0 else 0
+
+                # Burry "Bubble" Line (3x Fair Value)
+                burry = lynch * 3 if lynch > 0 else 0
+
+                fundamentals.append({
+                    "date_ts": date_ts,
+                    "graham": float(graham),
+                    "lynch": float(lynch),
+                    "burry": float(burry)
                 })
-                
-        if not clean_data:
+            except Exception as e_row:
+                continue
+
+        fundamentals.sort(key=lambda x: x["date_ts"])
+        print(f"Fundamentals Loaded: {len(fundamentals)} snapshots (Growth Multiplier: {lynch_multiplier:.1f}x)")
+
+    return {
+        "fundamentals": fundamentals,
+        "lynch_multiplier": float(lynch_multiplier),
+        "buffett_certified": buffett_quality(info),
+    }
+
+def fetch_report_date(symbol):
+    # Fecha del ultimo cierre fiscal anual (barato: un quoteSummary). Si cambia,
+    # hay un informe nuevo y el snapshot de fundamentales se recalcula.
+    data = _get_json(f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}?modules=defaultKeyStatistics", EXTRA_TIMEOUT)
+    try:
+        stats = data["quoteSummary"]["result"][0]["defaultKeyStatistics"]
+        return stats["lastFiscalYearEnd"]["raw"]
+    except (KeyError, TypeError, IndexError):
+        return None
+
+def buffett_quality(info):
+    # --- CÁLCULO BUFFETT (Calidad) ---
+    buffett_certified = False
+    try:
+        roe = info.get("returnOnEquity", 0)
+        debt_eq = info.get("debtToEquity", 0)
+
+        # ROE > 15% (0.15) and Debt < 200% (2.0 ratio)
+        # Handle None values
+        if roe is None: roe = 0
+        if debt_eq is None: debt_eq = 0
+
+        if roe > 0.15 and debt_eq < 200: 
+            buffett_certified = True
+    except (AttributeError, TypeError):
+        pass
+    return buffett_certified
+
+# Snapshots de fundamentales persistidos; se refrescan en segundo plano
+fundamentals_store = FundamentalsStore(scrape_fundamentals, fetch_report_date)
+
+def load_fundamentals_and_quality(symbol):
+    # Sin esperas salvo la primera vez que se ve un simbolo
+    snapshot = fundamentals_store.get(symbol)
+    return snapshot["fundamentals"], snapshot["buffett_certified"]
+
+# Velas proyectadas al final del historial
+PROJECTION_DAYS = 5
+
+def projection_step(interval):
+    # Separacion entre velas proyectadas: una vela intradia o un dia
+    return INTRADAY[interval][0] if interval in INTRADAY else 86400
+
+def fundamentals_columns(times, fundamentals):
+    # graham_number / lynch_line / burry_line por vela (fundamentals ordenado por date_ts)
+    n = len(times)
+    if not fundamentals:
+        return {"graham_number": [None] * n, "lynch_line": [None] * n, "burry_line": [None] * n}
+    dates = np.array([f["date_ts"] for f in fundamentals], dtype=np.int64)
+    # idx == -1 (antes del primer informe) cae en el None final
+    idx = (np.searchsorted(dates, times, side="right") - 1).tolist()
+    columns = {}
+    for field, key in (("graham_number", "graham"), ("lynch_line", "lynch"), ("burry_line", "burry")):
+        values = [f.get(key) for f in fundamentals] + [None]
+        columns[field] = [values[i] for i in idx]
+    return columns
+
+def signal_column(closes, rsi_vals, upper_band, lower_band):
+    # BUY: RSI < 40 y precio en la banda inferior; SELL: RSI > 60 y precio en la superior (margen 2%)
+    buy, sell = indicators.signal_masks(closes, rsi_vals, upper_band, lower_band)
+    signal = np.full(len(buy), None, dtype=object)
+    signal[buy] = "BUY"
+    signal[sell] = "SELL"
+    return signal.tolist()
+
+def _error_result(symbol, detail):
+    return {"symbol": symbol, "status": "error", "data": None, "signal": "N/A", "detail": detail}
+
+def assemble_history(bars, series, fundamentals, columns=None, step=86400):
+    # Historial por columnas: velas + indicadores pedidos + fundamentales vigentes + señal + proyección
+    # (formats.py lo convierte a filas o al formato columnar compacto)
+    times = bars["time"].tolist()
+    prices = bars["close"].tolist()
+    if columns is None:
+        columns = indicators.spec_columns(DEFAULT_INDICATORS, internal=False)
+    sma_20 = series["sma_20"]
+    upper_band = series["upper_band"]
+    lower_band = series["lower_band"]
+
+    history = {
+        "time": times,
+        "open": bars["open"].tolist(),
+        "high": bars["high"].tolist(),
+        "low": bars["low"].tolist(),
+        "close": prices,
+        "volume": bars["volume"].tolist(),
+    }
+    for column in columns:
+        history[column] = series[column]
+
+    # Fundamentales vigentes en cada vela: el snapshot más reciente anterior a t
+    history.update(fundamentals_columns(bars["time"], fundamentals))
+
+    # Determinar señal combinada (RSI + Bollinger)
+    # Compra fuerte: RSI < 40 Y Precio toca banda inferior
+    # Venta fuerte: RSI > 60 Y Precio toca banda superior
+    history["signal"] = signal_column(bars["close"], series["rsi"], upper_band, lower_band)
+
+    # --- PROYECCIÓN A FUTURO (5 Días) ---
+    # Proyectamos las bandas para visualizar posibles movimientos
+    last_time = times[-1]
+
+    # Calcular pendiente de la media (Tendencia de corto plazo)
+    slope_sma = 0
+    if sma_20[-1] and sma_20[-5]:
+        slope_sma = (sma_20[-1] - sma_20[-5]) / 5
+
+    # Calcular ancho actual de bandas (Volatilidad)
+    last_width = 0
+    if upper_band[-1] and lower_band[-1]:
+        last_width = upper_band[-1] - lower_band[-1]
+
+    last_sma_val = sma_20[-1] if sma_20[-1] else prices[-1]
+
+    # Últimos valores fundamentales conocidos (se mantienen en la proyección)
+    last_values = {field: history[field][-1] for field in ("graham_number", "lynch_line", "burry_line")}
+
+    # Generar 5 puntos futuros ("fantasma", solo con indicadores)
+    projection = {field: [] for field in history}
+    for i in range(1, PROJECTION_DAYS + 1):
+        # Proyección lineal simple
+        proj_sma = last_sma_val + (slope_sma * i)
+        values = dict(last_values)
+        values["time"] = last_time + (i * step) # +1 día (o vela intradía) en segundos
+        values["volume"] = 0
+        values["upper_band"] = proj_sma + (last_width / 2)
+        values["lower_band"] = proj_sma - (last_width / 2)
+        # Podríamos proyectar también sma_50/ema_200, pero dejemos solo bandas por hoy
+        for field, column in projection.items():
+            column.append(values.get(field))
+    for field, values in projection.items():
+        history[field] = history[field] + values
+    history["projections"] = PROJECTION_DAYS
+    return history
+
+def apply_trade_setup(result, prices, series, last_lynch, buffett_certified):
+    # Trade setup, Buffett/Burry y señal final a partir de la última vela
+    rsi_vals = series["rsi"]
+    sma_50 = series["sma_50"]
+    upper_band = series["upper_band"]
+    lower_band = series["lower_band"]
+
+    result["rsi"] = rsi_vals[-1]
+    result["sma_50"] = sma_50[-1]
+    if "ema_200" in series:
+        result["ema_200"] = series["ema_200"][-1] if series["ema_200"][-1] else 0
+    result["upper_band"] = upper_band[-1]
+
+    # --- Lógica Avanzada de Precios Objetivo (Trade Setup) ---
+    current_price = prices[-1]
+
+    trend = "NEUTRAL"
+    if sma_50[-1]:
+        if current_price > sma_50[-1]:
+            trend = "BULLISH" # Alcista
+        else:
+            trend = "BEARISH" # Bajista
+
+    # Definir niveles clave
+    curr_lower = lower_band[-1] if lower_band[-1] else current_price * 0.95
+    curr_upper = upper_band[-1] if upper_band[-1] else current_price * 1.05
+    curr_sma50 = sma_50[-1] if sma_50[-1] else current_price
+
+    target_entry = 0.0
+    stop_loss = 0.0
+    take_profit = 0.0
+    recommendation = ""
+    analysis_text = ""
+
+    if trend == "BULLISH":
+        # En tendencia alcista, buscamos comprar en retrocesos (Soportes: SMA50 o Banda Inferior)
+        # El mejor soporte dinámico suele ser la SMA50 o la Banda Inferior, lo que esté más cerca por debajo.
+        support_level = max(curr_sma50, curr_lower)
+
+        if current_price <= support_level * 1.02: # Estamos cerca del soporte
+           target_entry = current_price # Entrar YA
+           recommendation = "COMPRAR AHORA"
+           analysis_text = f"✅ **ACTUALIDAD:** TENDENCIA ALCISTA SÓLIDA.\n\nEl precio está rebotando en una zona clave (cerca de ${support_level:.2f}). Es el momento ideal para subirte a la tendencia."
+        else:
+           target_entry = support_level # Esperar retroceso
+           recommendation = "ESPERAR RETROCESO"
+           analysis_text = f"⏳ **ACTUALIDAD:** ALCISTA PERO EXTENDIDA.\n\nLa acción es fuerte, pero ${current_price:.2f} es un poco caro para entrar ya. \n\n👉 **LA JUGADA:** Ten paciencia. Pon una orden de compra en **${target_entry:.2f}** (tu 'suelo' de seguridad). Si el precio cae ahí, compras barato."
+
+        stop_loss = target_entry * 0.96 # 4% de riesgo
+        take_profit = curr_upper # Vender en el techo (Banda Superior)
+
+    else: # BEARISH
+        # En tendencia bajista, comprar es riesgoso (Contra-tendencia / Rebote)
+        if current_price <= curr_lower * 1.01: # Toca banda inferior
+             target_entry = current_price
+             recommendation = "REBOTE RIESGOSO"
+             analysis_text = f"⚠️ **ACTUALIDAD:** TENDENCIA BAJISTA.\n\nEl precio ha caído mucho y ha tocado el suelo estadístico (${curr_lower:.2f}). Podría haber un rebote rápido ('Gato Muerto'). \n\n👉 **SOLO PARA VALIENTES:** Compra buscando un rebote corto."
+
+             stop_loss = current_price * 0.97
+             take_profit = curr_sma50 # El techo suele ser la media
+        else:
+             target_entry = curr_lower
+             recommendation = "NO TOCAR / VENTA"
+             analysis_text = f"⛔ **ACTUALIDAD:** TENDENCIA BAJISTA.\n\nEl precio sigue cayendo ($309) y está lejos de tocar fondo. \n\n👉 **CONSEJO:** No intentes adivinar el piso. Si tienes acciones, considera salir en rebotes. Si quieres comprar, espera a que toque **${target_entry:.2f}**."
+
+             stop_loss = target_entry * 0.95
+             take_profit = curr_sma50
+
+    # Formateo final
+    result["trade_setup"] = {
+        "recommendation": recommendation,
+        "target_entry": target_entry,
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "analysis": analysis_text
+    }
+
+    # --- CÁLCULO BUFFETT (Calidad) ---
+    result["buffett_certified"] = buffett_certified
+
+    # --- CÁLCULO BURRY (Riesgo Extremo) ---
+    last_lynch = last_lynch or 0
+    burry_risk = False
+    if last_lynch > 0 and current_price > (last_lynch * 3):
+        burry_risk = True
+    result["burry_risk"] = burry_risk
+
+    # Mantener compatibilidad con frontend anterior por si acaso
+    result["strategy_buy"] = analysis_text
+    result["strategy_sell"] = f"Meta de Salida: ${take_profit:.2f} | Stop Loss: ${stop_loss:.2f}"
+
+    # Señal Visual Simplificada Final
+    if "COMPRAR" in recommendation or recommendation == "REBOTE RIESGOSO":
+        result["signal"] = "COMPRA"
+    elif "VENTA" in recommendation:
+        result["signal"] = "VENTA"
+    else:
+        result["signal"] = "ESPERA" # Nueva señal neutral activa
+    return result
+
+# La señal y el trade setup necesitan estos aunque no se pidan (no se envian)
+ANALYSIS_INDICATORS = ("rsi14", "sma50", "bb20")
+
+def build_analysis(symbol, interval, bars, fundamentals, buffett_certified, indicator_specs=None):
+    # Parte de calculo (sin red): indicadores, historial, trade setup.
+    # indicator_specs: indicadores del historial (indicators.parse_specs); por defecto los de siempre
+    result = {"symbol": symbol, "interval": interval, "status": "error", "data": None, "signal": "N/A"}
+    
+    try:
+        if not len(bars["time"]):
             result["detail"] = "No valid data found"
             return result
             
-        # Separar para calculos
-        times = [x["time"] for x in clean_data]
-        prices = [x["close"] for x in clean_data]
-        
-        # Calcular Indicadores (Pure Python)
-        rsi_vals = calculate_rsi(prices)
-        sma_50 = calculate_sma(prices, 50)
-        ema_200 = calculate_ema(prices, 200)
-        # Bollinger Bands (20 periods, 2 std dev)
-        sma_20 = calculate_sma(prices, 20)
-        std_devs = calculate_std_dev(prices, 20, sma_20)
-        
-        upper_band = []
-        lower_band = []
-        for i in range(len(prices)):
-            if sma_20[i] is not None and std_devs[i] is not None:
-                upper_band.append(sma_20[i] + (2 * std_devs[i]))
-                lower_band.append(sma_20[i] - (2 * std_devs[i]))
-            else:
-                upper_band.append(None)
-                lower_band.append(None)
+        times = bars["time"].tolist()
+        prices = bars["close"].tolist()
         
-        # Construir historial completo (1 año) para el gráfico
-        history = []
+        # Calcular Indicadores (vectorizado en frio, incremental en modo live)
+        requested = indicator_specs or DEFAULT_INDICATORS
+        specs = requested + tuple(s for s in ANALYSIS_INDICATORS if s not in requested)
+        with metrics.span("indicators"):
+            series = live_indicator_series(symbol, interval, times, prices, specs)
         
-        # Cache de fundamentales para optimizar el bucle
-        current_fund_idx = -1
-        
-        for i in range(len(prices)):
-            # Determinar fundamentales vigentes
-            t_val = times[i]
-            
-            # Buscar el snapshot más reciente anterior a t_val
-            # Como fundamentals está ordenado, podemos avanzar el índice
-            # hasta que el SIGUIENTE sea mayor que t_val.
-            
-            curr_graham = None
-            curr_lynch = None
-            curr_burry = None
-            
-            if fundamentals:
-                # Avanzar puntero mientras el siguiente reporte sea del pasado/presente
-                while current_fund_idx + 1 < len(fundamentals) and fundamentals[current_fund_idx + 1]["date_ts"] <= t_val:
-                    current_fund_idx += 1
-                
-                if current_fund_idx >= 0:
-                    curr_graham = fundamentals[current_fund_idx]["graham"]
-                    curr_lynch = fundamentals[current_fund_idx]["lynch"]
-                    curr_burry = fundamentals[current_fund_idx].get("burry")
-
-            rec = {
-                "time": time.strftime('%Y-%m-%d', time.localtime(times[i])),
-                "open": clean_data[i]["open"],
-                "high": clean_data[i]["high"],
-                "low": clean_data[i]["low"],
-                "close": clean_data[i]["close"],
-                "volume": clean_data[i]["volume"],
-                "rsi": rsi_vals[i],
-                "sma_50": sma_50[i],
-                "ema_200": ema_200[i],
-                "upper_band": upper_band[i],
-                "lower_band": lower_band[i],
-                "graham_number": curr_graham,
-                "lynch_line": curr_lynch,
-                "burry_line": curr_burry,
-                "signal": None
-            }
-            
-            # Determinar señal combinada (RSI + Bollinger)
-            # Compra fuerte: RSI < 40 Y Precio toca banda inferior
-            # Venta fuerte: RSI > 60 Y Precio toca banda superior
-            price = prices[i]
-            if rsi_vals[i] is not None and upper_band[i] is not None:
-                if rsi_vals[i] < 40 and price <= lower_band[i] * 1.02: # Margen del 2%
-                    rec["signal"] = "BUY"
-                elif rsi_vals[i] > 60 and price >= upper_band[i] * 0.98: # Margen del 2%
-                    rec["signal"] = "SELL"
-            
-            history.append(rec)
-
-        # --- PROYECCIÓN A FUTURO (5 Días) ---
-        # Proyectamos las bandas para visualizar posibles movimientos
-        last_time = times[-1]
-        
-        # Calcular pendiente de la media (Tendencia de corto plazo)
-        slope_sma = 0
-        if sma_20[-1] and sma_20[-5]:
-            slope_sma = (sma_20[-1] - sma_20[-5]) / 5
-            
-        # Calcular ancho actual de bandas (Volatilidad)
-        last_width = 0
-        if upper_band[-1] and lower_band[-1]:
-            last_width = upper_band[-1] - lower_band[-1]
-            
-        last_sma_val = sma_20[-1] if sma_20[-1] else prices[-1]
-        
-        # Últimos valores fundamentales conocidos
-        last_graham = history[-1].get("graham_number")
-        last_lynch = history[-1].get("lynch_line")
-        last_burry = history[-1].get("burry_line")
-
-        # Generar 5 puntos futuros
-        for i in range(1, 6):
-            future_time = last_time + (i * 86400) # +1 día en segundos
-            
-            # Proyección lineal simple
-            proj_sma = last_sma_val + (slope_sma * i)
-            proj_upper = proj_sma + (last_width / 2)
-            proj_lower = proj_sma - (last_width / 2)
-            
-            # Formato de fecha
-            date_str = time.strftime('%Y-%m-%d', time.localtime(future_time))
-            
-            # Añadir entry "fantasma" solo con indicadores
-            history.append({
-                "time": date_str,
-                "open": None,
-                "high": None,
-                "low": None,
-                "close": None,
-                "volume": 0,
-                "rsi": None,
-                "sma_50": None, # Podríamos proyectar también, pero dejemos solo bandas por hoy
-                "ema_200": None,
-                "upper_band": proj_upper,
-                "lower_band": proj_lower,
-                "graham_number": last_graham,
-                "lynch_line": last_lynch,
-                "burry_line": last_burry,
-                "signal": None,
-                "is_projection": True # Flag para frontend
-            })
-
+        # Historial completo para el gráfico, por columnas (solo lo pedido)
+        with metrics.span("history"):
+            history = assemble_history(bars, series, fundamentals, indicators.spec_columns(requested, internal=False),
+                                       projection_step(interval))
         result["history"] = history
         result["current_price"] = prices[-1]
         
-        latest_rsi = rsi_vals[-1]
-        
-        if latest_rsi is not None:
-            result["rsi"] = rsi_vals[-1]
-            result["sma_50"] = sma_50[-1]
-            result["ema_200"] = ema_200[-1] if ema_200[-1] else 0
-            result["upper_band"] = upper_band[-1]
-            
-            # --- Lógica Avanzada de Precios Objetivo (Trade Setup) ---
-            current_price = prices[-1]
-            
-            trend = "NEUTRAL"
-            if sma_50[-1]:
-                if current_price > sma_50[-1]:
-                    trend = "BULLISH" # Alcista
-                else:
-                    trend = "BEARISH" # Bajista
-
-            # Definir niveles clave
-            curr_lower = lower_band[-1] if lower_band[-1] else current_price * 0.95
-            curr_upper = upper_band[-1] if upper_band[-1] else current_price * 1.05
-            curr_sma50 = sma_50[-1] if sma_50[-1] else current_price
-
-            target_entry = 0.0
-            stop_loss = 0.0
-            take_profit = 0.0
-            recommendation = ""
-            analysis_text = ""
-
-            if trend == "BULLISH":
-                # En tendencia alcista, buscamos comprar en retrocesos (Soportes: SMA50 o Banda Inferior)
-                # El mejor soporte dinámico suele ser la SMA50 o la Banda Inferior, lo que esté más cerca por debajo.
-                support_level = max(curr_sma50, curr_lower)
-                
-                if current_price <= support_level * 1.02: # Estamos cerca del soporte
-                   target_entry = current_price # Entrar YA
-                   recommendation = "COMPRAR AHORA"
-                   analysis_text = f"✅ **ACTUALIDAD:** TENDENCIA ALCISTA SÓLIDA.\n\nEl precio está rebotando en una zona clave (cerca de ${support_level:.2f}). Es el momento ideal para subirte a la tendencia."
-                else:
-                   target_entry = support_level # Esperar retroceso
-                   recommendation = "ESPERAR RETROCESO"
-                   analysis_text = f"⏳ **ACTUALIDAD:** ALCISTA PERO EXTENDIDA.\n\nLa acción es fuerte, pero ${current_price:.2f} es un poco caro para entrar ya. \n\n👉 **LA JUGADA:** Ten paciencia. Pon una orden de compra en **${target_entry:.2f}** (tu 'suelo' de seguridad). Si el precio cae ahí, compras barato."
-
-                stop_loss = target_entry * 0.96 # 4% de riesgo
-                take_profit = curr_upper # Vender en el techo (Banda Superior)
-
-            else: # BEARISH
-                # En tendencia bajista, comprar es riesgoso (Contra-tendencia / Rebote)
-                if current_price <= curr_lower * 1.01: # Toca banda inferior
-                     target_entry = current_price
-                     recommendation = "REBOTE RIESGOSO"
-                     analysis_text = f"⚠️ **ACTUALIDAD:** TENDENCIA BAJISTA.\n\nEl precio ha caído mucho y ha tocado el suelo estadístico (${curr_lower:.2f}). Podría haber un rebote rápido ('Gato Muerto'). \n\n👉 **SOLO PARA VALIENTES:** Compra buscando un rebote corto."
-                     
-                     stop_loss = current_price * 0.97
-                     take_profit = curr_sma50 # El techo suele ser la media
-                else:
-                     target_entry = curr_lower
-                     recommendation = "NO TOCAR / VENTA"
-                     analysis_text = f"⛔ **ACTUALIDAD:** TENDENCIA BAJISTA.\n\nEl precio sigue cayendo ($309) y está lejos de tocar fondo. \n\n👉 **CONSEJO:** No intentes adivinar el piso. Si tienes acciones, considera salir en rebotes. Si quieres comprar, espera a que toque **${target_entry:.2f}**."
-                     
-                     stop_loss = target_entry * 0.95
-                     take_profit = curr_sma50
-
-            # Formateo final
-            result["trade_setup"] = {
-                "recommendation": recommendation,
-                "target_entry": target_entry,
-                "stop_loss": stop_loss,
-                "take_profit": take_profit,
-                "analysis": analysis_text
-            }
-            
-            # --- CÁLCULO BUFFETT (Calidad) ---
-            buffett_certified = False
-            try:
-                # Re-check info for quality metrics
-                t_check = yf.Ticker(symbol)
-                # Fast caching usually applies
-                info = t_check.info
-                
-                roe = info.get("returnOnEquity", 0)
-                debt_eq = info.get("debtToEquity", 0)
-                
-                # ROE > 15% (0.15) and Debt < 200% (2.0 ratio)
-                # Handle None values
-                if roe is None: roe = 0
-                if debt_eq is None: debt_eq = 0
-                
-                if roe > 0.15 and debt_eq < 200: 
-                    buffett_certified = True
-            except:
-                pass
-            result["buffett_certified"] = buffett_certified
-
-            # --- CÁLCULO BURRY (Riesgo Extremo) ---
-            last_lynch = history[-1].get("lynch_line", 0) or 0
-            burry_risk = False
-            if last_lynch > 0 and current_price > (last_lynch * 3):
-                burry_risk = True
-            result["burry_risk"] = burry_risk
-            
-            # Mantener compatibilidad con frontend anterior por si acaso
-            result["strategy_buy"] = analysis_text
-            result["strategy_sell"] = f"Meta de Salida: ${take_profit:.2f} | Stop Loss: ${stop_loss:.2f}"
-
-            # Señal Visual Simplificada Final
-            if "COMPRAR" in recommendation or recommendation == "REBOTE RIESGOSO":
-                result["signal"] = "COMPRA"
-            elif "VENTA" in recommendation:
-                result["signal"] = "VENTA"
-            else:
-                result["signal"] = "ESPERA" # Nueva señal neutral activa
-
+        if series["rsi"][-1] is not None:
+            with metrics.span("trade_setup"):
+                apply_trade_setup(result, prices, series, history["lynch_line"][-1], buffett_certified)
         else:
             result["warning"] = "Insufficient data for RSI"
             
         result["status"] = "ok"
         
+        return result
+        
+    except Exception as e:
+        print(f"Exception: {e}")
+        result["detail"] = str(e)
+        return result
+
+def _flight_key(symbol, interval, indicator_specs):
+    return (symbol, interval, ",".join(indicator_specs or DEFAULT_INDICATORS))
+
+def _analysis_ok(result):
+    # Los errores (simbolo invalido, Yahoo caido) no se comparten
+    return result.get("status") == "ok"
+
+def _shared_analysis(key, compute):
+    # Entre procesos: un analisis reciente de otro worker, o se calcula aqui y
+    # los demas esperan este (dentro de cada proceso ya lo agrupa analysis_flight)
+    if shared_store is None:
+        return compute()
+    return shared_store.get_or_compute("analysis", key, ANALYSIS_TTL, compute, _analysis_ok)[0]
+
+async def _ashared_analysis(key, compute):
+    if shared_store is None:
+        return await compute()
+    return (await shared_store.aget_or_compute("analysis", key, ANALYSIS_TTL, compute, _analysis_ok))[0]
+
+def analyze_symbol(symbol, interval="1d", indicator_specs=None):
+    key = _flight_key(symbol, interval, indicator_specs)
+    return analysis_flight.do(key, lambda: _shared_analysis(
+        key, lambda: _analyze_symbol(symbol, interval, indicator_specs)))
+
+def _analyze_symbol(symbol, interval, indicator_specs=None):
+    print(f"--- API Fetch: {symbol} [Interval: {interval}] ---")
+    
+    try:
+        with metrics.span("fundamentals"):
+            fundamentals, buffett_certified = load_fundamentals_and_quality(symbol)
+        
+        try:
+            with metrics.span("chart"):
+                bars = load_bars(symbol, interval)
+        except (UpstreamError, UpstreamUnavailable, ValueError) as e_chart:
+            return _error_result(symbol, str(e_chart))
+        
+        result = build_analysis(symbol, interval, bars, fundamentals, buffett_certified, indicator_specs)
+        if result["status"] != "ok":
+            return result
+        
         # --- DATOS EXTRA: Noticias y Recomendaciones Institucionales ---
+        # 1. Recomendaciones de Analistas (Wall Street)
         try:
-            # 1. Recomendaciones de Analistas (Wall Street)
-            rec_url = f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}?modules=recommendationTrend"
-            rec_resp = session.get(rec_url, timeout=5)
-            recommendations_data = None
-            if rec_resp.status_code == 200:
-                rec_json = rec_resp.json()
-                try:
-                    trend = rec_json["quoteSummary"]["result"][0]["recommendationTrend"]["trend"][0]
-                    recommendations_data = {
-                        "strongBuy": trend["strongBuy"],
-                        "buy": trend["buy"],
-                        "hold": trend["hold"],
-                        "sell": trend["sell"],
-                        "strongSell": trend["strongSell"]
-                    }
-                except:
-                    pass
-            result["recommendations"] = recommendations_data
-
-            # 2. Noticias Recientes
-            news_url = f"https://query2.finance.yahoo.com/v1/finance/search?q={symbol}"
-            news_resp = session.get(news_url, timeout=5)
-            news_data = []
-            if news_resp.status_code == 200:
-                news_json = news_resp.json()
-                try:
-                    # Extract news from search results
-                    items = news_json.get("news", [])
-                    for item in items[:5]: # Top 5 noticias
-                        news_data.append({
-                            "title": item.get("title"),
-                            "publisher": item.get("publisher"),
-                            "link": item.get("link"),
-                            "time": item.get("providerPublishTime")
-                        })
-                except:
-                    pass
-            result["news"] = news_data
-
+            with metrics.span("recommendations"):
+                result["recommendations"] = fetch_recommendations(symbol)
         except Exception as e_extra:
-            print(f"Error fetching extra data: {e_extra}")
+            print(f"Error fetching recommendations: {e_extra}")
             result["recommendations"] = None
+
+        # 2. Noticias Recientes
+        try:
+            with metrics.span("news"):
+                result["news"] = fetch_news(symbol)
+        except Exception as e_extra:
+            print(f"Error fetching news: {e_extra}")
             result["news"] = []
 
         return result
         
     except Exception as e:
         print(f"Exception: {e}")
-        result["detail"] = str(e)
+        return _error_result(symbol, str(e))
+
+async def analyze_symbol_async(symbol, interval="1d", indicator_specs=None):
+    # Igual que analyze_symbol, pero todas las descargas van en paralelo: yfinance
+    # en el pool de hilos y las llamadas HTTP con la sesion async de curl_cffi.
+    key = _flight_key(symbol, interval, indicator_specs)
+    return await analysis_flight.ado(key, lambda: _ashared_analysis(
+        key, lambda: _analyze_symbol_async(symbol, interval, indicator_specs)))
+
+async def _analyze_symbol_async(symbol, interval, indicator_specs=None):
+    print(f"--- API Fetch (async): {symbol} [Interval: {interval}] ---")
+    
+    try:
+        fund_res, chart_res, rec_res, news_res = await asyncio.gather(
+            metrics.atimed("fundamentals", asyncio.wait_for(asyncio.to_thread(load_fundamentals_and_quality, symbol), FUNDAMENTALS_TIMEOUT)),
+            metrics.atimed("chart", asyncio.wait_for(load_bars_async(symbol, interval), CHART_TIMEOUT)),
+            metrics.atimed("recommendations", asyncio.wait_for(fetch_recommendations_async(symbol), EXTRA_TIMEOUT)),
+            metrics.atimed("news", asyncio.wait_for(fetch_news_async(symbol), EXTRA_TIMEOUT)),
+            return_exceptions=True,
+        )
+        
+        if isinstance(chart_res, asyncio.TimeoutError):
+            return _error_result(symbol, "Timeout fetching chart data")
+        if isinstance(chart_res, Exception):
+            return _error_result(symbol, str(chart_res))
+        
+        if isinstance(fund_res, Exception):
+            print(f"Fundamentals Error: {fund_res!r}")
+            fund_res = ([], False)
+        fundamentals, buffett_certified = fund_res
+        
+        # El calculo es CPU: fuera del event loop
+        result = await asyncio.to_thread(build_analysis, symbol, interval, chart_res, fundamentals, buffett_certified,
+                                         indicator_specs)
+        if result["status"] != "ok":
+            return result
+        
+        if isinstance(rec_res, Exception):
+            print(f"Error fetching recommendations: {rec_res!r}")
+            rec_res = None
+        if isinstance(news_res, Exception):
+            print(f"Error fetching news: {news_res!r}")
+            news_res = []
+        result["recommendations"] = rec_res
+        result["news"] = news_res
+        
         return result
+        
+    except Exception as e:
+        print(f"Exception: {e}")
+        return _error_result(symbol, str(e))
 
 if __name__ == "__main__":
     # Test local sencillo
-    print(json.dumps(analyze_symbol("BTC-USD"), indent=2))
+    print(json.dumps(format_result(analyze_symbol("BTC-USD")), indent=2))
 
@@ -0,0 +1,137 @@
+import bisect
+import json
+import math
+import time
+
+import numpy as np
+
+from intraday_store import INTRADAY
+
+try:
+    import orjson
+except ImportError:  # fallback al json de la stdlib
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # encoding=msgpack no disponible
+    msgpack = None
+
+# Formatos de salida del historial de /analyze. build_analysis lo genera por
+# columnas (listas paralelas, tiempos epoch y las ultimas `projections` filas
+# son la proyeccion); aqui se convierte a:
+#   rows      -> lista de dicts por vela, fechas 'YYYY-MM-DD' (formato original);
+#                en intervalos intradia, epoch (varias velas por dia)
+#   columnar  -> listas paralelas por campo, tiempos epoch y lineas de
+#                fundamentales en run-length ({"values": [...], "lengths": [...]})
+
+# Constantes entre informes anuales: se comprimen por tramos
+RLE_FIELDS = ("graham_number", "lynch_line", "burry_line")
+
+FORMATS = ("rows", "columnar")
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def history_fields(history):
+    # time, OHLCV, los indicadores pedidos, fundamentales y signal (orden de build_analysis)
+    return [field for field in history if field != "projections"]
+
+
+def history_rows(history, intraday=False):
+    n = len(history["time"])
+    first_projection = n - history.get("projections", 0)
+    if intraday:
+        dates = history["time"]
+    else:
+        dates = [time.strftime('%Y-%m-%d', time.localtime(t)) for t in history["time"]]
+    fields = history_fields(history)
+    columns = [dates] + [history[field] for field in fields[1:]]
+    rows = [dict(zip(fields, values)) for values in zip(*columns)]
+    for rec in rows[first_projection:]:
+        rec["is_projection"] = True # Flag para frontend
+    return rows
+
+
+def run_length(values):
+    runs = {"values": [], "lengths": []}
+    for value in values:
+        if runs["values"] and runs["values"][-1] == value:
+            runs["lengths"][-1] += 1
+        else:
+            runs["values"].append(value)
+            runs["lengths"].append(1)
+    return runs
+
+
+def history_columnar(history):
+    columnar = {"length": len(history["time"]), "projections": history.get("projections", 0)}
+    for field in history_fields(history):
+        columnar[field] = run_length(history[field]) if field in RLE_FIELDS else history[field]
+    return columnar
+
+
+def slice_history(history, since):
+    # Delta para polling: velas con time >= since (la ultima que tiene el cliente
+    # puede haberse corregido) y siempre la proyeccion, que cambia con cada vela.
+    # Los indicadores solo miran hacia atras: lo anterior a `since` no cambia
+    # (salvo un recalculo completo, que el cliente recoge al recargar).
+    n = len(history["time"])
+    projections = history.get("projections", 0)
+    start = min(bisect.bisect_left(history["time"], since), n - projections)
+    sliced = {field: values[start:] for field, values in history.items() if field != "projections"}
+    sliced["projections"] = projections
+    return sliced
+
+
+def format_result(result, fmt="rows", since=None):
+    # No modifica `result` (puede estar compartido por single-flight)
+    history = result.get("history")
+    if not isinstance(history, dict):
+        return result
+    formatted = dict(result)
+    if since is not None:
+        history = slice_history(history, since)
+        formatted["since"] = since
+    if fmt == "columnar":
+        formatted["history"] = history_columnar(history)
+        formatted["format"] = "columnar"
+    else:
+        formatted["history"] = history_rows(history, result.get("interval") in INTRADAY)
+    return formatted
+
+
+def _json_safe(value):
+    # Sin orjson: NaN/inf -> None como hace orjson (json.dumps escribiria NaN, que no es JSON)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _json_default(value):
+    # Arrays y escalares NumPy, lo mismo que orjson con OPT_SERIALIZE_NUMPY
+    if isinstance(value, (np.ndarray, np.generic)):
+        return _json_safe(value.tolist())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode(payload, encoding="json"):
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.packb(payload, use_bin_type=True)
+    if orjson is not None:
+        # NaN/inf -> null, igual que el frontend espera para huecos
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_json_safe(payload), default=_json_default, allow_nan=False).encode()
+
+
+def decode(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+import pytest
+
+import formats
+
+# Formatos del historial de /analyze: fechas por fila segun el intervalo,
+# run-length, equivalencia filas/columnar y JSON sin orjson.
+
+DAY = 86400
+START = 1_700_000_000 // DAY * DAY + 14 * 3600
+
+
+def history(n, step, projections=0):
+    times = [START + i * step for i in range(n)]
+    closes = [100.0 + i for i in range(n)]
+    return {"time": times, "open": closes, "high": closes, "low": closes, "close": closes,
+            "volume": [10] * n, "graham_number": [50.0] * n, "signal": [None] * n,
+            "projections": projections}
+
+
+def test_intraday_rows_have_unique_times():
+    result = {"symbol": "AAPL", "interval": "5m", "status": "success", "history": history(100, 300, 2)}
+    rows = formats.format_result(result)["history"]
+    times = [row["time"] for row in rows]
+    assert len(set(times)) == len(rows)
+    assert times == result["history"]["time"]
+    assert rows[-1]["is_projection"] and "is_projection" not in rows[-3]
+
+
+def test_daily_rows_keep_dates():
+    result = {"symbol": "AAPL", "interval": "1d", "status": "success", "history": history(5, DAY)}
+    rows = formats.format_result(result)["history"]
+    assert all(isinstance(row["time"], str) and len(row["time"]) == 10 for row in rows)
+    assert len({row["time"] for row in rows}) == 5
+
+
+def expand(runs):
+    return [value for value, length in zip(runs["values"], runs["lengths"]) for _ in range(length)]
+
+
+def test_run_length_round_trip():
+    values = [None, None, 50.0, 50.0, 50.0, 61.5, None, 61.5]
+    runs = formats.run_length(values)
+    assert runs == {"values": [None, 50.0, 61.5, None, 61.5], "lengths": [2, 3, 1, 1, 1]}
+    assert expand(runs) == values
+    assert formats.run_length([]) == {"values": [], "lengths": []}
+
+
+def test_columnar_matches_rows():
+    h = history(30, DAY, 3)
+    h["graham_number"] = [None] * 10 + [50.0] * 15 + [55.0] * 5
+    result = {"symbol": "AAPL", "interval": "1d", "status": "ok", "history": h}
+    rows = formats.format_result(result)["history"]
+    columnar = formats.format_result(result, "columnar")["history"]
+    assert columnar["length"] == len(rows) and columnar["projections"] == 3
+    assert len(columnar["graham_number"]["values"]) == 3
+    for field in formats.history_fields(h)[1:]:
+        column = expand(columnar[field]) if field in formats.RLE_FIELDS else columnar[field]
+        assert column == [row[field] for row in rows], field
+    assert [time.strftime('%Y-%m-%d', time.localtime(t)) for t in columnar["time"]] == \
+        [row["time"] for row in rows]
+    # El resultado original (compartido por single-flight) no se toca
+    assert result["history"] is h and "format" not in result
+
+
+def test_json_fallback_matches_orjson(monkeypatch):
+    payload = {"symbol": "AAPL", "current_price": np.float64(101.5), "rows": np.int64(3),
+               "history": {"close": np.array([1.0, np.nan, 2.5]), "rsi": [float("nan"), 55.0, float("inf")],
+                           "volume": np.array([1, 2, 3], dtype=np.int64), "signal": (None, "BUY")}}
+    expected = {"symbol": "AAPL", "current_price": 101.5, "rows": 3,
+                "history": {"close": [1.0, None, 2.5], "rsi": [None, 55.0, None],
+                            "volume": [1, 2, 3], "signal": [None, "BUY"]}}
+    if formats.orjson is not None:
+        assert formats.decode(formats.encode(payload)) == expected
+    monkeypatch.setattr(formats, "orjson", None)
+    encoded = formats.encode(payload)
+    assert b"NaN" not in encoded and b"Infinity" not in encoded
+    assert formats.decode(encoded) == expected
+    with pytest.raises(TypeError):
+        formats.encode({"when": object()})
+
+
+def test_slice_history_since():
+    h = history(10, DAY, 2)  # 8 velas reales + 2 de proyeccion
+    since = h["time"][5]
+    sliced = formats.slice_history(h, since)
+    assert sliced["time"] == h["time"][5:] and sliced["close"] == h["close"][5:]
+    assert sliced["projections"] == 2
+    # Entre dos velas: desde la siguiente
+    assert formats.slice_history(h, since - 1)["time"][0] == since
+    # Posterior a la ultima vela real: solo la proyeccion
+    late = formats.slice_history(h, h["time"][-1] + DAY)
+    assert late["time"] == h["time"][-2:] and late["projections"] == 2
+    # Anterior a todo: historial completo
+    assert formats.slice_history(h, 0)["time"] == h["time"]
+
+    result = {"symbol": "AAPL", "interval": "1d", "status": "ok", "history": h}
+    rows = formats.format_result(result, since=since)
+    assert rows["since"] == since and len(rows["history"]) == 5
+    assert [r.get("is_projection", False) for r in rows["history"]] == [False, False, False, True, True]
@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import throttle
+from bar_store import DATA_DIR
+from singleflight import SingleFlight
+
+# Snapshots de fundamentales (Graham/Lynch/Burry + lynch_multiplier + Buffett)
+# por simbolo, persistidos en disco. Solo cambian con cada informe anual, asi que
+# las peticiones de precio leen el ultimo snapshot y, si toca, se refresca en
+# segundo plano: cada REFRESH_AGE, o antes si la fecha del ultimo cierre fiscal
+# (comprobacion barata cada CHECK_AGE) es posterior a la del snapshot.
+# Un scrape fallido tambien se guarda (el snapshot anterior, o uno vacio, con
+# el error) y no se reintenta hasta pasado RETRY_AGE: sin el, cada peticion de
+# un simbolo sin datos repetiria la descarga lenta.
+
+FUNDAMENTALS_DIR = os.path.join(DATA_DIR, "fundamentals")
+
+REFRESH_AGE = float(os.environ.get("FUNDAMENTALS_REFRESH_HOURS", str(7 * 24))) * 3600
+CHECK_AGE = 12 * 3600
+RETRY_AGE = float(os.environ.get("FUNDAMENTALS_RETRY_MINUTES", "15")) * 60
+
+EMPTY_SNAPSHOT = {"fundamentals": [], "lynch_multiplier": None, "buffett_certified": False}
+
+
+class FundamentalsStore:
+    def __init__(self, loader, report_date=None, root=FUNDAMENTALS_DIR, workers=2):
+        # loader(symbol) -> {"fundamentals", "lynch_multiplier", "buffett_certified"}
+        # report_date(symbol) -> timestamp del ultimo cierre fiscal (o None)
+        self.loader = loader
+        self.report_date = report_date
+        self.root = root
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._pending = set()
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fundamentals-refresh")
+        self._stats = {"hits": 0, "cold_loads": 0, "refreshes": 0, "checks": 0, "errors": 0}
+
+    # --- Persistencia ---
+
+    def _path(self, symbol):
+        safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", symbol)
+        return os.path.join(self.root, f"{safe}.json")
+
+    def _read(self, symbol):
+        with self._lock:
+            snapshot = self._snapshots.get(symbol)
+        if snapshot is not None:
+            return snapshot
+        try:
+            with open(self._path(symbol)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            return self._snapshots.setdefault(symbol, snapshot)
+
+    def _write(self, symbol, snapshot):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._path(symbol) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self._path(symbol))
+        with self._lock:
+            self._snapshots[symbol] = snapshot
+
+    # --- Lectura ---
+
+    def get(self, symbol):
+        # Nunca espera a yfinance salvo la primera vez que se ve el simbolo
+        snapshot = self._read(symbol)
+        if snapshot is None:
+            with self._lock:
+                self._stats["cold_loads"] += 1
+            try:
+                return self._flight.do(symbol, lambda: self._attempt(symbol, self.refresh))
+            except Exception as e:
+                print(f"Fundamentals Error ({symbol}): {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                return dict(EMPTY_SNAPSHOT)
+
+        with self._lock:
+            self._stats["hits"] += 1
+        self._refresh_if_due(symbol, snapshot)
+        return snapshot
+
+    def peek(self, symbol):
+        # Solo lo ya guardado (None si no hay snapshot); nunca descarga en el
+        # momento. Para escaneos de muchos simbolos: no dispara cargas en frio,
+        # pero programa en segundo plano las que faltan, asi que los siguientes
+        # escaneos ya los encuentran.
+        snapshot = self._read(symbol)
+        if snapshot is None:
+            self._schedule(symbol, self.refresh)
+        else:
+            self._refresh_if_due(symbol, snapshot)
+        return snapshot
+
+    def _refresh_if_due(self, symbol, snapshot):
+        now = time.time()
+        if "retry_at" in snapshot:
+            # Ultimo scrape fallido: solo se reintenta a su hora
+            if now >= snapshot["retry_at"]:
+                self._schedule(symbol, self.refresh)
+        elif now - snapshot.get("refreshed_at", 0) > REFRESH_AGE:
+            self._schedule(symbol, self.refresh)
+        elif self.report_date is not None and now - snapshot.get("checked_at", 0) > CHECK_AGE:
+            self._schedule(symbol, self.check)
+
+    # --- Refresco ---
+
+    def refresh(self, symbol):
+        snapshot = dict(self.loader(symbol))
+        snapshot["report_ts"] = self._report_date(symbol)
+        snapshot["refreshed_at"] = snapshot["checked_at"] = time.time()
+        self._write(symbol, snapshot)
+        with self._lock:
+            self._stats["refreshes"] += 1
+        return snapshot
+
+    def check(self, symbol):
+        # Recalcula solo si hay un cierre fiscal mas reciente que el del snapshot
+        snapshot = self._read(symbol)
+        report_ts = self._report_date(symbol)
+        with self._lock:
+            self._stats["checks"] += 1
+        if snapshot is None or (report_ts and report_ts > (snapshot.get("report_ts") or 0)):
+            return self.refresh(symbol)
+        snapshot = dict(snapshot, checked_at=time.time())
+        self._write(symbol, snapshot)
+        return snapshot
+
+    def _attempt(self, symbol, job):
+        try:
+            return job(symbol)
+        except Exception as e:
+            print(f"Fundamentals refresh error ({symbol}): {e}")
+            return self._failed(symbol, e)
+
+    def _failed(self, symbol, error):
+        # Se conserva lo anterior (o vacio) con el error y la hora del reintento
+        snapshot = dict(self._read(symbol) or EMPTY_SNAPSHOT)
+        snapshot["error"] = str(error)
+        snapshot["retry_at"] = time.time() + RETRY_AGE
+        self._write(symbol, snapshot)
+        with self._lock:
+            self._stats["errors"] += 1
+        return snapshot
+
+    def _report_date(self, symbol):
+        if self.report_date is None:
+            return None
+        try:
+            return self.report_date(symbol)
+        except Exception as e:
+            print(f"Report date check failed ({symbol}): {e}")
+            return None
+
+    def _schedule(self, symbol, job):
+        with self._lock:
+            if symbol in self._pending:
+                return
+            self._pending.add(symbol)
+        self._executor.submit(self._run, symbol, job)
+
+    def _run(self, symbol, job):
+        # Si falla se conserva el snapshot anterior (_failed). Los refrescos ceden
+        # el turno de Yahoo a las requests interactivas
+        throttle.set_priority(throttle.BACKGROUND)
+        try:
+            self._flight.do(symbol, lambda: self._attempt(symbol, job))
+        except Exception as e:
+            print(f"Fundamentals refresh error ({symbol}): {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(symbol)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["symbols"] = len(self._snapshots)
+            stats["refreshing"] = len(self._pending)
+            return stats
@@ -0,0 +1,116 @@
+import tempfile
+import time
+
+import fundamentals_store
+from fundamentals_store import FundamentalsStore
+
+# Snapshots de fundamentales: carga en frio una sola vez, peek sin esperar
+# descargas (las que faltan van en segundo plano), refresco/comprobacion en segundo plano cuando toca y scrapes fallidos
+# guardados con su hora de reintento.
+
+SNAPSHOT = {"fundamentals": [{"date_ts": 1, "graham": 10.0, "lynch": 20.0, "burry": 60.0}],
+            "lynch_multiplier": 20.0, "buffett_certified": True}
+
+
+class Loader:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, symbol):
+        self.calls.append(symbol)
+        if self.fail:
+            raise ValueError("No fundamentals data found")
+        return SNAPSHOT
+
+
+def wait(store):
+    for _ in range(200):
+        if not store.stats()["refreshing"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError("background refresh did not finish")
+
+
+def test_cold_load_once_then_from_disk():
+    with tempfile.TemporaryDirectory() as root:
+        loader = Loader()
+        store = FundamentalsStore(loader, root=root)
+        assert store.get("AAPL")["lynch_multiplier"] == 20.0
+        assert store.get("AAPL")["buffett_certified"] and loader.calls == ["AAPL"]
+
+        # peek no espera: el simbolo nuevo se carga en segundo plano para la proxima vez
+        assert store.peek("MSFT") is None
+        wait(store)
+        assert loader.calls == ["AAPL", "MSFT"] and store.peek("MSFT")["lynch_multiplier"] == 20.0
+
+        # Otro proceso lo lee del disco sin descargar
+        other = FundamentalsStore(loader, root=root)
+        assert other.peek("AAPL")["fundamentals"] == SNAPSHOT["fundamentals"]
+        assert loader.calls == ["AAPL", "MSFT"] and other.stats()["refreshing"] == 0
+
+
+def test_refresh_and_check_scheduling():
+    with tempfile.TemporaryDirectory() as root:
+        loader = Loader()
+        report = {"ts": 100}
+        store = FundamentalsStore(loader, lambda symbol: report["ts"], root=root)
+        now = time.time()
+
+        # Snapshot caducado: se sirve el guardado y se refresca en segundo plano
+        store._write("AAPL", dict(SNAPSHOT, report_ts=100, checked_at=now,
+                                  refreshed_at=now - fundamentals_store.REFRESH_AGE - 1))
+        assert store.get("AAPL")["refreshed_at"] < now
+        wait(store)
+        assert loader.calls == ["AAPL"] and store.peek("AAPL")["refreshed_at"] >= now
+
+        # Comprobacion vencida sin informe nuevo: no se recalcula
+        store._write("AAPL", dict(store.peek("AAPL"), checked_at=now - fundamentals_store.CHECK_AGE - 1))
+        store.peek("AAPL")
+        wait(store)
+        assert loader.calls == ["AAPL"] and store.peek("AAPL")["checked_at"] >= now
+
+        # Informe anual nuevo: se recalcula
+        report["ts"] = 200
+        store._write("AAPL", dict(store.peek("AAPL"), checked_at=now - fundamentals_store.CHECK_AGE - 1))
+        store.peek("AAPL")
+        wait(store)
+        assert loader.calls == ["AAPL", "AAPL"] and store.peek("AAPL")["report_ts"] == 200
+        assert store.stats()["checks"] == 2 and store.stats()["refreshes"] == 2
+
+
+def test_failed_scrape_is_persisted_until_retry():
+    with tempfile.TemporaryDirectory() as root:
+        loader = Loader(fail=True)
+        store = FundamentalsStore(loader, root=root)
+        snapshot = store.get("XYZ")
+        assert snapshot["fundamentals"] == [] and "No fundamentals" in snapshot["error"]
+        assert snapshot["retry_at"] > time.time()
+
+        # Ni este proceso ni otro repiten la descarga antes del reintento
+        assert store.get("XYZ")["error"] and store.peek("XYZ")["error"]
+        assert FundamentalsStore(loader, root=root).get("XYZ")["error"]
+        assert loader.calls == ["XYZ"] and store.stats()["errors"] == 1
+
+        # Pasada la hora del reintento: se vuelve a intentar y un acierto borra el error
+        loader.fail = False
+        store._write("XYZ", dict(snapshot, retry_at=time.time() - 1))
+        store.get("XYZ")
+        wait(store)
+        refreshed = store.peek("XYZ")
+        assert loader.calls == ["XYZ", "XYZ"] and "error" not in refreshed and "retry_at" not in refreshed
+
+
+def test_failed_refresh_keeps_previous_data():
+    with tempfile.TemporaryDirectory() as root:
+        loader = Loader(fail=True)
+        store = FundamentalsStore(loader, root=root)
+        store._write("AAPL", dict(SNAPSHOT, refreshed_at=0, checked_at=0))
+        store.get("AAPL")
+        wait(store)
+        snapshot = store.peek("AAPL")
+        assert snapshot["fundamentals"] == SNAPSHOT["fundamentals"] and snapshot["error"]
+        # Hasta el reintento no se programa otro refresco
+        store.get("AAPL")
+        wait(store)
+        assert loader.calls == ["AAPL"]
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from curl_cffi import requests as cffi_requests
+from curl_cffi.const import CurlInfo
+from curl_cffi.requests import AsyncSession
+
+import throttle
+
+# Sesiones HTTP de larga vida (curl_cffi imitando Chrome) compartidas por todo el
+# proceso: chart, quoteSummary, search y yfinance reutilizan las mismas
+# conexiones keep-alive / HTTP/2 y las mismas cookies/crumb.
+#
+# curl_cffi.Session usa un handle de curl por hilo, asi que una sola sesion sync
+# es segura entre hilos (cada hilo conserva sus conexiones). Para el camino async
+# hay una AsyncSession por event loop con hasta MAX_CLIENTS handles.
+#
+# Cada request pide turno a throttle.scheduler (limite por host, backoff y
+# circuit breaker) y le informa del resultado.
+
+IMPERSONATE = "chrome"
+MAX_CLIENTS = int(os.environ.get("HTTP_POOL_MAX_CLIENTS", "10"))
+# Errores de conexion seguidos antes de reciclar la sesion
+MAX_CONSECUTIVE_ERRORS = 3
+# Edad maxima de una sesion antes de reciclarla (segundos)
+MAX_SESSION_AGE = 30 * 60
+
+# Infos de curl que se copian en cada respuesta (medicion de reutilizacion)
+_CURL_INFOS = [CurlInfo.NUM_CONNECTS]
+
+# CurlInfo.HTTP_VERSION -> etiqueta
+_HTTP_VERSIONS = {1: "1.0", 2: "1.1", 3: "2", 30: "3"}
+
+
+def _retry_after(resp):
+    # Solo la forma en segundos; la de fecha HTTP cae en el backoff exponencial
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class _Slot:
+    def __init__(self, session):
+        self.session = session
+        self.created_at = time.time()
+        self.requests = 0
+        self.errors = 0
+
+    def healthy(self):
+        return self.errors < MAX_CONSECUTIVE_ERRORS and time.time() - self.created_at < MAX_SESSION_AGE
+
+
+class SessionPool:
+    def __init__(self, impersonate=IMPERSONATE, max_clients=MAX_CLIENTS):
+        self.impersonate = impersonate
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._sync = None
+        self._async = {}  # event loop -> _Slot
+        self._metrics = {
+            "requests": 0,
+            "errors": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+            "sessions_created": 0,
+            "sessions_recycled": 0,
+            "http_versions": {},
+        }
+
+    # --- Sesiones ---
+
+    def _new_sync(self):
+        session = cffi_requests.Session(impersonate=self.impersonate, curl_infos=_CURL_INFOS)
+        session.verify = False
+        return _Slot(session)
+
+    def _sync_slot(self):
+        with self._lock:
+            slot = self._sync
+            if slot is None or not slot.healthy():
+                if slot is not None:
+                    self._metrics["sessions_recycled"] += 1
+                    self._close_later(slot.session)
+                slot = self._sync = self._new_sync()
+                self._metrics["sessions_created"] += 1
+            return slot
+
+    def session(self):
+        # Sesion sync compartida (tambien la que usa yfinance)
+        return self._sync_slot().session
+
+    def _async_slot(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slot = self._async.get(loop)
+            if slot is None or not slot.healthy():
+                if slot is not None:
+                    self._metrics["sessions_recycled"] += 1
+                    loop.create_task(slot.session.close())
+                session = AsyncSession(impersonate=self.impersonate, verify=False,
+                                       max_clients=self.max_clients, curl_infos=_CURL_INFOS)
+                slot = self._async[loop] = _Slot(session)
+                self._metrics["sessions_created"] += 1
+                # Limpiar sesiones de loops ya cerrados
+                for other in [l for l in self._async if l.is_closed()]:
+                    del self._async[other]
+            return slot
+
+    def _close_later(self, session):
+        # Puede haber requests en curso en otros hilos con la sesion vieja
+        timer = threading.Timer(60, session.close)
+        timer.daemon = True
+        timer.start()
+
+    # --- Requests ---
+
+    def _record(self, slot, resp):
+        # NUM_CONNECTS == 0 -> la transferencia reutilizo una conexion abierta
+        connects = getattr(resp, "infos", {}).get(CurlInfo.NUM_CONNECTS)
+        version = _HTTP_VERSIONS.get(resp.http_version, str(resp.http_version))
+        with self._lock:
+            slot.requests += 1
+            slot.errors = 0
+            self._metrics["requests"] += 1
+            if connects is not None:
+                self._metrics["reused_connections" if connects == 0 else "new_connections"] += 1
+            versions = self._metrics["http_versions"]
+            versions[version] = versions.get(version, 0) + 1
+
+    def _failed(self, slot):
+        with self._lock:
+            slot.errors += 1
+            self._metrics["requests"] += 1
+            self._metrics["errors"] += 1
+
+    def get(self, url, timeout=10, **kwargs):
+        host = urlsplit(url).hostname
+        throttle.scheduler.acquire(host)
+        slot = self._sync_slot()
+        try:
+            resp = slot.session.get(url, timeout=timeout, **kwargs)
+        except Exception as e:
+            self._failed(slot)
+            throttle.scheduler.report(host, error=e)
+            raise
+        self._record(slot, resp)
+        throttle.scheduler.report(host, resp.status_code, retry_after=_retry_after(resp))
+        return resp
+
+    async def aget(self, url, timeout=10, **kwargs):
+        host = urlsplit(url).hostname
+        await throttle.scheduler.aacquire(host)
+        slot = self._async_slot()
+        try:
+            resp = await slot.session.get(url, timeout=timeout, **kwargs)
+        except Exception as e:
+            self._failed(slot)
+            throttle.scheduler.report(host, error=e)
+            raise
+        self._record(slot, resp)
+        throttle.scheduler.report(host, resp.status_code, retry_after=_retry_after(resp))
+        return resp
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["http_versions"] = dict(self._metrics["http_versions"])
+            tracked = metrics["new_connections"] + metrics["reused_connections"]
+            metrics["connection_reuse_ratio"] = metrics["reused_connections"] / tracked if tracked else 0.0
+            metrics["async_sessions"] = len(self._async)
+            if self._sync is not None:
+                metrics["sync_session_age"] = time.time() - self._sync.created_at
+                metrics["sync_session_requests"] = self._sync.requests
+            return metrics
+
+
+# Pool compartido por todo el proceso
+http_pool = SessionPool()
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+from curl_cffi.const import CurlInfo
+from curl_cffi.requests import RequestsError
+
+import http_pool
+import throttle
+from http_pool import SessionPool
+
+# Pool de sesiones con sesiones falsas (sin red): reutilizacion, reciclado tras
+# errores seguidos o por edad y una sesion async por event loop.
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, connects=0):
+        self.status_code = status_code
+        self.headers = {}
+        self.http_version = 3
+        self.infos = {CurlInfo.NUM_CONNECTS: connects}
+
+
+class FakeSession:
+    def __init__(self, impersonate=None, curl_infos=None, **kwargs):
+        self.impersonate = impersonate
+        self.outcomes = []  # excepciones o respuestas; vacia -> 200 reutilizando conexion
+        self.requests = 0
+        self.closed = False
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else FakeResponse()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncSession(FakeSession):
+    async def get(self, url, timeout=None, **kwargs):
+        return FakeSession.get(self, url, timeout, **kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(http_pool.cffi_requests, "Session", FakeSession)
+    monkeypatch.setattr(http_pool, "AsyncSession", FakeAsyncSession)
+    monkeypatch.setattr(throttle, "scheduler", throttle.UpstreamScheduler())
+    pool = SessionPool()
+    pool.closing = []
+    pool._close_later = pool.closing.append
+    return pool
+
+
+URL = "https://query1.finance.yahoo.com/v8/finance/chart/AAPL"
+
+
+def test_sync_session_reused(pool):
+    session = pool.session()
+    session.outcomes = [FakeResponse(connects=1)]
+    for _ in range(4):
+        assert pool.get(URL).status_code == 200
+    assert pool.session() is session and session.requests == 4 and session.verify is False
+    metrics = pool.metrics()
+    assert metrics["requests"] == 4 and metrics["sessions_created"] == 1
+    assert metrics["new_connections"] == 1 and metrics["reused_connections"] == 3
+    assert metrics["connection_reuse_ratio"] == 0.75 and metrics["http_versions"] == {"2": 4}
+
+
+def test_recycled_after_consecutive_errors(pool):
+    session = pool.session()
+    errors = [RequestsError("connection reset") for _ in range(http_pool.MAX_CONSECUTIVE_ERRORS)]
+    # Un acierto entre errores reinicia la cuenta
+    session.outcomes = errors[:1] + [FakeResponse()] + errors
+    for outcome in session.outcomes[:]:
+        if isinstance(outcome, Exception):
+            with pytest.raises(RequestsError):
+                pool.get(URL)
+        else:
+            pool.get(URL)
+    assert pool.metrics()["errors"] == http_pool.MAX_CONSECUTIVE_ERRORS + 1
+
+    # La siguiente request sale con una sesion nueva; la vieja se cierra mas tarde
+    assert pool.get(URL).status_code == 200
+    fresh = pool.session()
+    assert fresh is not session and fresh.requests == 1 and pool.closing == [session]
+    assert pool.metrics()["sessions_recycled"] == 1 and pool.metrics()["sessions_created"] == 2
+
+
+def test_recycled_by_age(pool, monkeypatch):
+    session = pool.session()
+    pool._sync.created_at = time.time() - http_pool.MAX_SESSION_AGE - 1
+    pool.get(URL)
+    assert pool.session() is not session and pool.closing == [session]
+
+
+def test_async_session_per_loop(pool):
+    async def requests():
+        for _ in range(3):
+            await pool.aget(URL)
+        return pool._async_slot().session
+
+    first = asyncio.run(requests())
+    second = asyncio.run(requests())
+    assert first is not second and first.requests == 3 and second.requests == 3
+    # Los loops cerrados se olvidan al crear la siguiente sesion
+    assert pool.metrics()["async_sessions"] == 1 and pool.metrics()["sessions_created"] == 2
+
+    async def failing():
+        session = pool._async_slot().session
+        session.outcomes = [RequestsError("reset")] * http_pool.MAX_CONSECUTIVE_ERRORS
+        for _ in range(http_pool.MAX_CONSECUTIVE_ERRORS):
+            with pytest.raises(RequestsError):
+                await pool.aget(URL)
+        await pool.aget(URL)
+        await asyncio.sleep(0)  # cierre de la sesion vieja
+        return session, pool._async_slot().session
+
+    old, new = asyncio.run(failing())
+    assert old is not new and old.closed and new.requests == 1
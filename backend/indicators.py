@@ -0,0 +1,619 @@
+import math
+import threading
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Motor de indicadores vectorizado (NumPy).
+# Todas las funciones aceptan listas o arrays y devuelven arrays float64 con NaN
+# en el periodo de calentamiento (equivalente a los None de las versiones puras).
+
+# Cada bloque del kernel recursivo se limita para que beta^-k no supere este
+# factor y la forma cerrada conserve precision (~1e-13 relativo).
+_KERNEL_MAX_GROWTH = 1e3
+
+# Tamano de bloque de las sumas moviles (ver _rolling_sums)
+_ROLLING_BLOCK = 256
+
+
+def as_array(values):
+    # None -> NaN
+    return np.array(values, dtype=np.float64)
+
+
+def to_list(arr):
+    # NaN -> None para mantener la semantica de las listas originales
+    return [None if v != v else v for v in np.asarray(arr, dtype=np.float64).tolist()]
+
+
+def _rolling_sums(x, period):
+    # Sumas moviles (x y x^2) via suma acumulada. Para evitar la cancelacion
+    # numerica de las sumas de cuadrados en precios grandes o con tendencia, la
+    # serie se parte en bloques solapados (vista sin copia) y cada bloque se
+    # desplaza por su propia media antes de acumular.
+    # Devuelve arrays de longitud n - period + 1 (una entrada por ventana completa).
+    n = len(x)
+    n_windows = n - period + 1
+    n_blocks = -(-n_windows // _ROLLING_BLOCK)
+    seg_len = _ROLLING_BLOCK + period - 1
+    padded = np.concatenate((x, np.full(n_blocks * _ROLLING_BLOCK + period - 1 - n, x[-1])))
+    segs = sliding_window_view(padded, seg_len)[::_ROLLING_BLOCK][:n_blocks]
+    shift = segs.mean(axis=1, keepdims=True)
+    dev = segs - shift
+    c1 = np.zeros((n_blocks, seg_len + 1))
+    c2 = np.zeros((n_blocks, seg_len + 1))
+    np.cumsum(dev, axis=1, out=c1[:, 1:])
+    np.cumsum(dev * dev, axis=1, out=c2[:, 1:])
+    s1 = (c1[:, period:] - c1[:, :-period]).ravel()[:n_windows]
+    s2 = (c2[:, period:] - c2[:, :-period]).ravel()[:n_windows]
+    shift = np.repeat(shift.ravel(), _ROLLING_BLOCK)[:n_windows]
+    return s1, s2, shift
+
+
+def sma(prices, period):
+    x = as_array(prices)
+    out = np.full(len(x), np.nan)
+    if len(x) < period:
+        return out
+    s1, _, shift = _rolling_sums(x, period)
+    out[period - 1:] = s1 / period + shift
+    return out
+
+
+def rolling_mean_std(prices, period):
+    # Media y desviacion estandar poblacional en una sola pasada de sumas
+    x = as_array(prices)
+    mean = np.full(len(x), np.nan)
+    std = np.full(len(x), np.nan)
+    if len(x) < period:
+        return mean, std
+    s1, s2, shift = _rolling_sums(x, period)
+    m = s1 / period
+    var = np.maximum(s2 / period - m * m, 0.0)
+    mean[period - 1:] = m + shift
+    std[period - 1:] = np.sqrt(var)
+    return mean, std
+
+
+def std_dev(prices, period, mean=None):
+    # `mean` se acepta por compatibilidad con calculate_std_dev; las sumas moviles
+    # ya producen la media, asi que solo se usa para propagar sus huecos (NaN).
+    _, std = rolling_mean_std(prices, period)
+    if mean is not None:
+        std[np.isnan(as_array(mean))] = np.nan
+    return std
+
+
+def bollinger(prices, period=20, num_std=2):
+    mid, std = rolling_mean_std(prices, period)
+    return mid, mid + num_std * std, mid - num_std * std
+
+
+def ewm_kernel(x, beta, y0):
+    # Resuelve y[t] = beta * y[t-1] + (1 - beta) * x[t] partiendo de y[-1] = y0.
+    # Por bloques se usa la forma cerrada
+    #   y[k] = beta^(k+1) * y_prev + (1 - beta) * beta^k * sum_j x[j] * beta^-j
+    # que se evalua con una suma acumulada (sin bucle por elemento).
+    x = as_array(x)
+    n = len(x)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    if beta <= 0:
+        return x.copy()
+    alpha = 1.0 - beta
+    block = max(1, int(np.log(_KERNEL_MAX_GROWTH) / -np.log(beta))) if beta < 1 else n
+    k = np.arange(min(block, n), dtype=np.float64)
+    pow_pos = beta ** k
+    pow_neg = beta ** -k
+    y_prev = float(y0)
+    for start in range(0, n, block):
+        chunk = x[start:start + block]
+        m = len(chunk)
+        acc = np.cumsum(chunk * pow_neg[:m])
+        seg = beta * pow_pos[:m] * y_prev + alpha * pow_pos[:m] * acc
+        out[start:start + m] = seg
+        y_prev = seg[-1]
+    return out
+
+
+def ema(prices, window):
+    x = as_array(prices)
+    out = np.full(len(x), np.nan)
+    if len(x) < window:
+        return out
+    # El primer valor es la SMA de la primera ventana
+    seed = x[:window].sum() / window
+    out[window - 1] = seed
+    multiplier = 2 / (window + 1)
+    out[window:] = ewm_kernel(x[window:], 1.0 - multiplier, seed)
+    return out
+
+
+def wilder_averages(prices, period=14):
+    # Medias de ganancia/perdida con suavizado de Wilder, alineadas con `prices`
+    x = as_array(prices)
+    avg_gain = np.full(len(x), np.nan)
+    avg_loss = np.full(len(x), np.nan)
+    if len(x) < period + 1:
+        return avg_gain, avg_loss
+    deltas = np.diff(x)
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas > 0, 0.0, -deltas)
+    g0 = gains[:period].sum() / period
+    l0 = losses[:period].sum() / period
+    beta = (period - 1) / period
+    avg_gain[period] = g0
+    avg_loss[period] = l0
+    avg_gain[period + 1:] = ewm_kernel(gains[period:], beta, g0)
+    avg_loss[period + 1:] = ewm_kernel(losses[period:], beta, l0)
+    return avg_gain, avg_loss
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        out = 100 - (100 / (1 + rs))
+    out[avg_loss == 0] = 100.0
+    return out
+
+
+def rsi(prices, period=14):
+    avg_gain, avg_loss = wilder_averages(prices, period)
+    return rsi_from_averages(avg_gain, avg_loss)
+
+
+def signal_masks(prices, rsi_values, upper, lower, buy_rsi=40, sell_rsi=60, buy_margin=0.02, sell_margin=0.02):
+    # Regla combinada RSI + Bollinger (por defecto margen del 2% sobre la banda):
+    #   BUY:  RSI < 40 y precio <= banda inferior * 1.02
+    #   SELL: RSI > 60 y precio >= banda superior * 0.98
+    price = as_array(prices)
+    r = as_array(rsi_values)
+    with np.errstate(invalid="ignore"):
+        buy = (r < buy_rsi) & (price <= as_array(lower) * (1 + buy_margin))
+        sell = ~buy & (r > sell_rsi) & (price >= as_array(upper) * (1 - sell_margin))
+    return buy, sell
+
+
+# --- Pipeline declarativo ---
+# Cada indicador declara su entrada compartida (nodo) y las columnas que saca de
+# ella. Los nodos se calculan una vez por (tipo, periodo): sma20 y bb20 comparten
+# las sumas moviles de x y x^2, y rsi7/rsi14 tienen cada uno sus medias de Wilder.
+# Especificaciones: "<tipo><periodo>" (rsi14, sma100, ema50, bb20); sin periodo,
+# el de por defecto del tipo.
+
+# nodo -> calculo vectorizado sobre los precios
+NODES = {
+    "moments": rolling_mean_std,   # (media, std) de la ventana
+    "wilder": wilder_averages,     # (avg_gain, avg_loss)
+    "ema": ema,
+}
+
+
+def _bb_names(p):
+    # La media de Bollinger es interna (se envia solo si se pide smaN)
+    suffix = "" if p == 20 else f"_{p}"
+    return [f"sma_{p}", f"upper_band{suffix}", f"lower_band{suffix}"]
+
+
+def _bb_live(window):
+    mid, std = window.mean(), window.std()
+    if mid is None:
+        return [None, None, None]
+    return [mid, mid + 2 * std, mid - 2 * std]
+
+
+INDICATORS = {
+    "rsi": {"default": 14, "node": "wilder",
+            "names": lambda p: ["rsi" if p == 14 else f"rsi_{p}"],
+            "batch": lambda avg: [rsi_from_averages(*avg)],
+            "live": lambda state: [state.value]},
+    "sma": {"default": 50, "node": "moments",
+            "names": lambda p: [f"sma_{p}"],
+            "batch": lambda ms: [ms[0]],
+            "live": lambda window: [window.mean()]},
+    "ema": {"default": 200, "node": "ema",
+            "names": lambda p: [f"ema_{p}"],
+            "batch": lambda e: [e],
+            "live": lambda state: [state.value]},
+    "bb": {"default": 20, "node": "moments",
+           "names": _bb_names,
+           "batch": lambda ms: [ms[0], ms[0] + 2 * ms[1], ms[0] - 2 * ms[1]],
+           "live": _bb_live},
+}
+
+# Lo que calculaba analyze_symbol siempre (y lo que se envia si no se pide nada)
+DEFAULT_INDICATORS = ("rsi14", "sma50", "ema200", "bb20")
+MAX_PERIOD = 1000
+MAX_INDICATORS = 16
+
+
+def split_spec(spec):
+    kind = spec.rstrip("0123456789")
+    return kind, int(spec[len(kind):])
+
+
+def parse_specs(text):
+    # "rsi,bb20,sma100" -> ("rsi14", "bb20", "sma100"); ValueError si no es valida
+    specs = []
+    for token in text.split(","):
+        token = token.strip().lower()
+        if not token:
+            continue
+        kind = token.rstrip("0123456789")
+        digits = token[len(kind):]
+        if kind not in INDICATORS:
+            raise ValueError(f"Unknown indicator: {token} (use one of {', '.join(INDICATORS)})")
+        period = int(digits) if digits else INDICATORS[kind]["default"]
+        if not 2 <= period <= MAX_PERIOD:
+            raise ValueError(f"Invalid period for {kind}: {period} (2-{MAX_PERIOD})")
+        spec = f"{kind}{period}"
+        if spec not in specs:
+            specs.append(spec)
+    if not specs:
+        raise ValueError("No indicators given")
+    if len(specs) > MAX_INDICATORS:
+        raise ValueError(f"Too many indicators (max {MAX_INDICATORS})")
+    return tuple(specs)
+
+
+def spec_columns(specs, internal=True):
+    # Columnas de las especificaciones, en orden y sin repetir. Con internal=False
+    # (lo que se envia) se omite la media de cada Bollinger salvo que se pida la SMA.
+    smas = {split_spec(s)[1] for s in specs if s.startswith("sma")}
+    columns = []
+    for spec in specs:
+        kind, period = split_spec(spec)
+        names = INDICATORS[kind]["names"](period)
+        if kind == "bb" and not internal and period not in smas:
+            names = names[1:]
+        columns.extend(n for n in names if n not in columns)
+    return columns
+
+
+def compute_indicators(prices, specs):
+    # Devuelve (columnas, nodos): cada nodo se calcula una sola vez
+    x = as_array(prices)
+    nodes = {}
+    series = {}
+    for spec in specs:
+        kind, period = split_spec(spec)
+        indicator = INDICATORS[kind]
+        key = (indicator["node"], period)
+        if key not in nodes:
+            nodes[key] = NODES[key[0]](x, period)
+        series.update(zip(indicator["names"](period), indicator["batch"](nodes[key])))
+    return series, nodes
+
+
+# --- Estado incremental (streaming) ---
+# Cada indicador mantiene estado reanudable: push(x) anade una barra nueva y
+# replace_last(x) corrige la ultima barra (vela en formacion). Ambas son O(1).
+
+class RollingWindow:
+    # Ventana movil con sumas de x y x^2 (SMA y desviacion estandar).
+    # Los valores se guardan desplazados por `shift` para limitar la cancelacion
+    # y las sumas se recalculan periodicamente para evitar deriva numerica.
+    RESYNC_EVERY = 256
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._updates = 0
+
+    @classmethod
+    def from_values(cls, period, values):
+        state = cls(period)
+        for x in list(values)[-period:]:
+            state.push(x)
+        return state
+
+    def _resync(self):
+        self.total = sum(self.window)
+        self.total_sq = sum(v * v for v in self.window)
+        self._updates = 0
+
+    def push(self, x):
+        if self.shift is None:
+            self.shift = x
+        v = x - self.shift
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(v)
+        self.total += v
+        self.total_sq += v * v
+        self._tick()
+
+    def replace_last(self, x):
+        if not self.window:
+            self.push(x)
+            return
+        v = x - self.shift
+        old = self.window[-1]
+        self.window[-1] = v
+        self.total += v - old
+        self.total_sq += v * v - old * old
+        self._tick()
+
+    def _tick(self):
+        self._updates += 1
+        if self._updates >= self.RESYNC_EVERY:
+            self._resync()
+
+    def mean(self):
+        if len(self.window) < self.period:
+            return None
+        return self.total / self.period + self.shift
+
+    def std(self):
+        if len(self.window) < self.period:
+            return None
+        m = self.total / self.period
+        return max(self.total_sq / self.period - m * m, 0.0) ** 0.5
+
+
+class EMAState:
+    # EMA sembrada con la SMA de la primera ventana (como ema())
+    def __init__(self, window, value=None):
+        self.window = window
+        self.multiplier = 2 / (window + 1)
+        self.value = value
+        self.count = window if value is not None else 0
+        self.seed_sum = 0.0
+        self._undo = None
+
+    def push(self, x):
+        self._undo = (self.value, self.count, self.seed_sum)
+        if self.count < self.window:
+            self.seed_sum += x
+            self.count += 1
+            if self.count == self.window:
+                self.value = self.seed_sum / self.window
+        else:
+            self.value = (x - self.value) * self.multiplier + self.value
+
+    def replace_last(self, x):
+        if self._undo is None:
+            self.push(x)
+            return
+        self.value, self.count, self.seed_sum = self._undo
+        self.push(x)
+
+
+class RSIState:
+    # RSI con suavizado de Wilder (como rsi())
+    def __init__(self, period=14, last_price=None, avg_gain=None, avg_loss=None):
+        self.period = period
+        self.last_price = last_price
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+        self.count = period if avg_gain is not None else 0
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self._undo = None
+
+    def push(self, x):
+        self._undo = (self.last_price, self.avg_gain, self.avg_loss, self.count, self.gain_sum, self.loss_sum)
+        if self.last_price is None:
+            self.last_price = x
+            return
+        delta = x - self.last_price
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        if self.count < self.period:
+            self.gain_sum += gain
+            self.loss_sum += loss
+            self.count += 1
+            if self.count == self.period:
+                self.avg_gain = self.gain_sum / self.period
+                self.avg_loss = self.loss_sum / self.period
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        self.last_price = x
+
+    def replace_last(self, x):
+        if self._undo is None:
+            self.push(x)
+            return
+        (self.last_price, self.avg_gain, self.avg_loss,
+         self.count, self.gain_sum, self.loss_sum) = self._undo
+        self.push(x)
+
+    @property
+    def value(self):
+        if self.avg_gain is None:
+            return None
+        if self.avg_loss == 0:
+            return 100
+        return 100 - (100 / (1 + self.avg_gain / self.avg_loss))
+
+
+class SeriesView:
+    # Vista de solo lectura de values[start:stop] (sin copia). Las listas de
+    # LiveIndicators solo crecen por el final o cambian su ultimo valor (vela en
+    # formacion): ese valor se guarda al crear la vista, asi un sondeo posterior
+    # no cambia lo ya entregado. Indexar/iterar como una lista; tolist() copia.
+    __slots__ = ("_values", "_start", "_stop", "_last")
+
+    def __init__(self, values, start, stop):
+        self._values = values
+        self._start = start
+        self._stop = stop
+        self._last = values[stop - 1] if stop > start else None
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        n = self._stop - self._start
+        if isinstance(i, slice):
+            a, b, step = i.indices(n)
+            if step != 1:
+                return self.tolist()[i]
+            out = self._values[self._start + a:self._start + max(a, b)]
+            if out and b == n:
+                out[-1] = self._last
+            return out
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("series index out of range")
+        return self._last if i == n - 1 else self._values[self._start + i]
+
+    def tolist(self):
+        out = self._values[self._start:self._stop]
+        if out:
+            out[-1] = self._last
+        return out
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.tolist(), dtype=dtype)
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __eq__(self, other):
+        return self.tolist() == (other.tolist() if isinstance(other, SeriesView) else other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SeriesView({self.tolist()!r})"
+
+
+class LiveIndicators:
+    # Series de indicadores (por defecto las de analyze_symbol: RSI14, SMA50,
+    # EMA200, Bollinger 20/2) con estado reanudable. La primera carga es
+    # vectorizada (compute_indicators); cada sondeo posterior solo aplica las
+    # barras nuevas o corregidas. Hay un estado por nodo, compartido igual que en
+    # el calculo vectorizado.
+    # Las listas solo crecen por el final: las barras que salen de la ventana
+    # por el inicio se saltan con _start y se descartan de golpe al compactar.
+
+    # Diferencia relativa maxima entre las sumas de cierres solapados (ver sync)
+    RESTATE_TOLERANCE = 1e-9
+
+    def __init__(self, times, prices, specs=DEFAULT_INDICATORS):
+        self.lock = threading.Lock()
+        self.specs = tuple(specs)
+        self.times = list(times)
+        self.prices = list(prices)
+        self._start = 0  # Ventana actual: [_start, len(times))
+        # Sumas acumuladas de los cierres: _sums[i] = sum(prices[:i])
+        self._sums = [0.0] + list(accumulate(self.prices))
+
+        series, nodes = compute_indicators(self.prices, self.specs)
+        self.series = {key: to_list(values) for key, values in series.items()}
+        self.states = {key: self._seed(key, value) for key, value in nodes.items()}
+        # (columnas, lectura del estado, estado) de cada indicador, para cada barra nueva
+        self._readers = []
+        for spec in self.specs:
+            kind, period = split_spec(spec)
+            indicator = INDICATORS[kind]
+            self._readers.append((indicator["names"](period), indicator["live"], self.states[(indicator["node"], period)]))
+
+    def _seed(self, key, value):
+        # Sembrar el estado con los valores de la penultima barra y aplicar la
+        # ultima con push(), para que replace_last() pueda corregirla.
+        node, period = key
+        n = len(self.prices)
+        if node == "moments":
+            return RollingWindow.from_values(period, self.prices)
+        if node == "ema":
+            if n >= 2 and not np.isnan(value[n - 2]):
+                state = EMAState(period, value=float(value[n - 2]))
+                state.push(self.prices[-1])
+                return state
+            state = EMAState(period)
+        else:
+            avg_gain, avg_loss = value
+            if n >= 2 and not np.isnan(avg_gain[n - 2]):
+                state = RSIState(period, self.prices[-2], float(avg_gain[n - 2]), float(avg_loss[n - 2]))
+                state.push(self.prices[-1])
+                return state
+            state = RSIState(period)
+        for x in self.prices:
+            state.push(x)
+        return state
+
+    def _current(self):
+        current = {}
+        for names, read, state in self._readers:
+            current.update(zip(names, read(state)))
+        return current
+
+    def _push(self, t, price):
+        for state in self.states.values():
+            state.push(price)
+        self.times.append(t)
+        self.prices.append(price)
+        self._sums.append(self._sums[-1] + price)
+        for key, val in self._current().items():
+            self.series[key].append(val)
+
+    def _replace_last(self, t, price):
+        for state in self.states.values():
+            state.replace_last(price)
+        self.times[-1] = t
+        self.prices[-1] = price
+        self._sums[-1] = self._sums[-2] + price
+        for key, val in self._current().items():
+            self.series[key][-1] = val
+
+    def sync(self, times, prices):
+        # Reanuda desde el estado guardado si `times`/`prices` continuan la serie
+        # conocida (la ventana de Yahoo puede haber avanzado por el inicio y la
+        # ultima barra puede haber cambiado). Devuelve False si hay que recalcular.
+        # Se comprueban la primera barra comun y la ultima cerrada (tiempo y
+        # precio) y la suma de los cierres solapados contra las sumas acumuladas:
+        # un split o un ajuste por dividendo reescribe tambien las de en medio.
+        cached = self.times
+        if len(cached) == self._start or not times:
+            return False
+        k = bisect_left(cached, times[0], self._start)
+        if k >= len(cached) or cached[k] != times[0]:
+            return False
+        closed = len(cached) - k - 1
+        if len(times) <= closed:
+            return False
+        if closed and (self.prices[k] != prices[0] or cached[-2] != times[closed - 1]
+                       or self.prices[-2] != prices[closed - 1]):
+            return False
+        if closed and not math.isclose(self._sums[-2] - self._sums[k], sum(prices[:closed]),
+                                       rel_tol=self.RESTATE_TOLERANCE, abs_tol=1e-12):
+            return False
+
+        self._start = k
+        if k > len(cached) // 2:
+            self._compact()
+        self._replace_last(times[closed], prices[closed])
+        for j in range(closed + 1, len(times)):
+            self._push(times[j], prices[j])
+        return True
+
+    def _compact(self):
+        # Listas nuevas sin lo que ya salio de la ventana (las vistas entregadas
+        # conservan las anteriores)
+        start = self._start
+        self.times = self.times[start:]
+        self.prices = self.prices[start:]
+        self._sums = self._sums[start:]
+        self.series = {key: values[start:] for key, values in self.series.items()}
+        self._start = 0
+
+    def snapshot(self):
+        # Vistas de la ventana actual, sin copiar las series en cada sondeo
+        start, stop = self._start, len(self.times)
+        return {key: SeriesView(values, start, stop) for key, values in self.series.items()}
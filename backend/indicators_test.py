@@ -0,0 +1,238 @@
+import math
+import random
+
+import data_test
+import indicators
+from indicators import to_list, LiveIndicators
+
+# Equivalencia del motor NumPy contra las implementaciones puras originales
+# y del estado incremental (LiveIndicators) contra el calculo completo.
+
+# --- Implementaciones de referencia (Pure Python, version anterior) ---
+
+def ref_sma(prices, period):
+    if len(prices) < period:
+        return [None] * len(prices)
+    sma = []
+    for i in range(len(prices)):
+        if i < period - 1:
+            sma.append(None)
+        else:
+            window = prices[i - period + 1 : i + 1]
+            sma.append(sum(window) / period)
+    return sma
+
+def ref_ema(data, window):
+    if len(data) < window:
+        return [None] * len(data)
+    sma_initial = sum(data[:window]) / window
+    ema = [None] * (window - 1) + [sma_initial]
+    multiplier = 2 / (window + 1)
+    for i in range(window, len(data)):
+        val = (data[i] - ema[-1]) * multiplier + ema[-1]
+        ema.append(val)
+    return ema
+
+def ref_rsi(prices, period=14):
+    if len(prices) < period + 1:
+        return [None] * len(prices)
+    rsi = [None] * len(prices)
+    deltas = [prices[i] - prices[i-1] for i in range(1, len(prices))]
+    avg_gain = 0
+    avg_loss = 0
+    for i in range(period):
+        if deltas[i] > 0:
+            avg_gain += deltas[i]
+        else:
+            avg_loss += abs(deltas[i])
+    avg_gain /= period
+    avg_loss /= period
+    if avg_loss == 0:
+        rsi[period] = 100
+    else:
+        rs = avg_gain / avg_loss
+        rsi[period] = 100 - (100 / (1 + rs))
+    for i in range(period + 1, len(prices)):
+        delta = deltas[i-1]
+        gain = delta if delta > 0 else 0
+        loss = abs(delta) if delta < 0 else 0
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+        if avg_loss == 0:
+            rsi[i] = 100
+        else:
+            rs = avg_gain / avg_loss
+            rsi[i] = 100 - (100 / (1 + rs))
+    return rsi
+
+def ref_std_dev(prices, period, sma_values):
+    if len(prices) < period:
+        return [None] * len(prices)
+    std_devs = [None] * len(prices)
+    for i in range(period - 1, len(prices)):
+        window = prices[i - period + 1 : i + 1]
+        mean = sma_values[i]
+        if mean is None:
+            continue
+        variance = sum([(p - mean) ** 2 for p in window]) / period
+        std_devs[i] = variance ** 0.5
+    return std_devs
+
+# --- Datos sinteticos ---
+
+def random_walk(n, start=100.0, vol=0.02, seed=7):
+    rng = random.Random(seed)
+    prices = [start]
+    for _ in range(n - 1):
+        prices.append(prices[-1] * (1 + rng.gauss(0, vol)))
+    return prices
+
+SERIES = {
+    "short": random_walk(10),
+    "daily_2y": random_walk(504),
+    "btc_like": random_walk(3000, start=60000.0, vol=0.04, seed=11),
+    "flat": [50.0] * 60,
+    "rising": [float(i) for i in range(1, 300)],
+    "intraday_big": random_walk(20000, seed=3),
+}
+
+def assert_close(got, expected, name, rel=1e-9, abs_tol=1e-9):
+    assert len(got) == len(expected), f"{name}: length {len(got)} != {len(expected)}"
+    for i, (g, e) in enumerate(zip(got, expected)):
+        if e is None:
+            assert g is None, f"{name}[{i}]: expected None, got {g}"
+        else:
+            assert g is not None, f"{name}[{i}]: expected {e}, got None"
+            assert math.isclose(g, e, rel_tol=rel, abs_tol=abs_tol), f"{name}[{i}]: {g} != {e}"
+
+# --- Tests ---
+
+def test_sma_equivalence():
+    for name, prices in SERIES.items():
+        for period in (1, 20, 50, 200):
+            assert_close(to_list(indicators.sma(prices, period)), ref_sma(prices, period), f"sma{period}/{name}")
+
+def test_ema_equivalence():
+    for name, prices in SERIES.items():
+        for window in (2, 12, 200):
+            assert_close(to_list(indicators.ema(prices, window)), ref_ema(prices, window), f"ema{window}/{name}")
+
+def test_rsi_equivalence():
+    for name, prices in SERIES.items():
+        for period in (7, 14):
+            assert_close(to_list(indicators.rsi(prices, period)), ref_rsi(prices, period), f"rsi{period}/{name}")
+
+def test_std_dev_equivalence():
+    for name, prices in SERIES.items():
+        sma_20 = ref_sma(prices, 20)
+        assert_close(to_list(indicators.std_dev(prices, 20, sma_20)), ref_std_dev(prices, 20, sma_20), f"std20/{name}")
+
+def test_bollinger_matches_sma_and_std():
+    prices = SERIES["daily_2y"]
+    mid, upper, lower = indicators.bollinger(prices, 20, 2)
+    sma_20 = ref_sma(prices, 20)
+    std_20 = ref_std_dev(prices, 20, sma_20)
+    assert_close(to_list(mid), sma_20, "bb_mid")
+    assert_close(to_list(upper), [m + 2 * s if m is not None else None for m, s in zip(sma_20, std_20)], "bb_upper")
+    assert_close(to_list(lower), [m - 2 * s if m is not None else None for m, s in zip(sma_20, std_20)], "bb_lower")
+
+def test_live_indicators_streaming_matches_batch():
+    prices = SERIES["btc_like"][:800]
+    times = list(range(len(prices)))
+    # Arranque en frio con 600 barras y luego sondeos: vela revisada + barras nuevas
+    live = LiveIndicators(times[:600], prices[:600])
+    for end in range(601, 800, 3):
+        revised = prices[:end - 1] + [prices[end - 1] * 1.001]
+        assert live.sync(times[:end], revised)
+        assert live.sync(times[:end], prices[:end])
+    expected = LiveIndicators(times[:799], prices[:799]).snapshot()
+    got = live.snapshot()
+    assert set(got) == set(expected)
+    for key in expected:
+        assert_close(got[key], expected[key], f"live/{key}", rel=1e-8, abs_tol=1e-6)
+
+def test_live_indicators_sliding_window():
+    prices = SERIES["daily_2y"]
+    times = list(range(len(prices)))
+    live = LiveIndicators(times[:400], prices[:400])
+    # La ventana de Yahoo avanza: se pierde la barra mas antigua y llega una nueva
+    assert live.sync(times[1:401], prices[1:401])
+    # Mismos valores que con toda la historia (el estado no olvida lo que sale)
+    expected = LiveIndicators(times[:401], prices[:401]).snapshot()
+    got = live.snapshot()
+    assert len(got["rsi"]) == 400
+    for key in expected:
+        assert_close(got[key], expected[key][1:], f"window/{key}", rel=1e-8, abs_tol=1e-6)
+    # Historia reescrita (ej. split): debe pedir recalculo
+    assert not live.sync(times[1:401], [p * 2 for p in prices[1:401]])
+
+def test_live_indicators_restated_history():
+    prices = SERIES["daily_2y"]
+    times = list(range(len(prices)))
+    live = LiveIndicators(times[:400], prices[:400])
+    # Ajuste en medio de la ventana (la primera y la ultima cerrada no cambian):
+    # hay que recalcular, y el recalculo coincide con el calculo en frio
+    restated = prices[:100] + [p * 0.97 for p in prices[100:300]] + prices[300:401]
+    assert not live.sync(times[1:401], restated[1:401])
+    # Una sola barra revisada tambien se detecta
+    revised = prices[:200] + [prices[200] + 0.01] + prices[201:401]
+    assert not live.sync(times[1:401], revised[1:401])
+
+    # Camino del analisis: estado caliente y luego historia reescrita = calculo en frio
+    data_test.live_indicator_series("RESTATE", "1d", times[:400], prices[:400])
+    warm = data_test.live_indicator_series("RESTATE", "1d", times[1:401], restated[1:401])
+    cold = LiveIndicators(times[1:401], restated[1:401]).snapshot()
+    for key, values in warm.items():
+        assert_close(values, cold[key], f"restated/{key}", rel=1e-8, abs_tol=1e-6)
+
+def test_live_indicators_warmup():
+    prices = SERIES["short"]
+    live = LiveIndicators(list(range(5)), prices[:5])
+    assert live.sync(list(range(10)), prices)
+    assert_close(live.snapshot()["rsi"], ref_rsi(prices), "live_short/rsi")
+    assert_close(live.snapshot()["sma_50"], ref_sma(prices, 50), "live_short/sma_50")
+
+def test_pipeline_custom_specs():
+    prices = SERIES["btc_like"][:800]
+    times = list(range(len(prices)))
+    specs = indicators.parse_specs("rsi7, sma100, bb30, sma20, ema12")
+    assert specs == ("rsi7", "sma100", "bb30", "sma20", "ema12")
+    assert indicators.spec_columns(specs, internal=False) == [
+        "rsi_7", "sma_100", "upper_band_30", "lower_band_30", "sma_20", "ema_12"]
+    for bad in ("macd", "sma1", "rsi5000", ""):
+        try:
+            indicators.parse_specs(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {bad!r}")
+    # Calculo vectorizado contra las referencias, y el estado incremental contra el vectorizado
+    live = LiveIndicators(times[:600], prices[:600], specs)
+    assert_close(live.series["rsi_7"], ref_rsi(prices[:600], 7), "pipeline/rsi_7")
+    assert_close(live.series["sma_100"], ref_sma(prices[:600], 100), "pipeline/sma_100")
+    assert_close(live.series["ema_12"], ref_ema(prices[:600], 12), "pipeline/ema_12")
+    for end in range(601, 801, 7):
+        assert live.sync(times[:end], prices[:end])
+    expected = LiveIndicators(times[:end], prices[:end], specs).snapshot()
+    assert set(expected) == {"rsi_7", "sma_100", "sma_30", "upper_band_30", "lower_band_30", "sma_20", "ema_12"}
+    for key, values in live.snapshot().items():
+        assert_close(values, expected[key], f"pipeline_live/{key}", rel=1e-8, abs_tol=1e-6)
+
+def test_live_snapshot_views():
+    prices = SERIES["daily_2y"]
+    times = list(range(len(prices)))
+    live = LiveIndicators(times[:300], prices[:300])
+    before = live.snapshot()
+    last_sma = before["sma_50"][-1]
+    # Vela en formacion corregida y barras nuevas: lo ya entregado no cambia
+    assert live.sync(times[:300], prices[:299] + [prices[299] * 1.05])
+    assert live.sync(times[:302], prices[:302])
+    assert len(before["sma_50"]) == 300 and before["sma_50"][-1] == last_sma
+    assert before["sma_50"][-3:][-1] == last_sma and list(before["sma_50"])[-1] == last_sma
+    assert_close(before["sma_50"], ref_sma(prices[:300], 50), "view/before")
+    # La ventana avanza hasta compactar las listas: vistas nuevas y viejas siguen bien
+    for start in range(1, 250):
+        assert live.sync(times[start:302 + start], prices[start:302 + start])
+    assert len(live.times) < 551  # compactadas
+    assert_close(live.snapshot()["rsi"], ref_rsi(prices[:551], 14)[249:], "view/after", abs_tol=1e-6)
+    assert_close(before["sma_50"], ref_sma(prices[:300], 50), "view/kept")
+    assert indicators.as_array(before["rsi"]).shape == (300,)
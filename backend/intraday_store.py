@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from bar_store import COLUMNS, empty_bars
+
+# Velas intradia (1m/5m/15m/1h) en memoria, no en disco: Yahoo solo sirve unos
+# dias/meses de historia intradia y se refrescan cada pocos segundos.
+#
+# Cada (symbol, interval) es un buffer de capacidad fija con columnas NumPy
+# paralelas (las mismas de bar_store) reservadas de antemano:
+#   - solo se anade por el final (o se corrige la ultima vela, en formacion);
+#     al pasar de `capacity` velas las mas antiguas salen de la ventana.
+#   - view() devuelve vistas de las columnas (slicing, sin copia) siempre
+#     contiguas: en vez de dar la vuelta como un anillo clasico, el buffer
+#     tiene un margen (SLACK) al final y, cuando se llena, las ultimas
+#     `capacity` velas se copian a columnas nuevas. Asi una vista entregada
+#     nunca ve sobrescrita una vela por el otro extremo.
+# Memoria por serie: (capacity + margen) * 48 bytes; el almacen expulsa las
+# series menos usadas si el total pasa de INTRADAY_MEMORY_MB.
+
+# intervalo -> (segundos por vela, rango de la descarga completa, capacidad en velas).
+# Capacidades para mercados 24/7 (cripto); una accion llena mucho menos.
+INTRADAY = {
+    "1m": (60, "5d", 5 * 1440),
+    "5m": (300, "1mo", 31 * 288),
+    "15m": (900, "1mo", 31 * 96),
+    "1h": (3600, "6mo", 183 * 24),
+}
+INTRADAY_MEMORY_MB = float(os.environ.get("INTRADAY_MEMORY_MB", "64"))
+SLACK = 0.25
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values())
+
+
+class BarRing:
+    def __init__(self, symbol, interval, capacity, slack=SLACK):
+        self.symbol = symbol
+        self.interval = interval
+        self.capacity = capacity
+        self.size = capacity + max(1, int(capacity * slack))
+        self.lock = threading.Lock()
+        self._cols = self._allocate()
+        self._start = 0  # Velas validas: [_start, _end)
+        self._end = 0
+        self.synced_at = 0
+        self.full_synced_at = 0
+
+    def _allocate(self):
+        return {name: np.empty(self.size, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    @property
+    def rows(self):
+        return self._end - self._start
+
+    @property
+    def nbytes(self):
+        return self.size * ROW_BYTES
+
+    def last_time(self):
+        with self.lock:
+            return int(self._cols["time"][self._end - 1]) if self._end > self._start else None
+
+    def age(self):
+        return time.time() - self.synced_at
+
+    def full_age(self):
+        return time.time() - self.full_synced_at
+
+    # --- Lectura (sin copia) ---
+
+    def view(self, n=None):
+        # Ultimas n velas (todas por defecto), solo lectura
+        with self.lock:
+            if self._end == self._start:
+                return empty_bars()
+            start = self._start if n is None else max(self._start, self._end - n)
+            bars = {name: col[start:self._end] for name, col in self._cols.items()}
+        for col in bars.values():
+            col.flags.writeable = False
+        return bars
+
+    # --- Escritura ---
+
+    def replace(self, bars):
+        # Descarga completa: columnas nuevas (las vistas ya entregadas no cambian)
+        n = len(bars["time"])
+        keep = min(n, self.capacity)
+        cols = self._allocate()
+        for name, col in cols.items():
+            col[:keep] = np.asarray(bars[name])[n - keep:]
+        with self.lock:
+            self._cols, self._start, self._end = cols, 0, keep
+            self.synced_at = self.full_synced_at = time.time()
+
+    def append(self, bars):
+        # Las velas que empiezan en o antes de la ultima guardada la corrigen
+        # (vela en formacion); el resto se anade
+        new_times = np.asarray(bars["time"], dtype=np.int64)
+        n = len(new_times)
+        if n >= self.capacity:
+            full_synced_at = self.full_synced_at
+            self.replace(bars)
+            self.full_synced_at = full_synced_at
+            return
+        with self.lock:
+            if n:
+                stored = self._cols["time"][self._start:self._end]
+                at = self._start + int(np.searchsorted(stored, new_times[0], side="left"))
+                end = at + n
+                if end > self.size:
+                    # Sin hueco al final: las ultimas velas a columnas nuevas
+                    keep = min(at - self._start, self.capacity - n)
+                    cols = self._allocate()
+                    for name, col in self._cols.items():
+                        cols[name][:keep] = col[at - keep:at]
+                    self._cols, self._start, self._end = cols, 0, keep
+                    at, end = keep, keep + n
+                for name, col in self._cols.items():
+                    col[at:end] = np.asarray(bars[name])
+                self._end = max(self._end, end)
+                self._start = max(self._start, self._end - self.capacity)
+            self.synced_at = time.time()
+
+
+class IntradayStore:
+    def __init__(self, budget_mb=INTRADAY_MEMORY_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self._rings = OrderedDict()  # (symbol, interval) -> BarRing, LRU
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evictions": 0}
+
+    def get(self, symbol, interval):
+        key = (symbol, interval)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = BarRing(symbol, interval, INTRADAY[interval][2])
+                self._stats["created"] += 1
+                # Presupuesto de memoria: fuera las series menos usadas (nunca la recien creada)
+                used = sum(r.nbytes for r in self._rings.values())
+                while used > self.budget and len(self._rings) > 1:
+                    _, evicted = self._rings.popitem(last=False)
+                    used -= evicted.nbytes
+                    self._stats["evictions"] += 1
+            self._rings.move_to_end(key)
+            return ring
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["series"] = len(self._rings)
+            stats["rows"] = sum(r.rows for r in self._rings.values())
+            stats["bytes"] = sum(r.nbytes for r in self._rings.values())
+            stats["budget_bytes"] = self.budget
+            return stats
+
+
+# Velas intradia de todo el proceso
+intraday_store = IntradayStore()
@@ -0,0 +1,56 @@
+import numpy as np
+
+import intraday_store
+from intraday_store import BarRing, IntradayStore
+
+# Buffer intradia: capacidad fija, correccion de la vela en formacion, vistas
+# sin copia que no cambian al compactar y presupuesto de memoria del almacen.
+
+
+def bars(start, n, step=60, close=None):
+    times = np.arange(start, start + n * step, step, dtype=np.int64)
+    closes = np.arange(n, dtype=np.float64) + 100 if close is None else np.full(n, close, dtype=np.float64)
+    return {"time": times, "open": closes, "high": closes + 1, "low": closes - 1, "close": closes,
+            "volume": np.full(n, 10, dtype=np.int64)}
+
+
+def test_capacity_and_forming_bar():
+    ring = BarRing("BTC-USD", "1m", capacity=100, slack=0.1)
+    ring.replace(bars(0, 150))
+    view = ring.view()
+    assert ring.rows == 100 and view["time"][0] == 50 * 60 and view["time"][-1] == 149 * 60
+    assert not view["close"].flags.writeable
+    assert np.shares_memory(view["close"], ring.view(10)["close"])  # vistas, no copias
+
+    # Ultima vela corregida + una nueva: la mas antigua sale de la ventana
+    ring.append(bars(149 * 60, 2, close=7.0))
+    view = ring.view()
+    assert ring.rows == 100 and view["time"][0] == 51 * 60 and view["time"][-1] == 150 * 60
+    assert view["close"][-2] == 7.0 and view["close"][-1] == 7.0
+
+
+def test_views_survive_compaction():
+    ring = BarRing("AAPL", "5m", capacity=50, slack=0.2)
+    ring.replace(bars(0, 50, step=300))
+    before = ring.view()
+    snapshot = np.array(before["close"])
+    for i in range(50, 200):
+        ring.append(bars(i * 300, 1, step=300, close=float(i)))
+    # Varias compactaciones: la vista antigua sigue intacta, la nueva es contigua
+    assert np.array_equal(before["close"], snapshot)
+    view = ring.view()
+    assert ring.rows == 50 and list(view["close"][-3:]) == [197.0, 198.0, 199.0]
+    assert (np.diff(view["time"]) == 300).all()
+
+
+def test_store_memory_budget():
+    capacity = intraday_store.INTRADAY["1m"][2]
+    one = BarRing("X", "1m", capacity).nbytes
+    store = IntradayStore(budget_mb=2.5 * one / (1024 * 1024))
+    a = store.get("A", "1m")
+    b = store.get("B", "1m")
+    store.get("A", "1m")  # A pasa a ser la mas reciente: al crear C sale B
+    store.get("C", "1m")
+    stats = store.stats()
+    assert stats["series"] == 2 and stats["evictions"] == 1 and stats["bytes"] <= stats["budget_bytes"]
+    assert store.get("A", "1m") is a and store.get("B", "1m") is not b
@@ -1,22 +1,442 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from data_test import analyze_symbol
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from data_test import (INTERVALS, analyze_symbol_async, analysis_flight, fundamentals_store, load_bars_async,
+                       fetch_recommendations_async, fetch_news_async)
+from cache import upstream_cache
+from shared_cache import shared_store
+from intraday_store import intraday_store
+from http_pool import http_pool
+import formats
+from indicators import parse_specs
+import metrics
+import prefetch
+import throttle
+from stream_hub import StreamHub
+import scanner
+import backtest
+import correlation
+
+# Simbolos analizados en paralelo por /analyze/batch (tope configurable)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_SYMBOLS = int(os.environ.get("BATCH_MAX_SYMBOLS", "100"))
 
 app = FastAPI()
 
+# Live mode: una tarea de polling por (symbol, interval), compartida por todos los clientes
+stream_hub = StreamHub(analyze_symbol_async)
+
+# Screener: velas del almacen local + fundamentales ya guardados (sin cargas en frio)
+market_scanner = scanner.Scanner(load_bars_async, fundamentals_store.peek)
+backtester = backtest.Backtester(load_bars_async)
+# Matrices de correlacion/covarianza de carteras, en cache hasta la siguiente vela
+correlator = correlation.Correlator(load_bars_async)
+
+# Watchlists precargadas en segundo plano (velas, fundamentales, recomendaciones, noticias)
+prefetcher = prefetch.Prefetcher({
+    "chart": load_bars_async,
+    "fundamentals": lambda symbol: asyncio.to_thread(fundamentals_store.get, symbol),
+    "recommendations": fetch_recommendations_async,
+    "news": fetch_news_async,
+})
+
+@app.on_event("startup")
+async def start_prefetch():
+    prefetcher.load()
+    for universe in filter(None, (u.strip() for u in prefetch.PREFETCH_WATCHLISTS.split(","))):
+        try:
+            prefetcher.register(universe, scanner.load_universe(universe), persist=False)
+        except KeyError:
+            print(f"Unknown prefetch universe: {universe}")
+        except ValueError as e:
+            print(f"Prefetch universe {universe} skipped: {e}")
+    prefetcher.start()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
+# Latencias por ruta + cabecera Server-Timing (va por fuera de CORS: mide todo)
+app.add_middleware(metrics.MetricsMiddleware)
+
+class BatchRequest(BaseModel):
+    symbols: List[str]
+    interval: str = "1d"
+    concurrency: Optional[int] = None
+    stream: bool = False
+    format: str = "rows"
+    indicators: Optional[str] = None
+
+class ScanRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    universe: Optional[str] = None
+    interval: str = "1d"
+    signal: Optional[str] = None
+    trend: Optional[str] = None
+    buffett: Optional[bool] = None
+    exclude_burry: bool = False
+    min_rsi: Optional[float] = None
+    max_rsi: Optional[float] = None
+    sort: str = "score"
+    limit: Optional[int] = None
+    stream: bool = False
+
+async def _analyze_isolated(symbol, interval, semaphore, specs=None):
+    # Un simbolo que falla no debe tumbar el lote
+    try:
+        async with semaphore:
+            return await analyze_symbol_async(symbol, interval, specs)
+    except Exception as e:
+        print(f"Batch error ({symbol}): {e}")
+        return {"symbol": symbol, "status": "error", "data": None, "signal": "N/A", "detail": str(e)}
+
+def _parse_symbols(symbols, max_symbols=BATCH_MAX_SYMBOLS):
+    cleaned = []
+    for s in symbols:
+        s = s.strip().upper()
+        if s and s not in cleaned:
+            cleaned.append(s)
+    if not cleaned:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(cleaned) > max_symbols:
+        raise HTTPException(status_code=400, detail=f"Too many symbols (max {max_symbols})")
+    return cleaned
+
+def _check_format(fmt):
+    if fmt not in formats.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format (use one of {', '.join(formats.FORMATS)})")
+    return fmt
+
+def _check_interval(interval):
+    # Cada intervalo abre una serie en bar_store (y un directorio al escribir)
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unknown interval (use one of {', '.join(INTERVALS)})")
+    return interval
+
+def _parse_indicators(text):
+    # indicators=rsi,bb20,sma100 -> solo esos en el historial (None: los de siempre)
+    if text is None:
+        return None
+    try:
+        return parse_specs(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def respond(request, payload, encoding=None):
+    # JSON rapido (orjson) por defecto; MessagePack con ?encoding=msgpack o Accept.
+    # ETag = hash del cuerpo: si el cliente ya lo tiene (If-None-Match) -> 304.
+    if encoding is None:
+        encoding = "msgpack" if formats.MEDIA_TYPES["msgpack"] in request.headers.get("accept", "") else "json"
+    if encoding not in formats.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unknown encoding (use json or msgpack)")
+    if encoding == "msgpack" and formats.msgpack is None:
+        raise HTTPException(status_code=406, detail="msgpack encoding is not available")
+    with metrics.span("encode"):
+        body = formats.encode(payload, encoding)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type=formats.MEDIA_TYPES[encoding], headers={"ETag": etag})
+
+async def _run_batch(request, symbols, interval, concurrency=None, stream=False, fmt="rows", encoding=None,
+                     indicator_specs=None):
+    symbols = _parse_symbols(symbols)
+    _check_format(fmt)
+    _check_interval(interval)
+    specs = _parse_indicators(indicator_specs)
+    semaphore = asyncio.Semaphore(max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)))
+
+    if stream:
+        # NDJSON: una linea por simbolo en cuanto termina
+        async def generate():
+            tasks = [asyncio.ensure_future(_analyze_isolated(s, interval, semaphore, specs)) for s in symbols]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield formats.encode(formats.format_result(await next_done, fmt)) + b"\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*(_analyze_isolated(s, interval, semaphore, specs) for s in symbols))
+    with metrics.span("format"):
+        formatted = [formats.format_result(r, fmt) for r in results]
+    return respond(request, {
+        "interval": interval,
+        "count": len(results),
+        "errors": sum(1 for r in results if r.get("status") != "ok"),
+        "results": formatted,
+    }, encoding)
+
+class BacktestRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    universe: Optional[str] = None
+    interval: str = "1d"
+    buy_rsi: Optional[List[float]] = None
+    sell_rsi: Optional[List[float]] = None
+    buy_margin: Optional[List[float]] = None
+    sell_margin: Optional[List[float]] = None
+    max_hold: int = backtest.MAX_HOLD
+    trades: bool = False
+
+class WatchlistRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    universe: Optional[str] = None
+    intervals: List[str] = ["1d"]
+
+def _universe_symbols(symbols, universe):
+    if universe:
+        try:
+            symbols = scanner.load_universe(universe)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown universe: {universe}")
+    return _parse_symbols(symbols or [], scanner.SCAN_MAX_SYMBOLS)
+
+def _float_list(values):
+    # "35,40,45" -> [35.0, 40.0, 45.0]
+    if not values:
+        return None
+    try:
+        return [float(v) for v in values.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid number list: {values}")
+
+async def _run_backtest(request, req):
+    symbols = _universe_symbols(req.symbols, req.universe)
+    _check_interval(req.interval)
+    # Scans y backtests descargan mucho: pasan detras de las requests interactivas
+    throttle.set_priority(throttle.BACKGROUND)
+    grid = backtest.param_grid(buy_rsi=req.buy_rsi, sell_rsi=req.sell_rsi,
+                               buy_margin=req.buy_margin, sell_margin=req.sell_margin)
+    if len(grid) > backtest.BACKTEST_MAX_COMBOS:
+        raise HTTPException(status_code=400, detail=f"Too many parameter combinations (max {backtest.BACKTEST_MAX_COMBOS})")
+    if not 1 <= req.max_hold <= backtest.MAX_HOLD_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_hold must be between 1 and {backtest.MAX_HOLD_LIMIT}")
+    return respond(request, await backtester.run(symbols, req.interval, grid, req.max_hold, req.trades))
+
+async def _run_scan(request, req):
+    symbols = _universe_symbols(req.symbols, req.universe)
+    _check_interval(req.interval)
+    throttle.set_priority(throttle.BACKGROUND)
+    if req.sort not in scanner.SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort (use one of {', '.join(scanner.SORT_KEYS)})")
+    filters = dict(signal=req.signal, trend=req.trend, buffett=req.buffett, exclude_burry=req.exclude_burry,
+                   min_rsi=req.min_rsi, max_rsi=req.max_rsi)
+    started = time.time()
+
+    if req.stream:
+        # NDJSON: filas que pasan el filtro segun termina cada trozo, y un resumen final
+        async def generate():
+            throttle.set_priority(throttle.BACKGROUND)
+            scanned = matched = errors = unknown = 0
+            async for rows in market_scanner.scan(symbols, req.interval):
+                scanned += len(rows)
+                errors += sum(1 for r in rows if r.get("status") != "ok")
+                unknown += scanner.count_unknown(rows)
+                for row in scanner.rank(scanner.filter_rows(rows, **filters), req.sort):
+                    matched += 1
+                    yield formats.encode(row) + b"\n"
+            yield formats.encode({"done": True, "scanned": scanned, "matched": matched, "errors": errors,
+                                  "unknown_fundamentals": unknown, "elapsed": time.time() - started}) + b"\n"
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    rows = []
+    async for chunk in market_scanner.scan(symbols, req.interval):
+        rows.extend(chunk)
+    matched = scanner.rank(scanner.filter_rows(rows, **filters), req.sort, req.limit)
+    return respond(request, {
+        "interval": req.interval,
+        "scanned": len(rows),
+        "errors": sum(1 for r in rows if r.get("status") != "ok"),
+        "unknown_fundamentals": scanner.count_unknown(rows),
+        "matched": len(matched),
+        "elapsed": time.time() - started,
+        "results": matched,
+    })
 
 @app.get("/")
 def read_root():
     return {"message": "Trade Dashboard API is running"}
 
+@app.get("/analyze/batch")
+async def get_batch_analysis(request: Request, symbols: str, interval: str = "1d", concurrency: Optional[int] = None,
+                             stream: bool = False, format: str = "rows", encoding: Optional[str] = None,
+                             indicators: Optional[str] = None):
+    return await _run_batch(request, symbols.split(","), interval, concurrency, stream, format, encoding, indicators)
+
+@app.post("/analyze/batch")
+async def post_batch_analysis(request: Request, req: BatchRequest, encoding: Optional[str] = None):
+    return await _run_batch(request, req.symbols, req.interval, req.concurrency, req.stream, req.format, encoding,
+                            req.indicators)
+
+@app.get("/scan/universes")
+def get_scan_universes():
+    return {"universes": scanner.list_universes()}
+
+@app.get("/scan")
+async def get_scan(request: Request, symbols: Optional[str] = None, universe: Optional[str] = None, interval: str = "1d",
+                   signal: Optional[str] = None, trend: Optional[str] = None, buffett: Optional[bool] = None,
+                   exclude_burry: bool = False, min_rsi: Optional[float] = None, max_rsi: Optional[float] = None,
+                   sort: str = "score", limit: Optional[int] = None, stream: bool = False):
+    req = ScanRequest(symbols=symbols.split(",") if symbols else None, universe=universe, interval=interval,
+                      signal=signal, trend=trend, buffett=buffett, exclude_burry=exclude_burry,
+                      min_rsi=min_rsi, max_rsi=max_rsi, sort=sort, limit=limit, stream=stream)
+    return await _run_scan(request, req)
+
+@app.post("/scan")
+async def post_scan(request: Request, req: ScanRequest):
+    return await _run_scan(request, req)
+
+@app.get("/backtest")
+async def get_backtest(request: Request, symbols: Optional[str] = None, universe: Optional[str] = None,
+                       interval: str = "1d", buy_rsi: Optional[str] = None, sell_rsi: Optional[str] = None,
+                       buy_margin: Optional[str] = None, sell_margin: Optional[str] = None,
+                       max_hold: int = backtest.MAX_HOLD, trades: bool = False):
+    # Rejillas como listas separadas por comas: buy_rsi=35,40,45
+    req = BacktestRequest(symbols=symbols.split(",") if symbols else None, universe=universe, interval=interval,
+                          buy_rsi=_float_list(buy_rsi), sell_rsi=_float_list(sell_rsi),
+                          buy_margin=_float_list(buy_margin), sell_margin=_float_list(sell_margin),
+                          max_hold=max_hold, trades=trades)
+    return await _run_backtest(request, req)
+
+@app.post("/backtest")
+async def post_backtest(request: Request, req: BacktestRequest):
+    return await _run_backtest(request, req)
+
+@app.get("/correlation")
+async def get_correlation(request: Request, symbols: str, interval: str = "1d", window: Optional[int] = None,
+                          encoding: Optional[str] = None):
+    # window: velas de la ventana movil (por defecto ~1 ano; 0 = todo el rango cargado)
+    symbols = _parse_symbols(symbols.split(","), correlation.CORRELATION_MAX_SYMBOLS)
+    if len(symbols) < 2:
+        raise HTTPException(status_code=400, detail="At least 2 symbols are needed")
+    if interval not in correlation.INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unknown interval (use {', '.join(correlation.INTERVALS)})")
+    if window is not None and window < 0:
+        raise HTTPException(status_code=400, detail="window must be >= 0")
+    return respond(request, await correlator.run(symbols, interval, window), encoding)
+
+@app.get("/correlation/stats")
+def get_correlation_stats():
+    return correlator.stats()
+
 @app.get("/analyze/{symbol}")
-def get_analysis(symbol: str, interval: str = "1d"):
-    data = analyze_symbol(symbol, interval)
-    return data
+async def get_analysis(request: Request, symbol: str, interval: str = "1d", format: str = "rows",
+                       encoding: Optional[str] = None, since: Optional[int] = None,
+                       indicators: Optional[str] = None):
+    # since=<epoch>: solo las velas desde ese instante (modo live)
+    # indicators=rsi,bb20,sma100: solo esos indicadores en el historial
+    _check_format(format)
+    _check_interval(interval)
+    data = await analyze_symbol_async(symbol, interval, _parse_indicators(indicators))
+    with metrics.span("format"):
+        payload = formats.format_result(data, format, since)
+    return respond(request, payload, encoding)
+
+@app.get("/stream/stats")
+def get_stream_stats():
+    return stream_hub.stats()
+
+@app.get("/stream/{symbol}")
+async def stream_analysis(symbol: str, interval: str = "1d", indicators: Optional[str] = None):
+    # Server-Sent Events: snapshot inicial + deltas (ver stream_hub.py)
+    _check_interval(interval)
+    specs = _parse_indicators(indicators)
+    async def events():
+        async for name, payload in stream_hub.subscribe(symbol, interval, specs):
+            if payload is None:
+                yield b": ping\n\n"
+            else:
+                yield b"event: " + name.encode() + b"\ndata: " + formats.encode(payload) + b"\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/watchlists")
+def get_watchlists():
+    return {"watchlists": prefetcher.watchlists}
+
+@app.put("/watchlists/{name}")
+async def put_watchlist(name: str, req: WatchlistRequest):
+    # Registra (o reemplaza) una watchlist para mantenerla precargada. Async: el
+    # prefetcher vive en el event loop
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise HTTPException(status_code=400, detail="Invalid watchlist name")
+    symbols = _parse_symbols(_universe_symbols(req.symbols, req.universe), prefetch.PREFETCH_MAX_SYMBOLS)
+    intervals = list(dict.fromkeys(req.intervals))
+    unknown = [i for i in intervals if i not in prefetch.INTERVALS]
+    if unknown or not intervals:
+        raise HTTPException(status_code=400, detail=f"Unknown interval (use {', '.join(prefetch.INTERVALS)})")
+    try:
+        prefetcher.register(name, symbols, intervals)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"name": name, "symbols": symbols, "intervals": intervals}
+
+@app.delete("/watchlists/{name}")
+async def delete_watchlist(name: str):
+    try:
+        prefetcher.unregister(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown watchlist: {name}")
+    return {"deleted": name}
+
+@app.get("/prefetch/stats")
+def get_prefetch_stats():
+    return prefetcher.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    stats = upstream_cache.stats()
+    if shared_store is not None:
+        stats["shared_store"] = shared_store.stats()
+    return stats
+
+@app.get("/intraday/stats")
+def get_intraday_stats():
+    return intraday_store.stats()
+
+@app.get("/http/stats")
+def get_http_stats():
+    return http_pool.metrics()
+
+@app.get("/singleflight/stats")
+def get_singleflight_stats():
+    return analysis_flight.stats()
+
+@app.get("/fundamentals/stats")
+def get_fundamentals_stats():
+    return fundamentals_store.stats()
+
+@app.get("/upstream/stats")
+def get_upstream_stats():
+    return throttle.scheduler.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    # Formato de texto de Prometheus: metricas propias + stats de cada componente
+    lines = metrics.registry.render()
+    lines += metrics.render_stats("cache", upstream_cache.stats(), {"by_kind": "kind"})
+    if shared_store is not None:
+        lines += metrics.render_stats("shared_cache", shared_store.stats())
+    lines += metrics.render_stats("http_pool", http_pool.metrics(), {"http_versions": "version"})
+    lines += metrics.render_stats("singleflight", analysis_flight.stats())
+    lines += metrics.render_stats("fundamentals", fundamentals_store.stats())
+    lines += metrics.render_stats("stream", stream_hub.stats())
+    lines += metrics.render_stats("prefetch", prefetcher.stats(), {"by_kind": "kind"})
+    lines += metrics.render_stats("correlation", correlator.stats())
+    lines += metrics.render_stats("intraday", intraday_store.stats())
+    lines += metrics.render_stats("upstream", throttle.scheduler.stats(),
+                                  {"queue_depth": "priority", "hosts": "host"})
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
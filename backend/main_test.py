@@ -0,0 +1,104 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import main
+
+# Respuestas de la API (ETag del cuerpo y 304 si el cliente ya lo tiene) y
+# /analyze/batch con un analisis falso: concurrencia acotada y errores aislados.
+
+
+def request(**headers):
+    return Request({"type": "http", "method": "GET", "path": "/",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_etag_not_modified():
+    payload = {"symbol": "AAPL", "status": "ok", "current_price": 101.5}
+    first = main.respond(request(), payload)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.body and etag.startswith('W/"')
+
+    again = main.respond(request(if_none_match=etag), payload)
+    assert again.status_code == 304 and again.body == b"" and again.headers["etag"] == etag
+
+    # Otro contenido (o un ETag antiguo): cuerpo completo
+    changed = main.respond(request(if_none_match=etag), dict(payload, current_price=102.0))
+    assert changed.status_code == 200 and changed.body and changed.headers["etag"] != etag
+
+
+def fake_analysis(monkeypatch, delay=0.02):
+    running = {"now": 0, "max": 0}
+    calls = []
+
+    async def analyze(symbol, interval, specs=None):
+        calls.append(symbol)
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        try:
+            await asyncio.sleep(delay)
+            if symbol == "BAD":
+                raise ValueError("No valid data found")
+            return {"symbol": symbol, "interval": interval, "status": "ok", "signal": "ESPERA"}
+        finally:
+            running["now"] -= 1
+    monkeypatch.setattr(main, "analyze_symbol_async", analyze)
+    return calls, running
+
+
+def test_batch_concurrency_and_errors(monkeypatch):
+    calls, running = fake_analysis(monkeypatch)
+    symbols = ["aapl", " msft", "AAPL", "BAD", "nvda", "tsla", ""]
+    response = asyncio.run(main._run_batch(request(), symbols, "1d", concurrency=2))
+    body = orjson.loads(response.body)
+    assert sorted(calls) == ["AAPL", "BAD", "MSFT", "NVDA", "TSLA"]  # normalizados y sin repetir
+    assert running["max"] == 2
+    # Mismo orden que la peticion; el simbolo que falla no tumba el lote
+    assert [r["symbol"] for r in body["results"]] == ["AAPL", "MSFT", "BAD", "NVDA", "TSLA"]
+    assert body["count"] == 5 and body["errors"] == 1
+    assert body["results"][2]["status"] == "error" and "No valid data" in body["results"][2]["detail"]
+
+    # Nunca por encima del tope del servidor
+    calls.clear()
+    running["max"] = 0
+    asyncio.run(main._run_batch(request(), [f"S{i}" for i in range(20)], "1d", concurrency=1000))
+    assert running["max"] == main.BATCH_CONCURRENCY
+
+
+def test_batch_stream_and_validation(monkeypatch):
+    fake_analysis(monkeypatch)
+
+    async def collect():
+        response = await main._run_batch(request(), ["AAPL", "BAD", "MSFT"], "1d", stream=True)
+        return [orjson.loads(line) async for line in response.body_iterator]
+    lines = asyncio.run(collect())
+    assert sorted(r["symbol"] for r in lines) == ["AAPL", "BAD", "MSFT"]
+    assert sum(r["status"] == "error" for r in lines) == 1
+
+    for symbols in ([], [" "], [f"S{i}" for i in range(main.BATCH_MAX_SYMBOLS + 1)]):
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(main._run_batch(request(), symbols, "1d"))
+        assert e.value.status_code == 400
+    with pytest.raises(HTTPException):
+        asyncio.run(main._run_batch(request(), ["AAPL"], "1d", fmt="xml"))
+
+
+def test_backtest_max_hold_bounds():
+    for max_hold in (0, main.backtest.MAX_HOLD_LIMIT + 1):
+        req = main.BacktestRequest(symbols=["AAPL"], max_hold=max_hold)
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(main._run_backtest(request(), req))
+        assert e.value.status_code == 400
+
+
+def test_unknown_interval_rejected():
+    for call in (main._run_batch(request(), ["AAPL"], "7d"),
+                 main._run_scan(request(), main.ScanRequest(symbols=["AAPL"], interval="../x")),
+                 main._run_backtest(request(), main.BacktestRequest(symbols=["AAPL"], interval="2h")),
+                 main.get_analysis(request(), "AAPL", interval="1y")):
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(call)
+        assert e.value.status_code == 400 and "Unknown interval" in e.value.detail
@@ -0,0 +1,227 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentacion ligera (sin dependencias): contadores e histogramas en memoria
+# que /metrics expone en formato de texto de Prometheus, mas los tiempos por
+# etapa de cada request, que van en la cabecera Server-Timing.
+#
+#   with metrics.span("chart"): ...          # etapa: histograma + Server-Timing
+#   await metrics.atimed("news", coro)       # idem para una corrutina
+#   with metrics.upstream("chart"): ...      # llamada a Yahoo: contador + latencia
+#
+# El coste por span es un par de perf_counter y un dict bajo lock (~1-2 us), asi
+# que se deja siempre activo. Los spans de una request se acumulan en un dict que
+# vive en un ContextVar: asyncio.to_thread y las tareas copian el contexto, asi
+# que el trabajo hecho en hilos o en gather cuenta para la request que lo lanzo.
+
+PREFIX = "trade"
+
+# Limites (segundos) de los histogramas: de etapas de microsegundos a descargas lentas
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tiempos de la request en curso: etapa -> segundos (None fuera de una request)
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # el ultimo es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}    # (nombre, labels) -> valor
+        self._histograms = {}  # (nombre, labels) -> _Histogram
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        # labels: tupla de pares (clave, valor), en orden fijo
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(self.buckets)
+            hist.counts[i] += 1
+            hist.sum += seconds
+            hist.count += 1
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(h.counts), h.sum, h.count)) for k, h in self._histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name, default_kind):
+            if name not in seen:
+                seen.add(name)
+                kind, text = self._help.get(name, (default_kind, ""))
+                if text:
+                    lines.append(f"# HELP {PREFIX}_{name} {text}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}_{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{PREFIX}_{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+# Registro compartido por todo el proceso
+registry = Registry()
+registry.describe("http_requests_total", "counter", "HTTP requests by route, method and status")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency by route")
+registry.describe("stage_duration_seconds", "histogram", "Time spent in each analysis stage")
+registry.describe("upstream_requests_total", "counter", "Upstream (Yahoo/yfinance) calls by source and outcome")
+registry.describe("upstream_duration_seconds", "histogram", "Upstream (Yahoo/yfinance) call latency by source")
+
+
+# --- Spans ---
+
+def _record(stage, seconds):
+    registry.observe("stage_duration_seconds", (("stage", stage),), seconds)
+    timings = _timings.get()
+    if timings is not None:
+        # Varias veces la misma etapa (lotes) -> se suma
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+async def atimed(stage, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def upstream(source):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        registry.observe("upstream_duration_seconds", (("source", source),), time.perf_counter() - start)
+        registry.inc("upstream_requests_total", (("source", source), ("outcome", outcome)))
+
+
+def detach():
+    # Las tareas de fondo (polling del stream) no cuentan para la request que las creo
+    _timings.set(None)
+
+
+def server_timing(timings, total):
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# --- Estadisticas de los componentes (cache, pool HTTP...) ---
+
+def render_stats(name, stats, labels=None):
+    # Dict de stats() -> gauges trade_<name>_<clave>. Los dicts anidados listados
+    # en `labels` ({"by_kind": "kind"}) se exponen con esa etiqueta
+    # (trade_cache_by_kind_hits{kind="chart"}); el resto de valores no numericos
+    # se omite.
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)):
+            lines.append(f"{PREFIX}_{name}_{key} {_number(value)}")
+        elif isinstance(value, dict) and key in (labels or {}):
+            label = labels[key]
+            for item, sub in value.items():
+                if isinstance(sub, dict):
+                    for sub_key, sub_value in sub.items():
+                        if isinstance(sub_value, (int, float)):
+                            lines.append(f"{PREFIX}_{name}_{key}_{sub_key}{_labels(((label, item),))} {_number(sub_value)}")
+                elif isinstance(sub, (int, float)):
+                    lines.append(f"{PREFIX}_{name}_{key}{_labels(((label, item),))} {_number(sub)}")
+    return lines
+
+
+# --- Middleware ASGI ---
+
+class MetricsMiddleware:
+    # Latencia y contador por ruta (la plantilla, p.ej. /analyze/{symbol}, para no
+    # disparar la cardinalidad) y cabecera Server-Timing con las etapas medidas.
+    # ASGI puro: no envuelve el cuerpo, asi que no afecta a las respuestas en streaming.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        timings = {}
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - start).encode("latin-1")
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header)])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            registry.observe("http_request_duration_seconds", (("route", route), ("method", method)),
+                             time.perf_counter() - start)
+            registry.inc("http_requests_total", (("route", route), ("method", method), ("status", str(status))))
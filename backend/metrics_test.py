@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+# Instrumentacion: formato de texto de Prometheus, spans que se suman a la
+# request en curso (tambien desde hilos y gather), contadores de Yahoo,
+# gauges de stats() y la cabecera Server-Timing del middleware.
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry(buckets=(0.01, 0.1))
+    registry.describe("stage_duration_seconds", "histogram", "Time spent in each analysis stage")
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_render_prometheus(registry):
+    registry.inc("hits_total", (("kind", 'a"b'),))
+    registry.inc("hits_total", (("kind", 'a"b'),), 2)
+    for seconds in (0.005, 0.05, 3.0):
+        registry.observe("stage_duration_seconds", (("stage", "chart"),), seconds)
+    assert registry.render() == [
+        "# TYPE trade_hits_total counter",
+        'trade_hits_total{kind="a\\"b"} 3',
+        "# HELP trade_stage_duration_seconds Time spent in each analysis stage",
+        "# TYPE trade_stage_duration_seconds histogram",
+        'trade_stage_duration_seconds_bucket{stage="chart",le="0.01"} 1',
+        'trade_stage_duration_seconds_bucket{stage="chart",le="0.1"} 2',
+        'trade_stage_duration_seconds_bucket{stage="chart",le="+Inf"} 3',
+        'trade_stage_duration_seconds_sum{stage="chart"} 3.055',
+        'trade_stage_duration_seconds_count{stage="chart"} 3',
+    ]
+
+
+def test_spans_add_up_per_request(registry):
+    def in_thread():
+        with metrics.span("news"):
+            pass
+
+    async def request():
+        timings = {}
+        metrics._timings.set(timings)
+        with metrics.span("format"):
+            pass
+        # Etapas en hilos y en gather cuentan para la request; repetidas se suman
+        await asyncio.gather(metrics.atimed("chart", asyncio.sleep(0.02)),
+                             metrics.atimed("chart", asyncio.sleep(0.02)),
+                             asyncio.to_thread(in_thread))
+        return timings
+
+    timings = asyncio.run(request())
+    assert set(timings) == {"format", "chart", "news"} and timings["chart"] >= 0.04
+    assert metrics._timings.get() is None  # fuera de una request no se acumula nada
+    with metrics.span("format"):
+        pass
+    lines = registry.render()
+    assert 'trade_stage_duration_seconds_count{stage="chart"} 2' in lines
+    assert 'trade_stage_duration_seconds_count{stage="format"} 2' in lines
+
+
+def test_upstream_outcomes(registry):
+    with metrics.upstream("chart"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.upstream("chart"):
+            raise ValueError("404")
+    lines = registry.render()
+    assert 'trade_upstream_requests_total{source="chart",outcome="ok"} 1' in lines
+    assert 'trade_upstream_requests_total{source="chart",outcome="error"} 1' in lines
+    assert 'trade_upstream_duration_seconds_count{source="chart"} 2' in lines
+
+
+def test_render_stats():
+    stats = {"hits": 3, "ratio": 0.5, "alive": True, "name": "x",
+             "by_kind": {"chart": {"hits": 2, "label": "y"}}, "http_versions": {"2": 4}, "other": {"a": 1}}
+    assert metrics.render_stats("cache", stats, {"by_kind": "kind", "http_versions": "version"}) == [
+        "trade_cache_hits 3",
+        "trade_cache_ratio 0.5",
+        "trade_cache_alive 1",
+        'trade_cache_by_kind_hits{kind="chart"} 2',
+        'trade_cache_http_versions{version="2"} 4',
+    ]
+
+
+def test_middleware_server_timing(registry):
+    async def app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/analyze/{symbol}")
+        with metrics.span("chart"):
+            await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"etag", b'"x"')]})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/analyze/AAPL"}
+    asyncio.run(metrics.MetricsMiddleware(app)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    assert headers[b"etag"] == b'"x"' and sent[1]["body"] == b"{}"
+    chart, total = headers[b"server-timing"].decode().split(", ")
+    assert chart.startswith("chart;dur=") and float(chart.split("=")[1]) >= 10
+    assert total.startswith("total;dur=")
+    lines = registry.render()
+    assert 'trade_http_requests_total{route="/analyze/{symbol}",method="GET",status="200"} 1' in lines
@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import metrics
+import throttle
+from bar_store import DATA_DIR
+from cache import upstream_cache
+from intraday_store import INTRADAY
+
+# Precarga de watchlists: mantiene calientes (velas en bar_store, fundamentales,
+# recomendaciones y noticias en cache) los simbolos registrados, para que la
+# primera carga del dashboard tras un rato sin uso no pague todas las descargas.
+#
+# Cada (tipo, simbolo, intervalo) tiene su proxima hora de refresco en un heap:
+#   - velas: con el mercado abierto, antes de que caduque su TTL en cache
+#     (ajustado al intervalo) y cada CLOSED_CADENCE con el cerrado. Las cripto
+#     (BTC-USD) no cierran nunca.
+#   - fundamentales, recomendaciones y noticias: tambien antes de su TTL, asi
+#     nadie encuentra la entrada caducada.
+# Las cadencias salen del TTL de cada tipo en upstream_cache (TTL_FRACTION del
+# TTL): si cambia un TTL, la precarga le sigue.
+#
+# Las cadencias llevan jitter para no sincronizar los simbolos, los lanzamientos
+# van a PREFETCH_RATE por segundo como mucho (una parte del presupuesto de
+# throttle) y todo sale con prioridad BACKGROUND: las requests interactivas
+# siempre pasan antes. Si hay mas trabajos de los que caben en ese ritmo, las
+# cadencias se estiran a trabajos / PREFETCH_RATE (el heap nunca se queda atras)
+# y el total de trabajos tiene un tope, PREFETCH_MAX_JOBS.
+
+WATCHLISTS_PATH = os.path.join(DATA_DIR, "watchlists.json")
+# Universos (scanner) a precargar desde el arranque, separados por comas
+PREFETCH_WATCHLISTS = os.environ.get("PREFETCH_WATCHLISTS", "")
+# Lanzamientos por segundo y trabajos a la vez
+PREFETCH_RATE = float(os.environ.get("PREFETCH_RATE", str(throttle.UPSTREAM_RATE / 2)))
+PREFETCH_CONCURRENCY = int(os.environ.get("PREFETCH_CONCURRENCY", "4"))
+PREFETCH_MAX_SYMBOLS = 200
+# Trabajos (tipo, simbolo, intervalo) entre todas las watchlists
+PREFETCH_MAX_JOBS = int(os.environ.get("PREFETCH_MAX_JOBS", "2000"))
+INTERVALS = tuple(INTRADAY) + ("1d", "1wk", "1mo")
+JITTER = 0.1
+# Los trabajos de una watchlist nueva se reparten en este margen (segundos)
+WARMUP_SPREAD = 10.0
+
+# Fraccion del TTL en cache a la que se refresca cada tipo
+TTL_FRACTION = 0.8
+# Tipo de la precarga -> tipo en upstream_cache (fundamentals_store parte del quoteSummary
+# y decide por su cuenta si toca refrescar)
+CACHE_KINDS = {
+    "chart": "chart",
+    "fundamentals": "summary",
+    "recommendations": "recommendations",
+    "news": "news",
+}
+# Velas con el mercado abierto (segundos): mas despacio cuanto mas larga la vela
+# (la ultima vela diaria/semanal/mensual apenas se mira). Sin relacion con el TTL
+# de chart: refrescar cada 12s una watchlist diaria no cabe en el presupuesto.
+CHART_CADENCE_BY_INTERVAL = {"1m": 20, "5m": 30, "15m": 60, "1h": 120, "1d": 300, "1wk": 600, "1mo": 1800}
+CLOSED_CADENCE = 30 * 60
+KINDS = tuple(CACHE_KINDS)
+
+# Horario de cada mercado (sufijo de Yahoo -> zona, apertura, cierre), sin festivos.
+# Se amplia MARKET_MARGIN por cada lado: preapertura y ajustes del cierre.
+MARKETS = {
+    "": ("America/New_York", (9, 30), (16, 0)),
+    ".TO": ("America/Toronto", (9, 30), (16, 0)),
+    ".MC": ("Europe/Madrid", (9, 0), (17, 30)),
+    ".PA": ("Europe/Paris", (9, 0), (17, 30)),
+    ".DE": ("Europe/Berlin", (9, 0), (17, 30)),
+    ".AS": ("Europe/Amsterdam", (9, 0), (17, 30)),
+    ".MI": ("Europe/Rome", (9, 0), (17, 30)),
+    ".L": ("Europe/London", (8, 0), (16, 30)),
+    ".T": ("Asia/Tokyo", (9, 0), (15, 30)),
+    ".HK": ("Asia/Hong_Kong", (9, 30), (16, 0)),
+}
+MARKET_MARGIN = timedelta(minutes=30)
+# BTC-USD, ETH-EUR...: 24/7. Divisas (EURUSD=X) y futuros (ES=F): 24h de lunes a viernes
+_CRYPTO = re.compile(r"^[A-Z0-9]+-[A-Z]{3,4}$")
+
+
+def market_open(symbol, now=None):
+    now = time.time() if now is None else now
+    if _CRYPTO.match(symbol):
+        return True
+    if symbol.endswith(("=X", "=F")):
+        return datetime.fromtimestamp(now, ZoneInfo("America/New_York")).weekday() < 5
+    suffix = symbol[symbol.rfind("."):] if "." in symbol else ""
+    zone, (oh, om), (ch, cm) = MARKETS.get(suffix, MARKETS[""])
+    local = datetime.fromtimestamp(now, ZoneInfo(zone))
+    if local.weekday() >= 5:
+        return False
+    opens = local.replace(hour=oh, minute=om, second=0, microsecond=0) - MARKET_MARGIN
+    closes = local.replace(hour=ch, minute=cm, second=0, microsecond=0) + MARKET_MARGIN
+    return opens <= local <= closes
+
+
+def ttl_cadence(kind):
+    return TTL_FRACTION * upstream_cache.ttl_for(CACHE_KINDS[kind])
+
+
+def cadence(kind, symbol, interval, now=None):
+    if kind != "chart":
+        return ttl_cadence(kind)
+    if not market_open(symbol, now):
+        return CLOSED_CADENCE
+    return CHART_CADENCE_BY_INTERVAL.get(interval) or ttl_cadence("chart")
+
+
+class Prefetcher:
+    def __init__(self, loaders, path=WATCHLISTS_PATH, rate=PREFETCH_RATE, concurrency=PREFETCH_CONCURRENCY):
+        # loaders: tipo -> corrutina; chart(symbol, interval), el resto (symbol)
+        self.loaders = loaders
+        self.path = path
+        self.rate = rate
+        self.concurrency = concurrency
+        self.watchlists = {}  # nombre -> {"symbols": [...], "intervals": [...]}
+        self._due = {}        # (tipo, simbolo, intervalo) -> proxima ejecucion
+        self._heap = []       # (proxima ejecucion, orden, clave)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._running = set()
+        self._lag = 0.0
+        self._stats = {"runs": 0, "errors": 0, "skipped": 0, "by_kind": {k: {"runs": 0, "errors": 0} for k in KINDS}}
+
+    # --- Watchlists ---
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.watchlists = json.load(f)
+        except (OSError, ValueError):
+            self.watchlists = {}
+        self._reschedule()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.watchlists, f)
+        os.replace(tmp, self.path)
+
+    def register(self, name, symbols, intervals=("1d",), persist=True):
+        watchlists = dict(self.watchlists)
+        watchlists[name] = {"symbols": list(symbols), "intervals": list(intervals)}
+        jobs = len(self._wanted(watchlists))
+        if jobs > PREFETCH_MAX_JOBS:
+            raise ValueError(f"Too many prefetch jobs ({jobs} > {PREFETCH_MAX_JOBS})")
+        self.watchlists = watchlists
+        if persist:
+            self._save()
+        self._reschedule()
+
+    def unregister(self, name):
+        if self.watchlists.pop(name, None) is None:
+            raise KeyError(name)
+        self._save()
+        self._reschedule()
+
+    def _wanted(self, watchlists=None):
+        keys = set()
+        for watchlist in (self.watchlists if watchlists is None else watchlists).values():
+            for symbol in watchlist["symbols"]:
+                keys.update(("chart", symbol, interval) for interval in watchlist["intervals"])
+                keys.update((kind, symbol, None) for kind in KINDS if kind != "chart")
+        return keys
+
+    def _reschedule(self):
+        # Claves nuevas: repartidas en WARMUP_SPREAD; las que sobran se olvidan
+        # (sus entradas del heap se descartan al salir)
+        now = time.time()
+        wanted = self._wanted()
+        for key in list(self._due):
+            if key not in wanted:
+                del self._due[key]
+        for key in wanted - self._due.keys():
+            self._push(key, now + random.uniform(0, WARMUP_SPREAD))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _push(self, key, due):
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+
+    # --- Bucle de precarga ---
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        metrics.detach()
+        throttle.set_priority(throttle.BACKGROUND)
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            key = self._next_due()
+            if key is None:
+                self._wakeup.clear()
+                delay = self._heap[0][0] - time.time() if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await semaphore.acquire()
+            task = asyncio.get_running_loop().create_task(self._job(key, semaphore))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            # Ritmo maximo de lanzamientos: no se come el presupuesto de Yahoo
+            await asyncio.sleep(1 / self.rate)
+
+    def _next_due(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            due, _, key = heapq.heappop(self._heap)
+            if self._due.get(key) == due:
+                self._lag = now - due
+                return key
+        return None
+
+    async def _job(self, key, semaphore):
+        kind, symbol, interval = key
+        started = time.time()
+        try:
+            with metrics.span(f"prefetch_{kind}"):
+                if kind == "chart":
+                    await self.loaders[kind](symbol, interval)
+                else:
+                    await self.loaders[kind](symbol)
+            self._count(kind, "runs")
+        except throttle.UpstreamUnavailable:
+            # Breaker abierto: se reintenta en la proxima vuelta
+            self._stats["skipped"] += 1
+        except Exception as e:
+            print(f"Prefetch error ({kind} {symbol} {interval or ''}): {e!r}")
+            self._count(kind, "errors")
+        finally:
+            semaphore.release()
+            if key in self._due:
+                every = max(cadence(kind, symbol, interval, started), self._min_cadence())
+                self._push(key, started + every * random.uniform(1 - JITTER, 1 + JITTER))
+
+    def _min_cadence(self):
+        # Con todos los trabajos a esta cadencia se lanzan justo `rate` por segundo
+        return len(self._due) / self.rate
+
+    def _count(self, kind, name):
+        self._stats[name] += 1
+        self._stats["by_kind"][kind][name] += 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["by_kind"] = {k: dict(v) for k, v in self._stats["by_kind"].items()}
+        stats["watchlists"] = len(self.watchlists)
+        stats["symbols"] = len({s for w in self.watchlists.values() for s in w["symbols"]})
+        stats["jobs"] = len(self._due)
+        stats["running"] = len(self._running)
+        stats["min_cadence_seconds"] = self._min_cadence()
+        # Retraso del ultimo lanzamiento: si crece, el presupuesto no da para la watchlist
+        stats["lag_seconds"] = self._lag
+        return stats
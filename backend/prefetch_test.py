@@ -0,0 +1,97 @@
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import prefetch
+
+# Horario de mercado, cadencias y bucle de precarga con cargadores falsos.
+
+
+def ts(zone, *args):
+    return datetime(*args, tzinfo=ZoneInfo(zone)).timestamp()
+
+
+def test_market_hours():
+    wednesday_noon = ts("America/New_York", 2024, 3, 6, 12, 0)
+    saturday = ts("America/New_York", 2024, 3, 9, 12, 0)
+    night = ts("America/New_York", 2024, 3, 6, 22, 0)
+    assert prefetch.market_open("AAPL", wednesday_noon)
+    assert not prefetch.market_open("AAPL", saturday)
+    assert not prefetch.market_open("AAPL", night)
+    assert prefetch.market_open("BTC-USD", saturday) and prefetch.market_open("BTC-USD", night)
+    assert not prefetch.market_open("EURUSD=X", saturday)
+    # 22:00 en NY son las 04:00 en Madrid: cerrado; las 12:00 de NY, abierto
+    assert not prefetch.market_open("SAN.MC", night)
+    assert prefetch.market_open("SAN.MC", ts("Europe/Madrid", 2024, 3, 6, 10, 0))
+
+    # Antes de que caduque la entrada en cache
+    ttl = prefetch.upstream_cache.ttl_for
+    assert prefetch.cadence("chart", "AAPL", "1d", wednesday_noon) == prefetch.CHART_CADENCE_BY_INTERVAL["1d"]
+    assert prefetch.cadence("chart", "AAPL", "2m", wednesday_noon) == 0.8 * ttl("chart")
+    assert prefetch.cadence("chart", "AAPL", "1mo", wednesday_noon) == prefetch.CHART_CADENCE_BY_INTERVAL["1mo"]
+    assert prefetch.cadence("chart", "AAPL", "1d", saturday) == prefetch.CLOSED_CADENCE
+    assert prefetch.cadence("news", "AAPL", None, saturday) == 0.8 * ttl("news")
+    assert prefetch.cadence("fundamentals", "AAPL", None) == 0.8 * ttl("summary")
+    for kind in prefetch.KINDS:
+        assert prefetch.ttl_cadence(kind) < ttl(prefetch.CACHE_KINDS[kind])
+
+
+def test_prefetch_loop():
+    calls = []
+
+    def loader(kind):
+        async def load(symbol, interval=None):
+            calls.append((kind, symbol, interval))
+        return load
+
+    spread = prefetch.WARMUP_SPREAD
+    prefetch.WARMUP_SPREAD = 0.05
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "watchlists.json")
+            prefetcher = prefetch.Prefetcher({k: loader(k) for k in prefetch.KINDS}, path=path, rate=1000)
+
+            async def main():
+                prefetcher.start()
+                prefetcher.register("w", ["BTC-USD", "AAPL"], ["1d", "1wk"])
+                await asyncio.sleep(0.3)
+                await prefetcher.stop()
+            asyncio.run(main())
+
+            # Cada fuente una vez por simbolo (velas por intervalo), sin repetir
+            assert sorted(calls) == sorted(set(calls)) and len(calls) == 2 * 2 + 2 * 3, calls
+            assert prefetcher.stats()["runs"] == len(calls)
+
+            reloaded = prefetch.Prefetcher({}, path=path)
+            reloaded.load()
+            assert reloaded.watchlists == {"w": {"symbols": ["BTC-USD", "AAPL"], "intervals": ["1d", "1wk"]}}
+            reloaded.unregister("w")
+            assert reloaded.stats()["jobs"] == 0
+    finally:
+        prefetch.WARMUP_SPREAD = spread
+
+
+def test_cadence_fits_rate(monkeypatch):
+    # 200 simbolos diarios: 800 trabajos a 4/s -> cada uno como mucho cada 200s
+    prefetcher = prefetch.Prefetcher({}, path=os.devnull, rate=4)
+    symbols = [f"S{i}" for i in range(200)]
+    prefetcher.register("w", symbols, ["1d"], persist=False)
+    assert prefetcher.stats()["jobs"] == 800 and prefetcher.stats()["min_cadence_seconds"] == 200
+
+    async def run_one():
+        key = ("chart", "S0", "1d")
+        prefetcher.loaders = {"chart": lambda symbol, interval: asyncio.sleep(0)}
+        await prefetcher._job(key, asyncio.Semaphore(1))
+        return prefetcher._due[key] - time.time()
+    assert asyncio.run(run_one()) >= 200 * (1 - prefetch.JITTER) - 1
+
+    # Tope de trabajos entre todas las watchlists
+    monkeypatch.setattr(prefetch, "PREFETCH_MAX_JOBS", 1000)
+    with pytest.raises(ValueError):
+        prefetcher.register("w2", [f"T{i}" for i in range(100)], ["1d", "1h"], persist=False)
+    assert list(prefetcher.watchlists) == ["w"]
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Velas semanales y mensuales a partir de las diarias guardadas (bar_store), en
+# vez de descargar de Yahoo otra serie de 5y/10y por cada timeframe.
+#
+# Los periodos se cortan en la fecha local del exchange (gmtoffset de Yahoo):
+# semanas de lunes a domingo y meses naturales. Cada vela lleva el time de su
+# primera sesion real, asi que festivos y semanas cortas no crean velas vacias
+# ni desplazadas. El offset es el actual (sin historial de horario de verano):
+# las velas diarias se fechan a la apertura, lejos de medianoche, y una hora
+# de diferencia nunca las cambia de dia.
+#
+# Agregacion: open de la primera sesion, high maximo, low minimo, close de la
+# ultima y volumen sumado.
+
+PERIODS = ("week", "month")
+
+SECONDS_PER_DAY = 86400
+
+
+def period_keys(times, period, gmtoffset=0):
+    # Identificador del periodo (semana o mes) de cada vela
+    days = (np.asarray(times, dtype=np.int64) + gmtoffset) // SECONDS_PER_DAY
+    if period == "week":
+        # 1970-01-01 fue jueves: +3 alinea las semanas en lunes
+        return (days + 3) // 7
+    if period == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def resample(bars, period, gmtoffset=0):
+    times = np.asarray(bars["time"])
+    if not len(times):
+        return {name: np.asarray(col)[:0] for name, col in bars.items()}
+    keys = period_keys(times, period, gmtoffset)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+    return {
+        "time": times[starts],
+        "open": np.asarray(bars["open"])[starts],
+        "high": np.maximum.reduceat(np.asarray(bars["high"]), starts),
+        "low": np.minimum.reduceat(np.asarray(bars["low"]), starts),
+        "close": np.asarray(bars["close"])[ends],
+        "volume": np.add.reduceat(np.asarray(bars["volume"]), starts),
+    }
@@ -0,0 +1,68 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import resample
+
+# Velas semanales/mensuales vectorizadas contra una agregacion vela a vela con
+# datetime (fecha local del exchange).
+
+NY_OFFSET = -4 * 3600
+
+
+def make_daily(n, seed, start=datetime(2015, 1, 2, 13, 30, tzinfo=timezone.utc)):
+    # Sesiones de lunes a viernes a las 09:30 (NY), con algun festivo
+    rng = random.Random(seed)
+    bars = {"time": [], "open": [], "high": [], "low": [], "close": [], "volume": []}
+    day, p = start, 100.0
+    while len(bars["time"]) < n:
+        day += timedelta(days=1)
+        if day.weekday() >= 5 or rng.random() < 0.03:
+            continue
+        o, p = p, p * (1 + rng.gauss(0, 0.02))
+        bars["time"].append(int(day.timestamp()))
+        bars["open"].append(o)
+        bars["high"].append(max(o, p) * 1.01)
+        bars["low"].append(min(o, p) * 0.99)
+        bars["close"].append(p)
+        bars["volume"].append(rng.randint(1000, 100000))
+    return {k: np.array(v) for k, v in bars.items()}
+
+
+def ref_resample(bars, period, gmtoffset):
+    groups = {}
+    for i, t in enumerate(bars["time"].tolist()):
+        local = datetime.fromtimestamp(t + gmtoffset, timezone.utc).date()
+        key = local.isocalendar()[:2] if period == "week" else (local.year, local.month)
+        groups.setdefault(key, []).append(i)
+    out = {k: [] for k in bars}
+    for idx in groups.values():
+        out["time"].append(bars["time"][idx[0]])
+        out["open"].append(bars["open"][idx[0]])
+        out["high"].append(max(bars["high"][i] for i in idx))
+        out["low"].append(min(bars["low"][i] for i in idx))
+        out["close"].append(bars["close"][idx[-1]])
+        out["volume"].append(sum(bars["volume"][i] for i in idx))
+    return out
+
+
+def test_matches_reference():
+    for seed in range(3):
+        bars = make_daily(2500, seed)
+        for period in resample.PERIODS:
+            got = resample.resample(bars, period, NY_OFFSET)
+            want = ref_resample(bars, period, NY_OFFSET)
+            for name in bars:
+                assert np.array_equal(got[name], np.array(want[name])), (period, name)
+
+
+def test_local_date_boundaries():
+    # Domingo 22:00 UTC es domingo en NY (semana anterior) pero lunes en Tokio
+    sunday = int(datetime(2024, 3, 3, 22, 0, tzinfo=timezone.utc).timestamp())
+    monday = sunday + 12 * 3600
+    times = np.array([sunday, monday])
+    assert len(set(resample.period_keys(times, "week", NY_OFFSET).tolist())) == 2
+    assert len(set(resample.period_keys(times, "week", 9 * 3600).tolist())) == 1
+    assert resample.resample({k: np.empty(0) for k in ("time", "open", "high", "low", "close", "volume")},
+                             "month")["time"].size == 0
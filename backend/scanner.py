@@ -0,0 +1,219 @@
+import asyncio
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import indicators
+
+# Screener: evalua la regla RSI + Bollinger, la tendencia (precio vs SMA 50) y
+# burry_risk / buffett_certified sobre un universo de simbolos. Las descargas van
+# por trozos (SCAN_CHUNK simbolos, SCAN_CONCURRENCY a la vez, a traves del almacen
+# de velas) y el calculo de cada trozo en un pool de procesos, asi que descarga y
+# CPU se solapan y los resultados salen por trozos segun terminan.
+#
+# Los fundamentales salen solo de lo ya guardado (fundamentals_store.peek, que
+# programa en segundo plano los que faltan): sin snapshot, buffett_certified y
+# burry_risk son None (desconocido) y esas filas no pasan los filtros de
+# Buffett/Burry; se cuentan aparte (count_unknown).
+#
+# Este modulo se importa en los procesos del pool: solo depende de numpy e
+# indicators (nada de yfinance/pandas).
+
+UNIVERSE_DIR = os.environ.get("SCAN_UNIVERSE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "universes"))
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", str(os.cpu_count() or 2)))
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", "16"))
+SCAN_MAX_SYMBOLS = int(os.environ.get("SCAN_MAX_SYMBOLS", "5000"))
+SCAN_CHUNK = 32
+FETCH_TIMEOUT = 15
+
+SORT_KEYS = ("score", "rsi", "change", "symbol")
+
+
+# --- Universos (un ticker por linea, '#' para comentarios) ---
+
+def list_universes():
+    try:
+        return sorted(f[:-4] for f in os.listdir(UNIVERSE_DIR) if f.endswith(".txt"))
+    except OSError:
+        return []
+
+
+def load_universe(name):
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise KeyError(name)
+    try:
+        with open(os.path.join(UNIVERSE_DIR, f"{name}.txt")) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        raise KeyError(name)
+    symbols = []
+    for line in lines:
+        s = line.split("#", 1)[0].strip().upper()
+        if s and s not in symbols:
+            symbols.append(s)
+    return symbols
+
+
+# --- Calculo (en el pool de procesos) ---
+
+def _num(x):
+    x = float(x)
+    return None if math.isnan(x) else x
+
+
+def scan_one(symbol, closes, lynch, buffett_certified):
+    # closes: np.ndarray de cierres; lynch: linea Lynch vigente (o None)
+    if len(closes) < 2:
+        return {"symbol": symbol, "status": "error", "detail": "Not enough data"}
+    price = float(closes[-1])
+    rsi = indicators.rsi(closes, 14)[-1]
+    sma_50 = indicators.sma(closes, 50)[-1]
+    ema_200 = indicators.ema(closes, 200)[-1]
+    _, upper, lower = indicators.bollinger(closes, 20, 2)
+    buy, sell = indicators.signal_masks(closes[-1:], [rsi], upper[-1:], lower[-1:])
+    signal = "BUY" if buy[0] else "SELL" if sell[0] else None
+
+    trend = "NEUTRAL"
+    if not math.isnan(sma_50):
+        trend = "BULLISH" if price > sma_50 else "BEARISH"
+
+    # Sin snapshot de fundamentales guardado -> desconocido (None)
+    burry_risk = None
+    if lynch is not None:
+        burry_risk = bool(lynch > 0 and price > lynch * 3)
+
+    # Ranking: primero BUY, luego neutras, SELL al final; dentro, RSI mas bajo primero
+    score = (100 if signal == "BUY" else -100 if signal == "SELL" else 0) + (50 - float(rsi) if not math.isnan(rsi) else 0)
+
+    return {
+        "symbol": symbol,
+        "status": "ok",
+        "price": price,
+        "change_pct": float((price / closes[-2] - 1) * 100) if closes[-2] else None,
+        "rsi": _num(rsi),
+        "sma_50": _num(sma_50),
+        "ema_200": _num(ema_200),
+        "upper_band": _num(upper[-1]),
+        "lower_band": _num(lower[-1]),
+        "signal": signal,
+        "trend": trend,
+        "burry_risk": burry_risk,
+        "buffett_certified": buffett_certified,
+        "score": score,
+    }
+
+
+def scan_chunk(items):
+    return [scan_one(*item) for item in items]
+
+
+# --- Filtros y ranking ---
+
+def filter_rows(rows, signal=None, trend=None, buffett=None, exclude_burry=False, min_rsi=None, max_rsi=None):
+    out = []
+    for row in rows:
+        if row.get("status") != "ok":
+            continue
+        if signal and row["signal"] != signal.upper():
+            continue
+        if trend and row["trend"] != trend.upper():
+            continue
+        if buffett is not None and (row["buffett_certified"] is None or row["buffett_certified"] != buffett):
+            continue
+        if exclude_burry and row["burry_risk"] is not False:
+            continue
+        if min_rsi is not None and (row["rsi"] is None or row["rsi"] < min_rsi):
+            continue
+        if max_rsi is not None and (row["rsi"] is None or row["rsi"] > max_rsi):
+            continue
+        out.append(row)
+    return out
+
+
+def count_unknown(rows):
+    # Filas sin fundamentales todavia (no se pueden filtrar por Buffett/Burry)
+    return sum(1 for row in rows if row.get("status") == "ok" and row["buffett_certified"] is None)
+
+
+def rank(rows, sort="score", limit=None):
+    if sort == "symbol":
+        ranked = sorted(rows, key=lambda r: r["symbol"])
+    elif sort == "rsi":
+        ranked = sorted(rows, key=lambda r: (r["rsi"] is None, r["rsi"]))
+    elif sort == "change":
+        ranked = sorted(rows, key=lambda r: (r["change_pct"] is None, -(r["change_pct"] or 0)))
+    else:
+        ranked = sorted(rows, key=lambda r: -r["score"])
+    return ranked[:limit] if limit else ranked
+
+
+# --- Orquestacion (en el proceso del servidor) ---
+
+def _known(snapshot):
+    # Un scrape fallido sin datos previos guarda un snapshot vacio: tampoco se sabe nada
+    return bool(snapshot) and not (snapshot.get("error") and not snapshot.get("fundamentals"))
+
+
+def _latest_lynch(snapshot, last_time):
+    if not _known(snapshot):
+        return None
+    lynch = None
+    for f in snapshot.get("fundamentals", []):
+        if f["date_ts"] <= last_time:
+            lynch = f.get("lynch")
+    return lynch
+
+
+class Scanner:
+    def __init__(self, load_bars, fundamentals, workers=SCAN_WORKERS, concurrency=SCAN_CONCURRENCY):
+        # load_bars(symbol, interval) -> corrutina con las velas (bar_store)
+        # fundamentals(symbol) -> snapshot guardado o None (sin esperar a yfinance;
+        # los que faltan se cargan en segundo plano para los siguientes scans)
+        self.load_bars = load_bars
+        self.fundamentals = fundamentals
+        self.workers = workers
+        self.concurrency = concurrency
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _fetch(self, symbol, interval, semaphore):
+        async with semaphore:
+            bars = await asyncio.wait_for(self.load_bars(symbol, interval), FETCH_TIMEOUT)
+        closes = np.array(bars["close"], dtype=np.float64)  # copia del memmap (se envia al pool)
+        snapshot = await asyncio.to_thread(self.fundamentals, symbol)
+        last_time = int(bars["time"][-1]) if len(closes) else 0
+        buffett = snapshot.get("buffett_certified") if _known(snapshot) else None
+        return symbol, closes, _latest_lynch(snapshot, last_time), buffett
+
+    async def _scan_chunk(self, symbols, interval, semaphore):
+        fetched = await asyncio.gather(*(self._fetch(s, interval, semaphore) for s in symbols),
+                                       return_exceptions=True)
+        items, rows = [], []
+        for symbol, res in zip(symbols, fetched):
+            if isinstance(res, Exception):
+                detail = "Timeout fetching chart data" if isinstance(res, asyncio.TimeoutError) else str(res)
+                rows.append({"symbol": symbol, "status": "error", "detail": detail})
+            else:
+                items.append(res)
+        if items:
+            rows.extend(await asyncio.get_running_loop().run_in_executor(self._pool(), scan_chunk, items))
+        return rows
+
+    async def scan(self, symbols, interval="1d"):
+        # Generador async: lista de filas por cada trozo que termina
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._scan_chunk(symbols[i:i + SCAN_CHUNK], interval, semaphore))
+                 for i in range(0, len(symbols), SCAN_CHUNK)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+import indicators
+import scanner
+
+# Screener: regla RSI + Bollinger y tendencia por simbolo, filtros y ranking,
+# universos en disco y el scan por trozos con el pool de procesos.
+
+DAY = 86400
+
+
+def trending(n, drift, shock=0.0, seed=1):
+    # Paseo aleatorio con tendencia y un ultimo movimiento brusco
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(drift, 0.005, n)))
+    closes[-1] *= 1 + shock
+    return closes
+
+
+def test_scan_one_rules():
+    crash = scanner.scan_one("DOWN", trending(300, -0.003, shock=-0.08), 20.0, True)
+    assert crash["status"] == "ok" and crash["signal"] == "BUY" and crash["trend"] == "BEARISH"
+    assert crash["rsi"] < 40 and crash["price"] <= crash["lower_band"] * 1.02 and crash["change_pct"] < -7
+    assert crash["burry_risk"] is False and crash["buffett_certified"] is True
+
+    rally = scanner.scan_one("UP", trending(300, 0.003, shock=0.08), 10.0, None)
+    assert rally["signal"] == "SELL" and rally["trend"] == "BULLISH" and rally["rsi"] > 60
+    assert rally["burry_risk"] is True  # precio > 3x linea Lynch
+    assert crash["score"] > 0 > rally["score"]
+
+    # Mismos valores que el motor de indicadores
+    closes = trending(300, 0.0005)
+    row = scanner.scan_one("FLAT", closes, None, None)
+    assert row["rsi"] == pytest.approx(indicators.rsi(closes, 14)[-1])
+    assert row["sma_50"] == pytest.approx(indicators.sma(closes, 50)[-1])
+    assert row["burry_risk"] is None
+
+    # Poca historia: sin medias largas; una sola vela, error
+    short = scanner.scan_one("NEW", trending(10, 0.001), None, None)
+    assert short["sma_50"] is None and short["ema_200"] is None and short["trend"] == "NEUTRAL"
+    assert scanner.scan_one("ONE", np.array([5.0]), None, None)["status"] == "error"
+
+
+def test_filter_and_rank():
+    rows = [
+        {"symbol": "A", "status": "ok", "signal": "BUY", "trend": "BEARISH", "rsi": 25.0, "change_pct": -3.0,
+         "buffett_certified": True, "burry_risk": False, "score": 125.0},
+        {"symbol": "B", "status": "ok", "signal": None, "trend": "BULLISH", "rsi": 55.0, "change_pct": 1.0,
+         "buffett_certified": False, "burry_risk": True, "score": -5.0},
+        {"symbol": "C", "status": "ok", "signal": "SELL", "trend": "BULLISH", "rsi": None, "change_pct": None,
+         "buffett_certified": None, "burry_risk": None, "score": -100.0},
+        {"symbol": "D", "status": "error", "detail": "Not enough data"},
+    ]
+    symbols = lambda rs: [r["symbol"] for r in rs]
+    assert symbols(scanner.filter_rows(rows)) == ["A", "B", "C"]
+    assert symbols(scanner.filter_rows(rows, signal="buy")) == ["A"]
+    assert symbols(scanner.filter_rows(rows, trend="bullish")) == ["B", "C"]
+    # Sin fundamentales (C) no se sabe: fuera de los filtros de Buffett y Burry, contada aparte
+    assert symbols(scanner.filter_rows(rows, buffett=True)) == ["A"]
+    assert symbols(scanner.filter_rows(rows, buffett=False)) == ["B"]
+    assert symbols(scanner.filter_rows(rows, exclude_burry=True)) == ["A"]
+    assert scanner.count_unknown(rows) == 1
+    assert symbols(scanner.filter_rows(rows, min_rsi=30)) == ["B"]
+    ok = scanner.filter_rows(rows)
+    assert symbols(scanner.rank(ok)) == ["A", "B", "C"]
+    assert symbols(scanner.rank(ok, "rsi")) == ["A", "B", "C"]
+    assert symbols(scanner.rank(ok, "change")) == ["B", "A", "C"]
+    assert symbols(scanner.rank(ok, "symbol", limit=2)) == ["A", "B"]
+
+
+def test_universes(monkeypatch):
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, "tech.txt"), "w") as f:
+            f.write("# Tecnologicas\naapl\nMSFT  # Microsoft\n\nAAPL\n")
+        monkeypatch.setattr(scanner, "UNIVERSE_DIR", root)
+        assert scanner.list_universes() == ["tech"]
+        assert scanner.load_universe("tech") == ["AAPL", "MSFT"]
+        for bad in ("missing", "../tech", "tech.txt"):
+            with pytest.raises(KeyError):
+                scanner.load_universe(bad)
+
+
+def test_scan_in_chunks(monkeypatch):
+    monkeypatch.setattr(scanner, "SCAN_CHUNK", 4)
+    symbols = [f"S{i}" for i in range(10)] + ["BAD"]
+    running = {"now": 0, "max": 0}
+
+    async def load_bars(symbol, interval):
+        if symbol == "BAD":
+            raise ValueError("No valid data found")
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        closes = trending(120, 0.001, seed=int(symbol[1:]))
+        return {"time": np.arange(120, dtype=np.int64) * DAY, "close": closes}
+
+    def fundamentals(symbol):
+        if symbol == "S0":
+            return {"fundamentals": [{"date_ts": 0, "lynch": 1.0}, {"date_ts": 10**12, "lynch": 500.0}],
+                    "buffett_certified": True}
+        if symbol == "S2":
+            # Scrape fallido sin datos previos: tan desconocido como no tener snapshot
+            return {"fundamentals": [], "buffett_certified": False, "error": "No fundamentals data found"}
+        return None
+
+    async def main():
+        market = scanner.Scanner(load_bars, fundamentals, workers=2, concurrency=3)
+        chunks = [rows async for rows in market.scan(symbols)]
+        market._executor.shutdown()
+        return chunks
+
+    chunks = asyncio.run(main())
+    rows = {r["symbol"]: r for chunk in chunks for r in chunk}
+    assert len(chunks) == 3 and sorted(rows) == sorted(symbols) and running["max"] <= 3
+    assert rows["BAD"] == {"symbol": "BAD", "status": "error", "detail": "No valid data found"}
+    # Linea Lynch vigente en la ultima vela (la del informe futuro no cuenta)
+    assert rows["S0"]["burry_risk"] is True and rows["S0"]["buffett_certified"] is True
+    for symbol in ("S1", "S2"):
+        assert rows[symbol]["burry_risk"] is None and rows[symbol]["buffett_certified"] is None
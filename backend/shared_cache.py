@@ -0,0 +1,240 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+import formats
+from bar_store import DATA_DIR
+
+# Almacen compartido entre workers (uvicorn/gunicorn con varios procesos): una
+# base SQLite en modo WAL en DATA_DIR. Lecturas concurrentes sin bloqueo y
+# escrituras cortas serializadas por SQLite.
+#
+#   - entries: valores (JSON) por (tipo, clave) con su hora de guardado. Es el
+#     segundo nivel de TTLCache y guarda los analisis ya calculados. Solo
+#     dicts/listas/numeros: lo que no pasa a JSON (DataFrames de yfinance) se
+#     queda en la cache local del proceso.
+#   - leases: "yo lo calculo" por (tipo, clave), con caducidad por si el worker
+#     muere. Con exclusive()/get_or_compute() solo un proceso descarga o calcula
+#     cada clave; el resto espera y lee su resultado.
+#
+# El directorio se crea solo para el usuario (0700) y no se abre una base de
+# otro usuario: el directorio por defecto esta en el temporal compartido.
+#
+# Por defecto (CACHE_BACKEND=local) no hay almacen compartido: shared_store es
+# None y cada proceso funciona como siempre, solo con su cache en memoria.
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_PATH = os.environ.get("CACHE_PATH", os.path.join(DATA_DIR, "cache.sqlite"))
+# Un lease caduca solo pasado este tiempo (worker caido a mitad de calculo)
+LEASE_TIMEOUT = 30.0
+# Espera maxima por el calculo de otro worker antes de hacerlo uno mismo
+LEASE_WAIT = 15.0
+POLL_MIN = 0.01
+POLL_MAX = 0.2
+# Entradas sin tocar en este tiempo se borran al abrir la base
+PURGE_AGE = 7 * 86400
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (kind TEXT, key TEXT, value BLOB, stored_at REAL, PRIMARY KEY (kind, key))",
+    "CREATE TABLE IF NOT EXISTS leases (kind TEXT, key TEXT, owner TEXT, expires_at REAL, PRIMARY KEY (kind, key))",
+)
+
+
+def _check_owner(path):
+    # Un fichero/directorio de otro usuario en el temporal compartido no es nuestro
+    if hasattr(os, "getuid") and os.path.exists(path) and os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user")
+
+
+class SQLiteStore:
+    def __init__(self, path=CACHE_PATH, lease_timeout=LEASE_TIMEOUT, lease_wait=LEASE_WAIT):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.lease_wait = lease_wait
+        self._local = threading.local()  # una conexion por hilo
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "computes": 0, "waits": 0,
+                       "lease_timeouts": 0, "errors": 0}
+        root = os.path.dirname(os.path.abspath(path))
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        for checked in (root, path, path + "-wal", path + "-shm"):
+            _check_owner(checked)
+        db = self._db()
+        for statement in _SCHEMA:
+            db.execute(statement)
+        db.execute("DELETE FROM entries WHERE stored_at < ?", (time.time() - PURGE_AGE,))
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    # --- Valores ---
+
+    def get(self, kind, key):
+        # (valor, stored_at) o None
+        row = self._db().execute("SELECT value, stored_at FROM entries WHERE kind = ? AND key = ?",
+                                 (kind, repr(key))).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            value = formats.decode(row[0])
+        except ValueError:
+            # Entrada ilegible (formato antiguo): como si no estuviera
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value, row[1]
+
+    def set(self, kind, key, value, stored_at=None):
+        stored_at = time.time() if stored_at is None else stored_at
+        self._db().execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                           (kind, repr(key), formats.encode(value), stored_at))
+        self._count("writes")
+        return stored_at
+
+    def delete(self, kind, key):
+        self._db().execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, repr(key)))
+
+    def clear(self):
+        self._db().execute("DELETE FROM entries")
+
+    # --- Leases ---
+
+    def try_lease(self, kind, key):
+        # Atomico entre procesos: se queda el lease si no hay o ha caducado.
+        # Devuelve el owner (para soltarlo) o None si lo tiene otro
+        owner = uuid.uuid4().hex
+        now = time.time()
+        cursor = self._db().execute(
+            "INSERT INTO leases VALUES (?, ?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET "
+            "owner = excluded.owner, expires_at = excluded.expires_at WHERE leases.expires_at < ?",
+            (kind, repr(key), owner, now + self.lease_timeout, now))
+        return owner if cursor.rowcount == 1 else None
+
+    def release(self, kind, key, owner):
+        self._db().execute("DELETE FROM leases WHERE kind = ? AND key = ? AND owner = ?", (kind, repr(key), owner))
+
+    @contextmanager
+    def exclusive(self, kind, key):
+        # Bloquea hasta tener el lease (o hasta lease_wait: entonces sigue sin el)
+        deadline = time.time() + self.lease_wait
+        delay = POLL_MIN
+        owner = self.try_lease(kind, key)
+        if owner is None:
+            self._count("waits")
+        while owner is None and time.time() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX)
+            owner = self.try_lease(kind, key)
+        if owner is None:
+            self._count("lease_timeouts")
+        try:
+            yield
+        finally:
+            if owner is not None:
+                self.release(kind, key, owner)
+
+    @asynccontextmanager
+    async def aexclusive(self, kind, key):
+        # Igual que exclusive() sin bloquear el event loop
+        deadline = time.time() + self.lease_wait
+        delay = POLL_MIN
+        owner = await asyncio.to_thread(self.try_lease, kind, key)
+        if owner is None:
+            self._count("waits")
+        while owner is None and time.time() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX)
+            owner = await asyncio.to_thread(self.try_lease, kind, key)
+        if owner is None:
+            self._count("lease_timeouts")
+        try:
+            yield
+        finally:
+            if owner is not None:
+                await asyncio.to_thread(self.release, kind, key, owner)
+
+    # --- Get-or-compute entre procesos ---
+
+    def _fresh(self, kind, key, max_age):
+        hit = self.get(kind, key)
+        if hit is not None and time.time() - hit[1] <= max_age:
+            return hit
+        return None
+
+    def get_or_compute(self, kind, key, max_age, compute, keep=None):
+        # (valor, stored_at). Solo un proceso llama a compute() por clave; los
+        # demas esperan y leen su resultado. keep(valor) decide si se guarda
+        # (p.ej. no guardar errores).
+        hit = self._fresh(kind, key, max_age)
+        if hit is not None:
+            return hit
+        with self.exclusive(kind, key):
+            # Otro worker lo ha calculado mientras se esperaba el lease
+            hit = self._fresh(kind, key, max_age)
+            if hit is not None:
+                return hit
+            self._count("computes")
+            value = compute()
+            return value, self._publish(kind, key, value, keep)
+
+    async def aget_or_compute(self, kind, key, max_age, compute, keep=None):
+        # Variante async: compute() devuelve una corrutina
+        hit = await asyncio.to_thread(self._fresh, kind, key, max_age)
+        if hit is not None:
+            return hit
+        async with self.aexclusive(kind, key):
+            hit = await asyncio.to_thread(self._fresh, kind, key, max_age)
+            if hit is not None:
+                return hit
+            self._count("computes")
+            value = await compute()
+            return value, await asyncio.to_thread(self._publish, kind, key, value, keep)
+
+    def _publish(self, kind, key, value, keep):
+        if keep is not None and not keep(value):
+            return time.time()
+        try:
+            return self.set(kind, key, value)
+        except (sqlite3.Error, TypeError) as e:
+            # El valor sigue siendo valido para este proceso
+            print(f"Shared cache write error ({kind} {key}): {e}")
+            self._count("errors")
+            return time.time()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats["entries"] = self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            stats["leases"] = self._db().execute("SELECT COUNT(*) FROM leases WHERE expires_at >= ?",
+                                                 (time.time(),)).fetchone()[0]
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+def open_store(backend=CACHE_BACKEND, path=CACHE_PATH):
+    if backend == "local":
+        return None
+    if backend == "sqlite":
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+# Almacen compartido del proceso (None: solo cache local)
+shared_store = open_store()
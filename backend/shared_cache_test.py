@@ -0,0 +1,101 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pytest
+
+import shared_cache
+from cache import TTLCache
+
+# Almacen compartido entre procesos: un solo calculo por clave aunque lo pidan
+# varios workers a la vez.
+
+
+def _worker(path, log, barrier, results):
+    store = shared_cache.SQLiteStore(path)
+
+    def compute():
+        with open(log, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        return {"price": 42.0}
+
+    barrier.wait()
+    value, _ = store.get_or_compute("analysis", ("AAPL", "1d"), 60, compute)
+    results.put(value["price"])
+
+
+def test_single_compute_across_processes():
+    with tempfile.TemporaryDirectory() as root:
+        path, log = os.path.join(root, "cache.sqlite"), os.path.join(root, "computes.log")
+        shared_cache.SQLiteStore(path)  # esquema creado antes de arrancar los workers
+        ctx = multiprocessing.get_context("spawn")
+        barrier, results = ctx.Barrier(4), ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(path, log, barrier, results)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+        assert [results.get(timeout=1) for _ in procs] == [42.0] * 4
+        with open(log) as f:
+            assert len(f.read().split()) == 1
+
+
+def test_two_level_cache_and_leases():
+    with tempfile.TemporaryDirectory() as root:
+        store = shared_cache.SQLiteStore(os.path.join(root, "cache.sqlite"), lease_timeout=0.2)
+        worker_a, worker_b = TTLCache(shared=store), TTLCache(shared=store)
+        calls = []
+        assert worker_a.get_or_fetch("news", ("AAPL", None), lambda: calls.append(1) or ["a"]) == ["a"]
+        # Otro "worker": lo encuentra en el almacen compartido sin descargar
+        assert worker_b.get_or_fetch("news", ("AAPL", None), lambda: calls.append(1) or ["b"]) == ["a"]
+
+        async def fetch():
+            calls.append(1)
+            return {"buy": 3}
+        assert asyncio.run(worker_b.aget_or_fetch("recommendations", ("AAPL", None), fetch)) == {"buy": 3}
+        assert asyncio.run(worker_a.aget_or_fetch("recommendations", ("AAPL", None), fetch)) == {"buy": 3}
+        assert len(calls) == 2 and worker_b.stats()["shared_hits"] == 1
+
+        # Lease de un worker caido: caduca y otro puede quedarselo
+        assert store.try_lease("chart", ("AAPL", "1d")) is not None
+        assert store.try_lease("chart", ("AAPL", "1d")) is None
+        time.sleep(0.25)
+        owner = store.try_lease("chart", ("AAPL", "1d"))
+        assert owner is not None
+        store.release("chart", ("AAPL", "1d"), owner)
+        assert store.try_lease("chart", ("AAPL", "1d")) is not None
+
+        # Los resultados que no se quieren compartir (errores) no se guardan
+        store.get_or_compute("analysis", "X", 60, lambda: {"status": "error"}, keep=lambda r: r["status"] == "ok")
+        assert store.get("analysis", "X") is None
+
+
+def test_values_are_json_not_pickle():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "data", "cache.sqlite")
+        store = shared_cache.SQLiteStore(path)
+        assert os.stat(os.path.dirname(path)).st_mode & 0o077 == 0  # solo el usuario
+        store.set("analysis", "A", {"history": {"close": [1.5, None]}, "signal": "ESPERA"})
+        raw = store._db().execute("SELECT value FROM entries").fetchone()[0]
+        assert raw.startswith(b"{")
+        assert store.get("analysis", "A")[0]["history"]["close"] == [1.5, None]
+
+        # Una entrada pickle antigua (o manipulada) no se carga: es un fallo de cache
+        store._db().execute("UPDATE entries SET value = ?", (b"\x80\x05cos\nsystem\n.",))
+        assert store.get("analysis", "A") is None
+
+        # Lo que no es JSON no se comparte, pero el valor sigue valiendo en el proceso
+        value, _ = store.get_or_compute("financials", "A", 60, lambda: object())
+        assert value is not None and store.get("financials", "A") is None
+
+
+def test_refuses_foreign_cache_file(monkeypatch):
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "cache.sqlite")
+        shared_cache.SQLiteStore(path)
+        monkeypatch.setattr(os, "getuid", lambda: os.stat(path).st_uid + 1)
+        with pytest.raises(PermissionError):
+            shared_cache.SQLiteStore(path)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+# Coalescencia de llamadas identicas ("single-flight"): mientras una llamada para
+# una clave esta en curso, el resto de llamadores con la misma clave esperan su
+# resultado en vez de repetir el trabajo. El resultado es compartido: los
+# llamadores no deben modificarlo.
+
+# Claves con seguidores que se recuerdan para stats() (LRU): las claves las
+# eligen los clientes (simbolo, intervalo, indicadores), asi que no se guardan todas
+TOP_KEYS = 64
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> _Call (hilos)
+        self._tasks = {}    # (loop, key) -> asyncio.Task
+        self._stats = {"leaders": 0, "followers": 0}
+        self._followers_by_key = OrderedDict()
+
+    def _count(self, key, leader):
+        # Llamar con self._lock tomado
+        if leader:
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+            self._followers_by_key[key] = self._followers_by_key.get(key, 0) + 1
+            self._followers_by_key.move_to_end(key)
+            if len(self._followers_by_key) > TOP_KEYS:
+                self._followers_by_key.popitem(last=False)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(key, leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        # `fn` devuelve una corrutina. La tarea compartida se protege con shield:
+        # si el cliente que la inicio se desconecta, los demas siguen esperandola.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get((loop, key))
+            leader = task is None
+            if leader:
+                task = loop.create_task(fn())
+                self._tasks[(loop, key)] = task
+                task.add_done_callback(lambda _t: self._release(loop, key))
+            self._count(key, leader)
+        return await asyncio.shield(task)
+
+    def _release(self, loop, key):
+        with self._lock:
+            self._tasks.pop((loop, key), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            total = stats["leaders"] + stats["followers"]
+            stats["coalesced_ratio"] = stats["followers"] / total if total else 0.0
+            stats["in_flight"] = len(self._calls) + len(self._tasks)
+            # Las claves recientes con mas seguidores primero
+            top = sorted(self._followers_by_key.items(), key=lambda kv: -kv[1])
+            stats["followers_by_key"] = {"/".join(k) if isinstance(k, tuple) else str(k): v for k, v in top}
+            return stats
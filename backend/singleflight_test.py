@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import singleflight
+from singleflight import SingleFlight
+
+# Coalescencia de llamadas: una sola ejecucion por clave, errores para todos,
+# tarea compartida que sobrevive a la cancelacion de un llamador y stats por
+# clave acotadas.
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    calls, results = [], []
+    started = threading.Event()
+
+    def fn():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"price": 42.0}
+
+    def caller():
+        results.append(flight.do(("AAPL", "1d"), fn))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=caller) for _ in range(7)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join(5)
+    assert len(calls) == 1 and len(results) == 8
+    assert all(r is results[0] for r in results)  # el mismo objeto compartido
+    stats = flight.stats()
+    assert stats["leaders"] == 1 and stats["followers"] == 7 and stats["in_flight"] == 0
+    assert stats["followers_by_key"] == {"AAPL/1d": 7}
+
+    # Terminada la llamada, la siguiente vuelve a ejecutar
+    flight.do(("AAPL", "1d"), fn)
+    assert len(calls) == 2
+
+
+def test_do_error_reaches_every_waiter():
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fn():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("No valid data found")
+
+    def caller():
+        try:
+            flight.do("BAD", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=caller) for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join(5)
+    assert len(errors) == 4 and all(e is errors[0] for e in errors)
+    # La clave se libera: la siguiente llamada no recibe el error anterior
+    assert flight.do("BAD", lambda: "ok") == "ok"
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_ado_shares_task_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["news"]
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(flight.ado("AAPL", fetch) for _ in range(5)))
+        assert all(r is results[0] for r in results) and len(calls) == 1
+        errors = await asyncio.gather(*(flight.ado("BAD", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors) and len(calls) == 2
+        assert await flight.ado("BAD", fetch) == ["news"]
+
+    asyncio.run(main())
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_ado_cancelled_caller_does_not_cancel_shared_task():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"status": "ok"}
+
+    async def main():
+        first = asyncio.create_task(flight.ado("AAPL", fetch))
+        second = asyncio.create_task(flight.ado("AAPL", fetch))
+        await asyncio.sleep(0.02)
+        first.cancel()  # el cliente que la inicio se desconecta
+        assert await second == {"status": "ok"}
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_followers_by_key_is_bounded(monkeypatch):
+    monkeypatch.setattr(singleflight, "TOP_KEYS", 2)
+    flight = SingleFlight()
+    with flight._lock:
+        for key in ["A", "B", "A", "C", "D", "D", "D"]:
+            flight._count(key, leader=False)
+    # Se olvidan las claves menos recientes; los totales siguen completos
+    stats = flight.stats()
+    assert stats["followers_by_key"] == {"D": 3, "C": 1} and list(stats["followers_by_key"]) == ["D", "C"]
+    assert stats["followers"] == 7
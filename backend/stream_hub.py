@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import os
+
+import formats
+import metrics
+import throttle
+
+# Fan-out de live mode: una sola tarea por (symbol, interval, indicadores) suscrito consulta
+# upstream, recalcula y reparte el resultado a todos los clientes. La carga
+# escala con los simbolos distintos, no con el numero de navegadores. La tarea
+# se cancela cuando se va el ultimo suscriptor.
+#
+# Eventos por cliente:
+#   snapshot -> analisis completo (formato columnar), al suscribirse o tras
+#               perder mensajes por ir lento
+#   update   -> delta desde la ultima vela enviada (como /analyze?since=...),
+#               sin noticias ni recomendaciones
+#   error    -> el analisis fallo (se sigue reintentando)
+#   ping     -> keep-alive
+
+STREAM_INTERVAL = float(os.environ.get("STREAM_INTERVAL", "10"))
+HEARTBEAT = 15
+QUEUE_MAX = 16
+
+# Campos pesados que solo van en el snapshot
+SNAPSHOT_ONLY = ("news", "recommendations")
+
+
+class _Channel:
+    def __init__(self):
+        self.subscribers = set()
+        self.task = None
+        self.result = None      # Ultimo analisis correcto
+        self.last_time = None   # Ultima vela real enviada (cursor de los deltas)
+        self.digest = None      # Hash de la ultima vela y la proyeccion ya enviadas
+
+
+def _last_bar_time(history):
+    i = len(history["time"]) - history.get("projections", 0) - 1
+    return history["time"][i] if i >= 0 else None
+
+
+class StreamHub:
+    def __init__(self, analyze, interval=STREAM_INTERVAL):
+        # analyze(symbol, interval, specs) -> corrutina con el resultado de analyze_symbol
+        self.analyze = analyze
+        self.interval = interval
+        self._channels = {}
+        self._stats = {"polls": 0, "updates": 0, "unchanged": 0, "resyncs": 0, "errors": 0}
+
+    async def subscribe(self, symbol, interval, specs=None):
+        # Generador async de (evento, payload) para un cliente.
+        # specs: indicadores pedidos (indicators.parse_specs), parte de la clave del canal.
+        # Simbolo normalizado como en las requests: btc-usd y BTC-USD comparten canal
+        key = (symbol.strip().upper(), interval, specs)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel()
+            channel.task = asyncio.get_running_loop().create_task(self._poll(key, channel))
+        queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        channel.subscribers.add(queue)
+        if channel.result is not None:
+            queue.put_nowait(self._snapshot(channel))
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield "ping", None
+        finally:
+            channel.subscribers.discard(queue)
+            if not channel.subscribers:
+                channel.task.cancel()
+                if self._channels.get(key) is channel:
+                    del self._channels[key]
+
+    async def _poll(self, key, channel):
+        symbol, interval, specs = key
+        metrics.detach()
+        # El polling cede el turno de Yahoo a las requests interactivas
+        throttle.set_priority(throttle.LIVE)
+        while True:
+            try:
+                result = await self.analyze(symbol, interval, specs)
+                self._stats["polls"] += 1
+                self._publish(channel, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Stream poll error ({symbol} {interval}): {e}")
+                self._stats["errors"] += 1
+            await asyncio.sleep(self.interval)
+
+    def _snapshot(self, channel):
+        return "snapshot", formats.format_result(channel.result, "columnar")
+
+    def _publish(self, channel, result):
+        if not isinstance(result.get("history"), dict):
+            self._stats["errors"] += 1
+            self._broadcast(channel, ("error", {"symbol": result.get("symbol"), "status": result.get("status"),
+                                                "detail": result.get("detail")}))
+            return
+
+        first = channel.result is None
+        since = channel.last_time
+        channel.result = result
+        channel.last_time = _last_bar_time(result["history"])
+        if first:
+            channel.digest = self._digest(self._update(result, channel.last_time))
+            self._broadcast(channel, self._snapshot(channel))
+            return
+
+        update = self._update(result, since)
+        # Cambios: vela nueva, o la misma vela (en formacion) con otros valores. Se
+        # compara siempre desde la ultima vela; el delta enviado va desde `since`
+        new_bar = channel.last_time != since
+        digest = self._digest(self._update(result, channel.last_time) if new_bar else update)
+        if not new_bar and digest == channel.digest:
+            self._stats["unchanged"] += 1
+            return
+        channel.digest = digest
+        self._stats["updates"] += 1
+        self._broadcast(channel, ("update", update))
+
+    def _update(self, result, since):
+        update = formats.format_result(result, "columnar", since)
+        for field in SNAPSHOT_ONLY:
+            update.pop(field, None)
+        return update
+
+    def _digest(self, update):
+        return hashlib.blake2b(formats.encode(update), digest_size=12).digest()
+
+    def _broadcast(self, channel, event):
+        for queue in channel.subscribers:
+            if queue.full():
+                # Cliente lento: se descarta lo pendiente y se reenvia el estado completo
+                while not queue.empty():
+                    queue.get_nowait()
+                self._stats["resyncs"] += 1
+                if channel.result is not None:
+                    queue.put_nowait(self._snapshot(channel))
+                if event[0] != "update":
+                    queue.put_nowait(event)
+            else:
+                queue.put_nowait(event)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["channels"] = len(self._channels)
+        stats["subscribers"] = sum(len(c.subscribers) for c in self._channels.values())
+        return stats
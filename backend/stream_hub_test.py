@@ -0,0 +1,101 @@
+import asyncio
+
+from stream_hub import StreamHub
+
+# Fan-out de live mode con un analisis falso: un solo sondeo por canal para
+# todos los suscriptores, snapshot y luego deltas, sin eventos si nada cambia
+# y la tarea se cancela con el ultimo suscriptor.
+
+DAY = 86400
+
+
+def analysis(n, last_close=None):
+    closes = [100.0 + i for i in range(n)]
+    if last_close is not None:
+        closes[-1] = last_close
+    history = {"time": [i * DAY for i in range(n)], "close": closes, "graham_number": [50.0] * n,
+               "projections": 0}
+    return {"symbol": "AAPL", "interval": "1d", "status": "ok", "history": history, "news": [{"title": "x"}]}
+
+
+def test_subscribers_share_one_poll():
+    state = {"result": analysis(10)}
+    calls = []
+
+    async def analyze(symbol, interval, specs):
+        calls.append((symbol, interval, specs))
+        return state["result"]
+
+    async def main():
+        hub = StreamHub(analyze, interval=0.05)
+        a = hub.subscribe("AAPL", "1d")
+        b = hub.subscribe("AAPL", "1d")
+        event_a = await asyncio.wait_for(a.__anext__(), 1)
+        event_b = await asyncio.wait_for(b.__anext__(), 1)
+        assert event_a[0] == event_b[0] == "snapshot"
+        assert event_a[1]["history"]["length"] == 10 and event_a[1]["news"]
+        assert hub.stats()["channels"] == 1 and hub.stats()["subscribers"] == 2
+        await asyncio.sleep(0.12)  # sondeos sin cambios tras el snapshot: nada que enviar
+        assert hub.stats()["updates"] == 0 and hub.stats()["unchanged"] >= 1
+
+        # Vela nueva: los dos reciben el mismo delta desde la ultima vela enviada
+        state["result"] = analysis(11)
+        update_a = await asyncio.wait_for(a.__anext__(), 1)
+        update_b = await asyncio.wait_for(b.__anext__(), 1)
+        assert update_a == update_b and update_a[0] == "update"
+        assert update_a[1]["history"]["time"] == [9 * DAY, 10 * DAY] and "news" not in update_a[1]
+
+        # Sin cambios: no se envia nada; la vela en formacion corregida si
+        await asyncio.sleep(0.15)
+        assert hub.stats()["unchanged"] >= 1
+        state["result"] = analysis(11, last_close=7.0)
+        update = await asyncio.wait_for(a.__anext__(), 1)
+        assert update[1]["history"]["close"][-1] == 7.0
+        await asyncio.wait_for(b.__anext__(), 1)
+
+        # Un sondeo por canal, no por suscriptor
+        assert len(calls) == hub.stats()["polls"] and set(calls) == {("AAPL", "1d", None)}
+
+        # Error del analisis: se avisa a todos y se sigue sondeando
+        state["result"] = {"symbol": "AAPL", "status": "error", "detail": "Timeout fetching chart data"}
+        error = await asyncio.wait_for(a.__anext__(), 1)
+        assert error == ("error", {"symbol": "AAPL", "status": "error", "detail": "Timeout fetching chart data"})
+
+        # Se va el ultimo suscriptor: se cancela el sondeo
+        task = hub._channels[("AAPL", "1d", None)].task
+        await a.aclose()
+        assert hub.stats()["subscribers"] == 1 and not task.done()
+        await b.aclose()
+        await asyncio.sleep(0)
+        assert task.cancelled() and hub.stats()["channels"] == 0
+        polls = len(calls)
+        await asyncio.sleep(0.12)
+        assert len(calls) == polls
+
+    asyncio.run(main())
+
+
+def test_late_subscriber_gets_snapshot_and_channels_by_key():
+    async def analyze(symbol, interval, specs):
+        return dict(analysis(5), symbol=symbol, interval=interval)
+
+    async def main():
+        hub = StreamHub(analyze, interval=0.05)
+        first = hub.subscribe("AAPL", "1d")
+        await asyncio.wait_for(first.__anext__(), 1)
+        # Llega con el canal ya en marcha: snapshot inmediato del ultimo analisis
+        late = hub.subscribe("AAPL", "1d")
+        event = await asyncio.wait_for(late.__anext__(), 0.02)
+        assert event[0] == "snapshot" and event[1]["history"]["length"] == 5
+        other = hub.subscribe("AAPL", "1h", ("rsi14",))
+        event = await asyncio.wait_for(other.__anext__(), 1)
+        assert event[1]["interval"] == "1h" and hub.stats()["channels"] == 2
+        # Mismo simbolo escrito de otra forma: mismo canal
+        lower = hub.subscribe(" aapl", "1d")
+        event = await asyncio.wait_for(lower.__anext__(), 0.02)
+        assert event[1]["symbol"] == "AAPL" and hub.stats()["channels"] == 2
+        for gen in (first, late, other, lower):
+            await gen.aclose()
+        assert hub.stats()["channels"] == 0
+
+    asyncio.run(main())
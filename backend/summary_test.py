@@ -0,0 +1,56 @@
+import pytest
+
+import benchmark
+import data_test
+
+# quoteSummary -> {"info", "statements"}: modulos que faltan, campos vacios de
+# Yahoo ({}) y mismo resultado que la ruta de yfinance con los mismos datos.
+
+
+def block(**modules):
+    return {"quoteSummary": {"result": [modules], "error": None}}
+
+
+def test_missing_modules():
+    assert data_test.parse_summary(block()) == {"info": {}, "statements": []}
+    assert data_test.parse_summary(block(defaultKeyStatistics=None, incomeStatementHistory={})) == \
+        {"info": {}, "statements": []}
+    with pytest.raises(ValueError):
+        data_test.parse_summary({"quoteSummary": {"result": [], "error": {"code": "Not Found"}}})
+    with pytest.raises(ValueError):
+        data_test.parse_summary({})
+
+
+def test_empty_raw_values():
+    summary = data_test.parse_summary(block(
+        defaultKeyStatistics={"sharesOutstanding": {}, "lastFiscalYearEnd": {"raw": 1727654400, "fmt": "2024-09-30"},
+                              "maxAge": 1},
+        financialData={"returnOnEquity": {"raw": 1.45, "fmt": "145%"}, "debtToEquity": {},
+                       "financialCurrency": "USD", "companyOfficers": []},
+        incomeStatementHistory={"incomeStatementHistory": [
+            {"endDate": {"raw": 1727654400}, "netIncome": {}},
+            {"endDate": {"raw": 1696032000}, "netIncome": {"raw": 9.7e10}}]},
+        # Nombre antiguo del modulo de balances
+        balanceSheetHistory={"balanceSheetHistory": [
+            {"endDate": {"raw": 1727654400}, "totalStockholderEquity": {"raw": 5.7e10}},
+            {"endDate": {}, "totalStockholderEquity": {"raw": 1.0}},
+            {"endDate": {"raw": 1696032000}, "totalStockholderEquity": {}}]},
+    ))
+    assert summary["info"] == {"lastFiscalYearEnd": 1727654400, "maxAge": 1, "returnOnEquity": 1.45,
+                               "financialCurrency": "USD"}
+    assert summary["statements"] == [(1727654400, None, 5.7e10), (1696032000, 9.7e10, None)]
+    assert not data_test._complete(summary)
+
+
+def test_matches_yfinance_path(monkeypatch):
+    fixture = benchmark.synthetic_fixture("daily", "1d", 300, 86400, 3)
+    frames = (benchmark._frame(fixture["balance_sheet"]), benchmark._frame(fixture["income_stmt"]))
+    monkeypatch.setattr(data_test, "fetch_info", lambda symbol: fixture["info"])
+    monkeypatch.setattr(data_test, "fetch_financials", lambda symbol: frames)
+
+    from_summary = data_test.parse_summary(fixture["summary"])
+    from_yfinance = data_test._yfinance_summary("BENCH")
+    assert from_summary["info"] == from_yfinance["info"]
+    assert sorted(from_summary["statements"]) == sorted(from_yfinance["statements"])
+    assert len(from_summary["statements"]) == 4 and data_test._complete(from_summary)
+    assert data_test.fundamentals_snapshot(from_summary) == data_test.fundamentals_snapshot(from_yfinance)
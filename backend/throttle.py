@@ -0,0 +1,370 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from curl_cffi.requests import RequestsError
+
+# Planificador central de llamadas a Yahoo. Todas las descargas (http_pool y
+# yfinance) piden turno aqui antes de salir:
+#
+#   - Token bucket por host (query1/query2.finance.yahoo.com, yfinance): como
+#     mucho UPSTREAM_RATE requests/s con rafagas de UPSTREAM_BURST.
+#   - Backoff adaptativo: un 429 o 5xx para el host un tiempo (Retry-After si
+#     viene, si no exponencial con jitter) y reduce su ritmo a la mitad; cada
+#     respuesta buena lo recupera poco a poco (AIMD).
+#   - Circuit breaker: tras BREAKER_THRESHOLD fallos seguidos el host queda
+#     abierto BREAKER_COOLDOWN segundos y las llamadas fallan al instante con
+#     UpstreamUnavailable (la cache sirve lo que tenga). Pasado ese tiempo deja
+#     pasar una sola llamada de prueba: si va bien se cierra, si no se reabre
+#     con el doble de espera.
+#   - Prioridades: cuando hay cola, las requests interactivas pasan antes que
+#     el modo live y estas antes que scans, backtests y refrescos de fondo.
+#
+# La prioridad va en un ContextVar: se fija al entrar en un scan o en el polling
+# del stream y la heredan las tareas e hilos (asyncio.to_thread) que lanza.
+#
+#   throttle.scheduler.acquire(host)        # bloquea el hilo hasta tener turno
+#   await throttle.scheduler.aacquire(host) # idem en el event loop
+#   throttle.scheduler.report(host, status) # resultado: ajusta ritmo y breaker
+#
+# Las colas de hilos y de corrutinas son la misma: un hilo despachador reparte
+# los turnos segun se reponen los tokens.
+
+INTERACTIVE, LIVE, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", LIVE: "live", BACKGROUND: "background"}
+
+# Ritmo por host (requests/s) y rafaga maxima
+UPSTREAM_RATE = float(os.environ.get("UPSTREAM_RATE", "8"))
+UPSTREAM_BURST = float(os.environ.get("UPSTREAM_BURST", "16"))
+# yfinance hace varias llamadas por ticker: ritmo propio, mas bajo
+YFINANCE_RATE = float(os.environ.get("YFINANCE_RATE", "2"))
+YFINANCE_BURST = float(os.environ.get("YFINANCE_BURST", "4"))
+# El backoff nunca baja el ritmo de aqui
+MIN_RATE = 0.5
+# Backoff tras un 429/5xx: BACKOFF_BASE * 2^(fallos-1), hasta BACKOFF_MAX (segundos)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Circuit breaker
+BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", "30"))
+BREAKER_COOLDOWN_MAX = 300.0
+# Si la llamada de prueba no informa en este tiempo se permite otra
+PROBE_TIMEOUT = 30.0
+# Espera maxima en cola de una llamada sync (las async usan su propio wait_for)
+QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "30"))
+
+_priority = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class UpstreamError(Exception):
+    # Respuesta HTTP de error de Yahoo (los fetchers de data_test)
+    def __init__(self, status_code):
+        super().__init__(f"HTTP Error {status_code}")
+        self.status_code = status_code
+
+
+# Fallos de red o de Yahoo: solo estos cuentan para el backoff y el breaker
+UPSTREAM_ERRORS = (RequestsError, UpstreamError, TimeoutError, ConnectionError)
+
+
+class UpstreamUnavailable(Exception):
+    # Breaker abierto o demasiado tiempo en cola: no se llego a llamar a Yahoo
+    status_code = 503
+
+    def __init__(self, host, reason):
+        super().__init__(f"Upstream {host} unavailable ({reason})")
+        self.host = host
+        self.reason = reason
+
+
+def current_priority():
+    return _priority.get()
+
+
+def set_priority(priority):
+    # Para tareas de fondo: afecta al contexto actual y a lo que lance despues
+    _priority.set(priority)
+
+
+@contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_failure(status):
+    return status == 429 or status >= 500
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "loop", "future", "error", "abandoned")
+
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.error = None
+        self.abandoned = False
+
+    def wake(self, error=None):
+        # Llamado desde el despachador, con el lock tomado
+        if self.loop is None:
+            self.error = error
+            self.event.set()
+            return
+        self.loop.call_soon_threadsafe(self._resolve, error)
+
+    def _resolve(self, error):
+        if self.future.done():
+            return
+        if error is None:
+            self.future.set_result(None)
+        else:
+            self.future.set_exception(error)
+
+
+class _Host:
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.backoff_until = 0.0
+        self.strikes = 0          # 429/5xx seguidos (backoff)
+        self.failures = 0         # fallos seguidos de cualquier tipo (breaker)
+        self.state = "closed"     # closed, open, half_open
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probe_until = 0.0
+        self.waiters = []         # heap (prioridad, orden, _Waiter)
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now):
+        start = max(now, self.backoff_until)
+        if self.tokens >= 1:
+            return start
+        return max(start, now + (1 - self.tokens) / self.rate)
+
+
+class UpstreamScheduler:
+    def __init__(self, rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, limits=None):
+        self.rate = rate
+        self.burst = burst
+        # host -> (rate, burst) para los que no usan el limite general
+        self.limits = dict({"yfinance": (YFINANCE_RATE, YFINANCE_BURST)} if limits is None else limits)
+        self._cond = threading.Condition()
+        self._hosts = {}
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._stats = {"granted": 0, "queued": 0, "throttled": 0, "errors": 0, "backoffs": 0,
+                       "breaker_opened": 0, "rejected": 0, "queue_timeouts": 0, "wait_seconds": 0.0}
+
+    def _host(self, name):
+        host = self._hosts.get(name)
+        if host is None:
+            rate, burst = self.limits.get(name, (self.rate, self.burst))
+            host = self._hosts[name] = _Host(name, rate, burst)
+        return host
+
+    # --- Turnos ---
+
+    def _admit(self, name, priority, loop=None):
+        # Con el lock: None si hay token ya, o el _Waiter que queda en cola
+        now = time.monotonic()
+        host = self._host(name)
+        self._check_breaker(host, now)
+        host.refill(now)
+        if not host.waiters and now >= host.backoff_until and host.tokens >= 1:
+            host.tokens -= 1
+            self._stats["granted"] += 1
+            return None
+        waiter = _Waiter(priority, loop)
+        heapq.heappush(host.waiters, (priority, next(self._seq), waiter))
+        self._stats["queued"] += 1
+        self._ensure_dispatcher()
+        self._cond.notify()
+        return waiter
+
+    def _check_breaker(self, host, now):
+        if host.state == "open":
+            if now < host.open_until:
+                self._stats["rejected"] += 1
+                raise UpstreamUnavailable(host.name, "circuit open")
+            # Fin del enfriamiento: este caller es la llamada de prueba
+            host.state = "half_open"
+            host.probe_until = now + PROBE_TIMEOUT
+        elif host.state == "half_open":
+            if now < host.probe_until:
+                self._stats["rejected"] += 1
+                raise UpstreamUnavailable(host.name, "circuit half-open")
+            host.probe_until = now + PROBE_TIMEOUT
+
+    def acquire(self, host, priority=None, timeout=QUEUE_TIMEOUT):
+        start = time.monotonic()
+        with self._cond:
+            waiter = self._admit(host, current_priority() if priority is None else priority)
+        if waiter is None:
+            return
+        granted = waiter.event.wait(timeout)
+        with self._cond:
+            self._stats["wait_seconds"] += time.monotonic() - start
+            if not granted:
+                waiter.abandoned = True
+                self._stats["queue_timeouts"] += 1
+                raise UpstreamUnavailable(host, "queue timeout")
+        if waiter.error is not None:
+            raise waiter.error
+
+    async def aacquire(self, host, priority=None):
+        start = time.monotonic()
+        with self._cond:
+            waiter = self._admit(host, current_priority() if priority is None else priority,
+                                 asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # wait_for del caller: el despachador se salta este hueco
+            with self._cond:
+                waiter.abandoned = True
+            raise
+        finally:
+            with self._cond:
+                self._stats["wait_seconds"] += time.monotonic() - start
+
+    # --- Despachador ---
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="upstream-scheduler", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                next_at = None
+                for host in self._hosts.values():
+                    self._drain(host, now)
+                    if host.waiters:
+                        ready = host.ready_at(now)
+                        next_at = ready if next_at is None else min(next_at, ready)
+                self._cond.wait(None if next_at is None else max(0.001, next_at - now))
+
+    def _drain(self, host, now):
+        if host.state == "open":
+            # Lo que esperaba turno ya no va a salir: que use la cache
+            while host.waiters:
+                _, _, waiter = heapq.heappop(host.waiters)
+                if not waiter.abandoned:
+                    self._stats["rejected"] += 1
+                    waiter.wake(UpstreamUnavailable(host.name, "circuit open"))
+            return
+        host.refill(now)
+        while host.waiters and now >= host.backoff_until and host.tokens >= 1:
+            _, _, waiter = heapq.heappop(host.waiters)
+            if waiter.abandoned or (waiter.future is not None and waiter.future.cancelled()):
+                continue
+            host.tokens -= 1
+            self._stats["granted"] += 1
+            waiter.wake()
+
+    # --- Resultados ---
+
+    def report(self, host, status=None, error=None, retry_after=None):
+        # status: codigo HTTP de la respuesta; error: excepcion de red/yfinance
+        failed = error is not None or (status is not None and is_failure(status))
+        with self._cond:
+            h = self._host(host)
+            now = time.monotonic()
+            if not failed:
+                h.failures = 0
+                h.strikes = 0
+                h.rate = min(h.max_rate, h.rate + h.max_rate * 0.1)
+                if h.state != "closed":
+                    print(f"Upstream circuit closed: {host}")
+                    h.state = "closed"
+                    h.cooldown = BREAKER_COOLDOWN
+                return
+            h.failures += 1
+            if error is None:
+                # 429/5xx: Yahoo pide aire -> pausa y menos ritmo
+                h.strikes += 1
+                self._stats["throttled"] += 1
+                delay = retry_after if retry_after else \
+                    min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (h.strikes - 1)) * random.uniform(0.5, 1.0)
+                h.backoff_until = max(h.backoff_until, now + delay)
+                h.rate = max(MIN_RATE, h.rate / 2)
+                h.tokens = min(h.tokens, 0.0)
+                self._stats["backoffs"] += 1
+                print(f"Upstream throttled ({host} {status}): backing off {delay:.1f}s at {h.rate:.2f} req/s")
+            else:
+                self._stats["errors"] += 1
+            if h.state == "half_open" or h.failures >= BREAKER_THRESHOLD:
+                if h.state == "half_open":
+                    h.cooldown = min(BREAKER_COOLDOWN_MAX, h.cooldown * 2)
+                h.state = "open"
+                h.open_until = now + h.cooldown
+                self._stats["breaker_opened"] += 1
+                print(f"Upstream circuit open: {host} for {h.cooldown:.0f}s")
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, host):
+        # Para llamadas que no pasan por http_pool (yfinance): turno + resultado.
+        # Un error de parseo o de datos (KeyError, ValueError...) no es un fallo
+        # de Yahoo: cuenta como respuesta buena y se relanza
+        self.acquire(host)
+        try:
+            yield
+        except UpstreamError as e:
+            self.report(host, e.status_code)
+            raise
+        except UPSTREAM_ERRORS as e:
+            self.report(host, error=e)
+            raise
+        except Exception:
+            self.report(host, 200)
+            raise
+        self.report(host, 200)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            now = time.monotonic()
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            hosts = {}
+            for host in self._hosts.values():
+                queued = [w for _, _, w in host.waiters if not w.abandoned]
+                for waiter in queued:
+                    depth[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+                hosts[host.name] = {
+                    "rate": host.rate,
+                    "queued": len(queued),
+                    "backoff_seconds": max(0.0, host.backoff_until - now),
+                    "breaker_open": host.state != "closed",
+                    "consecutive_failures": host.failures,
+                }
+            stats["queue_depth"] = depth
+            stats["hosts"] = hosts
+            return stats
+
+
+# Planificador compartido por todo el proceso
+scheduler = UpstreamScheduler()
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+from curl_cffi.requests import RequestsError
+
+import throttle
+from cache import TTLCache
+
+# Planificador de llamadas a Yahoo sin red: orden por prioridad, backoff y
+# circuit breaker.
+
+
+def test_priority_order():
+    # Sin tokens: los turnos salen por prioridad y, dentro de cada una, por llegada
+    sched = throttle.UpstreamScheduler(rate=50, burst=1)
+    sched.acquire("h")
+    order = []
+
+    async def call(name, level):
+        await sched.aacquire("h", level)
+        order.append(name)
+
+    async def main():
+        await asyncio.gather(call("scan1", throttle.BACKGROUND), call("live", throttle.LIVE),
+                             call("scan2", throttle.BACKGROUND), call("user", throttle.INTERACTIVE))
+    asyncio.run(main())
+    assert order == ["user", "live", "scan1", "scan2"], order
+
+
+def test_backoff_and_breaker():
+    cooldown = throttle.BREAKER_COOLDOWN
+    throttle.BREAKER_COOLDOWN = 0.2
+    try:
+        sched = throttle.UpstreamScheduler(rate=1000, burst=1000)
+        sched.acquire("h")
+        sched.report("h", 429, retry_after=0.1)
+        assert sched.stats()["hosts"]["h"]["rate"] == 500
+        start = time.monotonic()
+        sched.acquire("h")
+        assert time.monotonic() - start >= 0.09
+        sched.report("h", 200)
+
+        for _ in range(throttle.BREAKER_THRESHOLD):
+            sched.report("h", error=ConnectionError("reset"))
+        assert sched.stats()["breaker_opened"] == 1
+        try:
+            sched.acquire("h")
+            assert False, "circuit should be open"
+        except throttle.UpstreamUnavailable:
+            pass
+
+        # Enfriado: una sola llamada de prueba; si va bien se cierra
+        time.sleep(0.25)
+        sched.acquire("h")
+        try:
+            sched.acquire("h")
+            assert False, "only one probe while half-open"
+        except throttle.UpstreamUnavailable:
+            pass
+        sched.report("h", 200)
+        sched.acquire("h")
+        assert not sched.stats()["hosts"]["h"]["breaker_open"]
+    finally:
+        throttle.BREAKER_COOLDOWN = cooldown
+
+
+def test_sync_waiters_and_stale_if_error():
+    sched = throttle.UpstreamScheduler(rate=200, burst=1)
+    done = []
+    threads = [threading.Thread(target=lambda: (sched.acquire("h"), done.append(1))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(2)
+    assert len(done) == 5
+    assert sched.stats()["queue_depth"]["interactive"] == 0
+
+    # Entrada fuera de la ventana de stale: se sirve solo si la descarga falla
+    cache = TTLCache(ttls={"chart": 0.01}, stale_factor=1)
+    cache.set("chart", "AAPL", "old")
+    time.sleep(0.03)
+
+    def unavailable():
+        raise throttle.UpstreamUnavailable("h", "circuit open")
+    assert cache.get_or_fetch("chart", "AAPL", unavailable) == "old"
+    assert cache.get_or_fetch("chart", "AAPL", lambda: "new") == "new"
+    try:
+        cache.get_or_fetch("chart", "MSFT", unavailable)
+        assert False, "nothing cached to fall back on"
+    except throttle.UpstreamUnavailable:
+        pass
+
+
+def test_slot_reports_only_upstream_errors():
+    sched = throttle.UpstreamScheduler()
+
+    def run(error):
+        try:
+            with sched.slot("yf"):
+                raise error
+        except type(error):
+            pass
+        return sched.stats()["hosts"]["yf"]["consecutive_failures"]
+
+    # Error nuestro (parseo, datos que faltan): no es un fallo de Yahoo
+    assert run(KeyError("Net Income")) == 0 and run(ValueError("bad frame")) == 0
+    assert sched.stats()["errors"] == 0
+    # Red, timeout o HTTP: si cuentan
+    assert run(RequestsError("connection reset")) == 1
+    assert run(TimeoutError()) == 2
+    assert sched.stats()["errors"] == 2
+    # Una llamada buena reinicia la cuenta
+    with sched.slot("yf"):
+        pass
+    assert sched.stats()["hosts"]["yf"]["consecutive_failures"] == 0
+    # Un 429 de Yahoo: backoff, como en http_pool
+    assert run(throttle.UpstreamError(429)) == 1
+    assert sched.stats()["throttled"] == 1 and sched.stats()["hosts"]["yf"]["backoff_seconds"] > 0
@@ -1,11 +1,15 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Activity, RefreshCw, Search, Plus, X, LineChart, TrendingUp, TrendingDown, Clock } from 'lucide-react';
 import { ChartComponent } from './ChartComponent';
+import { lastRow, isColumnar, lastBarTime, mergeHistory } from './history';
+import type { AnalysisHistory } from './history';
 import './App.css';
 
 const API_URL = 'https://trade-dashboard-nu.vercel.app';
 // const API_URL = 'http://localhost:8000'; // Backend local CON volumen
 const DEFAULT_SYMBOLS = ['BTC-USD', 'ETH-USD', 'SPY', 'QQQ', 'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA'];
+// Timeframes intradia (el backend los guarda en memoria, ver intraday_store.py)
+const INTRADAY_TIMEFRAMES = ['1m', '5m', '15m', '1h'];
 
 interface AnalysisResult {
   symbol: string;
@@ -15,7 +19,9 @@ interface AnalysisResult {
   signal: 'BUY' | 'SELL' | 'HOLD' | 'COMPRA' | 'VENTA' | 'NEUTRA' | 'ESPERA';
   strategy_buy?: string;
   strategy_sell?: string;
-  history?: any[];
+  history?: AnalysisHistory;
+  interval?: string; // Timeframe con el que se pidio (para aplicar deltas)
+  since?: number;
   error?: string;
   trade_setup?: {
     recommendation: string;
@@ -47,7 +53,7 @@ function getExpertAnalysis(asset: AnalysisResult) {
 
   if (!asset.history || asset.history.length === 0) return null;
 
-  const last = asset.history[asset.history.length - 1];
+  const last = lastRow(asset.history);
   const price = asset.current_price;
   const sma = asset.sma_50 || last.sma_50 || price;
   const ema200 = last.ema_200 || sma; // Fallback to SMA if EMA200 not ready
@@ -142,6 +148,19 @@ function App() {
   const [isLive, setIsLive] = useState(false); // Live Mode State
   const [selectedAsset, setSelectedAsset] = useState<AnalysisResult | null>(null);
 
+  // El intervalo de live mode captura un render antiguo: leer siempre el ultimo
+  const selectedRef = useRef<AnalysisResult | null>(null);
+  useEffect(() => {
+    selectedRef.current = selectedAsset;
+  }, [selectedAsset]);
+  const lastEtagRef = useRef<{ url: string; etag: string } | null>(null);
+
+  const applyResult = (newResult: AnalysisResult) => {
+    // Update in list
+    setData(prev => prev.map(item => item.symbol === newResult.symbol ? newResult : item));
+    setSelectedAsset(newResult);
+  };
+
   // Function to fetch a single asset (used when changing timeframe)
   const fetchSingleAsset = async (symbol: string) => {
     // Silent loading for live updates? Or global loading?
@@ -149,14 +168,31 @@ function App() {
     if (!isLive) setLoading(true);
 
     try {
-      const response = await fetch(`${API_URL}/analyze/${symbol}?interval=${timeframe}`);
+      // En live mode solo se piden las velas nuevas (since) y se revalida con ETag
+      const current = selectedRef.current;
+      const base = isLive && current && current.symbol === symbol && current.interval === timeframe && isColumnar(current.history)
+        ? current.history : null;
+      const since = base ? lastBarTime(base) : null;
+      let url = `${API_URL}/analyze/${symbol}?interval=${timeframe}&format=columnar`;
+      if (since != null) url += `&since=${since}`;
+
+      const headers: Record<string, string> = {};
+      if (lastEtagRef.current?.url === url) headers['If-None-Match'] = lastEtagRef.current.etag;
+      const response = await fetch(url, { headers });
+      if (response.status === 304) {
+        if (!isLive) setLoading(false);
+        return;
+      }
       if (!response.ok) throw new Error('Network error');
-      const jsonData = await response.json();
-      const newResult = { ...jsonData, symbol };
+      const etag = response.headers.get('ETag');
+      lastEtagRef.current = etag ? { url, etag } : null;
 
-      // Update in list
-      setData(prev => prev.map(item => item.symbol === symbol ? newResult : item));
-      setSelectedAsset(newResult);
+      const jsonData = await response.json();
+      const newResult = { ...jsonData, symbol, interval: timeframe };
+      if (base && jsonData.since != null && isColumnar(jsonData.history)) {
+        newResult.history = mergeHistory(base, jsonData.history, jsonData.since);
+      }
+      applyResult(newResult);
     } catch (err) {
       console.error(err);
     }
@@ -169,45 +205,63 @@ function App() {
     }
   }, [timeframe]);
 
-  // Live Mode Interval
+  // Live Mode: stream SSE compartido en el backend (/stream); si no hay
+  // streaming disponible (p.ej. serverless) se vuelve al polling con deltas
   useEffect(() => {
-    let interval: any;
-    if (isLive && selectedAsset) {
-      interval = setInterval(() => {
-        fetchSingleAsset(selectedAsset.symbol);
-      }, 10000); // 10 seconds refresh
-    }
-    return () => clearInterval(interval);
+    if (!isLive || !selectedAsset) return;
+    const symbol = selectedAsset.symbol;
+    let interval: any = null;
+
+    const source = new EventSource(`${API_URL}/stream/${symbol}?interval=${timeframe}`);
+    source.addEventListener('snapshot', (e) => {
+      const jsonData = JSON.parse((e as MessageEvent).data);
+      applyResult({ ...jsonData, symbol, interval: timeframe });
+    });
+    source.addEventListener('update', (e) => {
+      const update = JSON.parse((e as MessageEvent).data);
+      const current = selectedRef.current;
+      if (!current || current.symbol !== symbol || current.interval !== timeframe) return;
+      if (!isColumnar(current.history) || !isColumnar(update.history)) return;
+      // Noticias y recomendaciones solo llegan en el snapshot: se conservan
+      applyResult({ ...current, ...update, history: mergeHistory(current.history, update.history, update.since) });
+    });
+    source.onerror = () => {
+      source.close();
+      if (!interval) {
+        interval = setInterval(() => {
+          fetchSingleAsset(symbol);
+        }, 10000); // 10 seconds refresh
+      }
+    };
+
+    return () => {
+      source.close();
+      clearInterval(interval);
+    };
   }, [isLive, selectedAsset?.symbol, timeframe]);
 
 
   const fetchData = async (symbolList: string[]) => {
     setLoading(true);
-    const results: AnalysisResult[] = [];
-
-    const fetchItem = async (symbol: string) => {
-      try {
-        const response = await fetch(`${API_URL}/analyze/${symbol}?interval=${timeframe}`);
-        if (!response.ok) throw new Error('Network error');
-        const jsonData = await response.json();
-        return { ...jsonData, symbol };
-      } catch (err) {
-        console.error(`Error fetching ${symbol}:`, err);
-        results.push({
-          symbol,
-          current_price: 0,
-          rsi: 0,
-          sma_50: 0,
-          signal: 'HOLD',
-          error: 'Failed to fetch'
-        } as unknown as AnalysisResult); // Cast for safety
-      }
-    }
+    let results: AnalysisResult[] = [];
 
-    // Execute sequentially to be nice to API
-    for (const sym of symbolList) {
-      const res = await fetchItem(sym);
-      if (res) results.push(res);
+    // Un solo request: el backend analiza los simbolos en paralelo
+    try {
+      const query = encodeURIComponent(symbolList.join(','));
+      const response = await fetch(`${API_URL}/analyze/batch?symbols=${query}&interval=${timeframe}&format=columnar`);
+      if (!response.ok) throw new Error('Network error');
+      const jsonData = await response.json();
+      results = jsonData.results.map((r: AnalysisResult) => ({ ...r, interval: timeframe }));
+    } catch (err) {
+      console.error('Error fetching watchlist:', err);
+      results = symbolList.map(symbol => ({
+        symbol,
+        current_price: 0,
+        rsi: 0,
+        sma_50: 0,
+        signal: 'HOLD',
+        error: 'Failed to fetch'
+      } as unknown as AnalysisResult)); // Cast for safety
     }
 
     setData(results);
@@ -364,7 +418,8 @@ function App() {
 
                 {/* Timeframe Selector */}
                 <div style={{ display: 'flex', gap: '0.25rem', marginTop: '0.5rem' }}>
-                  {[{ id: '1d', label: '1D' }, { id: '1wk', label: '1S' }, { id: '1mo', label: '1M' }].map((tf) => (
+                  {[{ id: '1m', label: '1min' }, { id: '5m', label: '5min' }, { id: '15m', label: '15min' }, { id: '1h', label: '1H' },
+                    { id: '1d', label: '1D' }, { id: '1wk', label: '1S' }, { id: '1mo', label: '1M' }].map((tf) => (
                     <button
                       key={tf.id}
                       onClick={() => setTimeframe(tf.id)}
@@ -421,6 +476,7 @@ function App() {
                 <ChartComponent
                   data={selectedAsset.history}
                   chartId={`${selectedAsset.symbol}-${timeframe}`}
+                  intraday={INTRADAY_TIMEFRAMES.includes(timeframe)}
                   tradeSetup={selectedAsset.trade_setup}
                   isBuffett={selectedAsset.buffett_certified}
                   isBurry={selectedAsset.burry_risk}
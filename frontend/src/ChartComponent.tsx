@@ -1,9 +1,12 @@
 import { useEffect, useRef } from 'react';
 import { createChart, ColorType } from 'lightweight-charts';
 import type { IChartApi, ISeriesApi } from 'lightweight-charts';
+import { SERIES, SeriesDiffer } from './chartSeries';
+import type { ChartUpdate, SeriesName } from './chartSeries';
+import type { AnalysisHistory } from './history';
 
 interface ChartProps {
-    data: any[];
+    data: AnalysisHistory; // Filas o formato columnar de /analyze
     chartId: string;
     colors?: {
         backgroundColor?: string;
@@ -18,30 +21,32 @@ interface ChartProps {
     };
     isBuffett?: boolean;
     isBurry?: boolean;
+    intraday?: boolean; // Velas de minutos/horas: eje con hora
 }
 
-export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffett, isBurry }: ChartProps) => {
+export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffett, intraday }: ChartProps) => {
     const chartContainerRef = useRef<HTMLDivElement>(null);
     const chartRef = useRef<IChartApi | null>(null);
     const priceLinesRef = useRef<any[]>([]); // To manage horizontal lines
 
-    // Refs for Series
-    const candleSeriesRef = useRef<ISeriesApi<"Candlestick"> | null>(null);
-    const volumeSeriesRef = useRef<ISeriesApi<"Histogram"> | null>(null);
-    const upperSeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
-    const lowerSeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
-    const smaSeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
-    const emaSeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
-
-    // STRATEGY SERIES
-    const grahamSeriesRef = useRef<ISeriesApi<"Area"> | null>(null);
-    const lynchSeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
-    const burrySeriesRef = useRef<ISeriesApi<"Line"> | null>(null);
+    // Series por nombre (ver chartSeries.ts)
+    const seriesRef = useRef<Partial<Record<SeriesName, ISeriesApi<any>>>>({});
+    const converterRef = useRef<Converter | null>(null);
 
     const prevChartIdRef = useRef<string | null>(null);
 
     const colorsString = JSON.stringify(colors);
 
+    // 0. Worker de conversion (uno por grafico, vive lo que el componente)
+    useEffect(() => {
+        const converter = createConverter();
+        converterRef.current = converter;
+        return () => {
+            converter.terminate();
+            converterRef.current = null;
+        };
+    }, []);
+
     // 1. Initialize Chart (Run once or on color change)
     useEffect(() => {
         if (!chartContainerRef.current) return;
@@ -61,6 +66,7 @@ export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffe
             },
             timeScale: {
                 borderColor: 'rgba(255, 255, 255, 0.1)',
+                timeVisible: !!intraday,
             },
             rightPriceScale: {
                 borderColor: 'rgba(255, 255, 255, 0.1)',
@@ -75,9 +81,13 @@ export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffe
             },
         });
 
+        const series: Partial<Record<SeriesName, ISeriesApi<any>>> = {};
+        // Proyeccion: misma linea, sin titulo ni etiqueta de ultimo valor
+        const projection = { title: '', lastValueVisible: false, priceLineVisible: false, crosshairMarkerVisible: false };
+
         // Initialize Strategy Series FIRST (Background Context)
         // Graham is now an AREA to visualize the 'Safety Zone'
-        grahamSeriesRef.current = chart.addAreaSeries({
+        const grahamOptions = {
             topColor: 'rgba(16, 185, 129, 0.2)', // Emerald tint
             bottomColor: 'rgba(16, 185, 129, 0.05)',
             lineColor: 'rgba(16, 185, 129, 1)',
@@ -85,26 +95,32 @@ export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffe
             title: 'Suelo Buffett/Graham (Zona Valor)',
             crosshairMarkerVisible: true,
             lineStyle: 0
-        });
+        } as const;
+        series.graham = chart.addAreaSeries(grahamOptions);
+        series.graham_proj = chart.addAreaSeries({ ...grahamOptions, ...projection });
 
-        lynchSeriesRef.current = chart.addLineSeries({
+        const lynchOptions = {
             color: '#3b82f6', // Blue 500
             lineWidth: 2,
             lineStyle: 0, // Solid (Camino Principal)
             title: 'Lynch Fair Value (Crecimiento)',
             crosshairMarkerVisible: true
-        });
+        } as const;
+        series.lynch = chart.addLineSeries(lynchOptions);
+        series.lynch_proj = chart.addLineSeries({ ...lynchOptions, ...projection });
 
-        burrySeriesRef.current = chart.addLineSeries({
+        const burryOptions = {
             color: '#ef4444', // Red 500
             lineWidth: 2,
             lineStyle: 2, // Dashed
             title: 'Techo Burry (Zona Burbuja)',
             crosshairMarkerVisible: true
-        });
+        } as const;
+        series.burry = chart.addLineSeries(burryOptions);
+        series.burry_proj = chart.addLineSeries({ ...burryOptions, ...projection });
 
         // Initialize Technical Series
-        candleSeriesRef.current = chart.addCandlestickSeries({
+        series.candles = chart.addCandlestickSeries({
             upColor: '#10b981',
             downColor: '#ef4444',
             borderVisible: false,
@@ -112,39 +128,36 @@ export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffe
             wickDownColor: '#ef4444',
         });
 
-        volumeSeriesRef.current = chart.addHistogramSeries({
+        series.volume = chart.addHistogramSeries({
             priceFormat: { type: 'volume' },
             priceScaleId: 'right', // Overlay
             priceLineVisible: false,
             lastValueVisible: false,
         });
 
-        upperSeriesRef.current = chart.addLineSeries({
+        const bandOptions = {
             color: 'rgba(41, 98, 255, 0.3)',
             lineWidth: 1,
             lineStyle: 2, // Dashed
-            title: 'Upper Band',
-        });
+        } as const;
+        series.upper = chart.addLineSeries({ ...bandOptions, title: 'Upper Band' });
+        series.upper_proj = chart.addLineSeries({ ...bandOptions, ...projection });
+        series.lower = chart.addLineSeries({ ...bandOptions, title: 'Lower Band' });
+        series.lower_proj = chart.addLineSeries({ ...bandOptions, ...projection });
 
-        lowerSeriesRef.current = chart.addLineSeries({
-            color: 'rgba(41, 98, 255, 0.3)',
-            lineWidth: 1,
-            lineStyle: 2, // Dashed
-            title: 'Lower Band',
-        });
-
-        smaSeriesRef.current = chart.addLineSeries({
+        series.sma = chart.addLineSeries({
             color: '#fbbf24',
             lineWidth: 2,
             title: 'SMA 50',
         });
 
-        emaSeriesRef.current = chart.addLineSeries({
+        series.ema = chart.addLineSeries({
             color: '#8b5cf6',
             lineWidth: 2,
             title: 'EMA 200 (Tendencia)',
         });
 
+        seriesRef.current = series;
         chartRef.current = chart;
 
         const handleResize = () => {
@@ -161,159 +174,118 @@ export const ChartComponent = ({ data, chartId, colors = {}, tradeSetup, isBuffe
             window.removeEventListener('resize', handleResize);
             chart.remove();
             chartRef.current = null;
+            seriesRef.current = {};
+            priceLinesRef.current = [];
         };
     }, [colorsString]);
 
-    // 2. Update Data
     useEffect(() => {
-        if (!data || data.length === 0 || !chartRef.current) return;
-
-        const sortedData = [...data].sort((a, b) => (new Date(a.time).getTime() - new Date(b.time).getTime()));
-
-        // Calculate Range
-        let minPrice = Infinity;
-        let maxPrice = -Infinity;
-        let maxVol = -Infinity;
-
-        for (const item of sortedData) {
-            const h = item.high ?? item.close;
-            const l = item.low ?? item.close;
-            const v = item.volume || 0;
-            if (h > maxPrice) maxPrice = h;
-            if (l < minPrice) minPrice = l;
-            if (v > maxVol) maxVol = v;
-        }
+        chartRef.current?.applyOptions({ timeScale: { timeVisible: !!intraday } });
+    }, [intraday]);
 
-        if (minPrice === Infinity) minPrice = 0;
-        if (maxPrice === -Infinity) maxPrice = 100;
-        if (maxVol === -Infinity || maxVol === 0) maxVol = 1;
-
-        const priceRange = maxPrice - minPrice;
-
-        const candles = sortedData
-            .filter(item => item.close != null)
-            .map(item => ({
-                time: item.time,
-                open: item.open ?? item.close,
-                high: item.high ?? item.close,
-                low: item.low ?? item.close,
-                close: item.close,
-            }));
-
-        const volumeData = sortedData.map(item => ({
-            time: item.time,
-            value: (minPrice - (priceRange * 0.05)) + ((item.volume || 0) / maxVol) * (priceRange * 0.45),
-            color: (item.close >= (item.open ?? item.close)) ? 'rgba(16, 185, 129, 0.3)' : 'rgba(239, 68, 68, 0.3)',
-        }));
-
-        // Technicals
-        const upperData = sortedData
-            .filter(item => item.upper_band != null)
-            .map(item => ({ time: item.time, value: item.upper_band }));
-
-        const lowerData = sortedData
-            .filter(item => item.lower_band != null)
-            .map(item => ({ time: item.time, value: item.lower_band }));
-
-        const smaData = sortedData
-            .filter(item => item.sma_50 != null)
-            .map(item => ({ time: item.time, value: item.sma_50 }));
-
-        const ema200Data = sortedData
-            .filter(item => item.ema_200 != null && item.ema_200 !== 0)
-            .map(item => ({ time: item.time, value: item.ema_200 }));
-
-        // Fundamentals (Strategy Lines)
-        const grahamData = sortedData
-            .filter(item => item.graham_number != null && item.graham_number > 0)
-            .map(item => ({ time: item.time, value: item.graham_number }));
-
-        const lynchData = sortedData
-            .filter(item => item.lynch_line != null && item.lynch_line > 0)
-            .map(item => ({ time: item.time, value: item.lynch_line }));
-
-        const burryData = sortedData
-            .filter(item => item.burry_line != null && item.burry_line > 0)
-            .map(item => ({ time: item.time, value: item.burry_line }));
-
-        // Set Data
-        if (candleSeriesRef.current) candleSeriesRef.current.setData(candles);
-        if (volumeSeriesRef.current) volumeSeriesRef.current.setData(volumeData);
-        if (upperSeriesRef.current) upperSeriesRef.current.setData(upperData);
-        if (lowerSeriesRef.current) lowerSeriesRef.current.setData(lowerData);
-        if (smaSeriesRef.current) smaSeriesRef.current.setData(smaData);
-        if (emaSeriesRef.current) emaSeriesRef.current.setData(ema200Data);
-
-        if (grahamSeriesRef.current) grahamSeriesRef.current.setData(grahamData);
-        if (lynchSeriesRef.current) lynchSeriesRef.current.setData(lynchData);
-        if (burrySeriesRef.current) burrySeriesRef.current.setData(burryData);
-
-        // Add Markers
-        const markers: any[] = [];
-        for (const item of sortedData) {
-            if (item.signal === 'BUY') {
-                markers.push({
-                    time: item.time,
-                    position: 'belowBar',
+    // 2. Update Data: todo al cambiar de simbolo/intervalo (o recrear el
+    // grafico); en live mode solo los puntos que cambian
+    useEffect(() => {
+        const chart = chartRef.current;
+        const converter = converterRef.current;
+        if (!data || data.length === 0 || !chart || !converter) return;
+
+        const full = prevChartIdRef.current !== chartId;
+        prevChartIdRef.current = chartId;
+        converter.convert(data, full).then(update => {
+            // Respuesta de un grafico ya recreado o de otro simbolo: la siguiente lo rehace entero
+            if (chartRef.current !== chart || prevChartIdRef.current !== chartId) return;
+            applyUpdate(seriesRef.current, update);
+            if (full) chart.timeScale().fitContent();
+        });
+    }, [data, chartId, colorsString]);
+
+    // 3. Update Price Lines (Liquidity Zones)
+    useEffect(() => {
+        const candles = seriesRef.current.candles;
+        if (!candles) return;
+
+        // Clear old lines
+        priceLinesRef.current.forEach(l => candles.removePriceLine(l));
+        priceLinesRef.current = [];
+
+        if (tradeSetup) {
+            if (tradeSetup.target_entry > 0) {
+                const l = candles.createPriceLine({
+                    price: tradeSetup.target_entry,
                     color: '#10b981',
-                    shape: 'arrowUp',
-                    text: 'BUY',
-                    size: 2,
+                    lineWidth: 2,
+                    lineStyle: 0, // Solid
+                    axisLabelVisible: true,
+                    title: 'ZONA COMPRA (Soporte)',
                 });
-            } else if (item.signal === 'SELL') {
-                markers.push({
-                    time: item.time,
-                    position: 'aboveBar',
+                priceLinesRef.current.push(l);
+            }
+            if (tradeSetup.take_profit > 0) {
+                const l = candles.createPriceLine({
+                    price: tradeSetup.take_profit,
                     color: '#ef4444',
-                    shape: 'arrowDown',
-                    text: 'SELL',
-                    size: 2,
+                    lineWidth: 2,
+                    lineStyle: 0,
+                    axisLabelVisible: true,
+                    title: 'ZONA VENTA (Resistencia)',
                 });
+                priceLinesRef.current.push(l);
             }
         }
-        if (candleSeriesRef.current) candleSeriesRef.current.setMarkers(markers);
-
-        // Update Price Lines (Liquidity Zones)
-        if (candleSeriesRef.current) {
-            // Clear old lines
-            priceLinesRef.current.forEach(l => candleSeriesRef.current?.removePriceLine(l));
-            priceLinesRef.current = [];
-
-            if (tradeSetup) {
-                if (tradeSetup.target_entry > 0) {
-                    const l = candleSeriesRef.current.createPriceLine({
-                        price: tradeSetup.target_entry,
-                        color: '#10b981',
-                        lineWidth: 2,
-                        lineStyle: 0, // Solid
-                        axisLabelVisible: true,
-                        title: 'ZONA COMPRA (Soporte)',
-                    });
-                    priceLinesRef.current.push(l);
-                }
-                if (tradeSetup.take_profit > 0) {
-                    const l = candleSeriesRef.current.createPriceLine({
-                        price: tradeSetup.take_profit,
-                        color: '#ef4444',
-                        lineWidth: 2,
-                        lineStyle: 0,
-                        axisLabelVisible: true,
-                        title: 'ZONA VENTA (Resistencia)',
-                    });
-                    priceLinesRef.current.push(l);
-                }
-            }
-        }
-
-        // Update Zoom
-        if (prevChartIdRef.current !== chartId && candles.length > 0) {
-            chartRef.current.timeScale().fitContent();
-            prevChartIdRef.current = chartId;
-        }
-
-    }, [data, chartId, tradeSetup, isBuffett, isBurry]);
+    }, [tradeSetup, colorsString]);
 
     return (
         <div ref={chartContainerRef} style={{ width: '100%', position: 'relative' }} />
     );
 };
+
+interface Converter {
+    convert: (history: AnalysisHistory, full: boolean) => Promise<ChartUpdate>;
+    terminate: () => void;
+}
+
+// Conversion en un Web Worker; sin Workers (tests, navegadores viejos) en este hilo
+function createConverter(): Converter {
+    if (typeof Worker === 'undefined') {
+        const differ = new SeriesDiffer();
+        return {
+            convert: (history, full) => Promise.resolve(differ.next(history, full)),
+            terminate: () => {},
+        };
+    }
+
+    const worker = new Worker(new URL('./chartSeries.worker.ts', import.meta.url), { type: 'module' });
+    const pending = new Map<number, (update: ChartUpdate) => void>();
+    let seq = 0;
+    worker.onmessage = (event: MessageEvent<ChartUpdate & { seq: number }>) => {
+        const { seq: id, ...update } = event.data;
+        pending.get(id)?.(update as ChartUpdate);
+        pending.delete(id);
+    };
+    worker.onerror = (event) => console.error('Chart worker error:', event.message);
+    return {
+        convert: (history, full) => new Promise(resolve => {
+            seq += 1;
+            pending.set(seq, resolve);
+            worker.postMessage({ seq, history, full });
+        }),
+        terminate: () => worker.terminate(),
+    };
+}
+
+function applyUpdate(series: Partial<Record<SeriesName, ISeriesApi<any>>>, update: ChartUpdate) {
+    if (update.full) {
+        for (const name of SERIES) series[name]?.setData(update.series.points[name]);
+        series.candles?.setMarkers(update.series.markers);
+        return;
+    }
+    for (const name of SERIES) {
+        const patch = update.patches[name];
+        const target = series[name];
+        if (!patch || !target) continue;
+        if ('set' in patch) target.setData(patch.set);
+        else patch.update.forEach(point => target.update(point));
+    }
+    if (update.markers) series.candles?.setMarkers(update.markers);
+}
@@ -0,0 +1,188 @@
+import type { CandlestickData, HistogramData, LineData, SeriesMarker, Time } from 'lightweight-charts';
+import { projectionCount, toColumns } from './history';
+import type { AnalysisHistory, HistoryColumns } from './history';
+
+// Conversion del historial de /analyze a los puntos de cada serie del grafico,
+// y diff contra lo que ya muestra. Corre en chartSeries.worker.ts: con anos de
+// velas y todas las lineas, convertir el JSON en el hilo principal da tirones.
+//
+// Las lineas con proyeccion a futuro llevan esos puntos en una serie aparte
+// (*_proj): asi, en live mode, lo que cambia en cada serie principal es siempre
+// la ultima vela o las nuevas y basta con series.update().
+
+export type Point = CandlestickData | HistogramData | LineData;
+
+export const SERIES = [
+    'candles', 'volume', 'upper', 'lower', 'sma', 'ema', 'graham', 'lynch', 'burry',
+    'upper_proj', 'lower_proj', 'graham_proj', 'lynch_proj', 'burry_proj',
+] as const;
+export type SeriesName = typeof SERIES[number];
+
+// Volumen dibujado en la escala de precios: depende del rango de todo el historial
+export interface VolumeScale {
+    minPrice: number;
+    maxPrice: number;
+    maxVol: number;
+}
+
+export interface ChartSeries {
+    points: Record<SeriesName, Point[]>;
+    markers: SeriesMarker<Time>[];
+    scale: VolumeScale;
+}
+
+export type SeriesPatch = { set: Point[] } | { update: Point[] };
+
+export type ChartUpdate =
+    | { full: true; series: ChartSeries }
+    | { full: false; patches: Partial<Record<SeriesName, SeriesPatch>>; markers?: SeriesMarker<Time>[] };
+
+export interface ChartRequest {
+    seq: number;
+    history: AnalysisHistory;
+    full: boolean; // Simbolo/intervalo nuevo o grafico recreado
+}
+
+// Por encima de estos puntos cambiados sale mas barato un setData
+const MAX_UPDATES = 50;
+
+// Campo de cada linea y si se descartan los valores <= 0
+const LINES: [SeriesName, keyof HistoryColumns, boolean][] = [
+    ['upper', 'upper_band', false],
+    ['lower', 'lower_band', false],
+    ['sma', 'sma_50', false],
+    ['ema', 'ema_200', true], // EMA 0 = aun sin datos
+    ['graham', 'graham_number', true],
+    ['lynch', 'lynch_line', true],
+    ['burry', 'burry_line', true],
+];
+const PROJECTED = new Set<SeriesName>(['upper', 'lower', 'graham', 'lynch', 'burry']);
+
+function volumeScale(cols: HistoryColumns, real: number): VolumeScale {
+    let minPrice = Infinity;
+    let maxPrice = -Infinity;
+    let maxVol = -Infinity;
+    for (let i = 0; i < real; i++) {
+        const h = cols.high[i] ?? cols.close[i];
+        const l = cols.low[i] ?? cols.close[i];
+        const v = cols.volume[i] || 0;
+        if (h != null && h > maxPrice) maxPrice = h;
+        if (l != null && l < minPrice) minPrice = l;
+        if (v > maxVol) maxVol = v;
+    }
+    if (minPrice === Infinity) minPrice = 0;
+    if (maxPrice === -Infinity) maxPrice = 100;
+    if (maxVol === -Infinity || maxVol === 0) maxVol = 1;
+    return { minPrice, maxPrice, maxVol };
+}
+
+const covers = (shown: VolumeScale, next: VolumeScale) =>
+    next.minPrice >= shown.minPrice && next.maxPrice <= shown.maxPrice && next.maxVol <= shown.maxVol;
+
+// `real`: velas reales (el resto es proyeccion). `scale`: la ya mostrada en
+// updates incrementales, para que el volumen de las velas anteriores no cambie
+function seriesFromColumns(cols: HistoryColumns, real: number, scale: VolumeScale): ChartSeries {
+    const n = cols.time.length;
+    const time = (i: number) => cols.time[i] as Time;
+    const priceRange = scale.maxPrice - scale.minPrice;
+
+    const candles: CandlestickData[] = [];
+    const volume: HistogramData[] = [];
+    for (let i = 0; i < real; i++) {
+        const close = cols.close[i];
+        const open = cols.open[i] ?? close;
+        if (close != null) {
+            candles.push({
+                time: time(i),
+                open: open ?? close,
+                high: cols.high[i] ?? close,
+                low: cols.low[i] ?? close,
+                close,
+            });
+        }
+        volume.push({
+            time: time(i),
+            value: (scale.minPrice - (priceRange * 0.05)) + ((cols.volume[i] || 0) / scale.maxVol) * (priceRange * 0.45),
+            color: ((close ?? 0) >= (open ?? 0)) ? 'rgba(16, 185, 129, 0.3)' : 'rgba(239, 68, 68, 0.3)',
+        });
+    }
+
+    // Puntos de una linea en [from, to) saltando huecos (null) y, si se indica, valores <= 0
+    const line = (values: (number | null)[], positiveOnly: boolean, from: number, to: number) => {
+        const out: LineData[] = [];
+        for (let i = from; i < to; i++) {
+            const value = values[i];
+            if (value == null || (positiveOnly && value <= 0)) continue;
+            out.push({ time: time(i), value });
+        }
+        return out;
+    };
+
+    const points = { candles, volume } as Record<SeriesName, Point[]>;
+    for (const [name, field, positiveOnly] of LINES) {
+        const values = cols[field] as (number | null)[];
+        points[name] = line(values, positiveOnly, 0, real);
+        // La proyeccion arranca en la ultima vela real para que la linea siga sin corte
+        if (PROJECTED.has(name)) {
+            points[`${name}_proj` as SeriesName] = real < n ? line(values, positiveOnly, Math.max(real - 1, 0), n) : [];
+        }
+    }
+
+    const markers: SeriesMarker<Time>[] = [];
+    for (let i = 0; i < n; i++) {
+        if (cols.signal[i] === 'BUY') {
+            markers.push({ time: time(i), position: 'belowBar', color: '#10b981', shape: 'arrowUp', text: 'BUY', size: 2 });
+        } else if (cols.signal[i] === 'SELL') {
+            markers.push({ time: time(i), position: 'aboveBar', color: '#ef4444', shape: 'arrowDown', text: 'SELL', size: 2 });
+        }
+    }
+
+    return { points, markers, scale };
+}
+
+const samePoint = (a: any, b: any) => {
+    for (const key in b) {
+        if (a[key] !== b[key]) return false;
+    }
+    return true;
+};
+
+// Cambios de una serie: nada, update() de la ultima vela y las nuevas, o setData
+export function diffPoints<T>(prev: T[], next: T[]): { set: T[] } | { update: T[] } | null {
+    const common = Math.min(prev.length, next.length);
+    let k = 0;
+    while (k < common && samePoint(prev[k], next[k])) k++;
+    if (k === prev.length && k === next.length) return null;
+    // update() solo admite la ultima vela mostrada o posteriores
+    if (prev.length > 0 && k >= prev.length - 1 && next.length - k <= MAX_UPDATES) {
+        return { update: next.slice(k) };
+    }
+    return { set: next };
+}
+
+// Recuerda lo ultimo enviado al grafico para mandar solo las diferencias
+export class SeriesDiffer {
+    private shown: ChartSeries | null = null;
+
+    next(history: AnalysisHistory, full: boolean): ChartUpdate {
+        const prev = this.shown;
+        const cols = toColumns(history);
+        const real = cols.time.length - projectionCount(history);
+        const scale = volumeScale(cols, real);
+        // Maximo o minimo nuevos: el volumen de todas las velas se reescala
+        if (full || !prev || !covers(prev.scale, scale)) {
+            this.shown = seriesFromColumns(cols, real, scale);
+            return { full: true, series: this.shown };
+        }
+
+        const series = seriesFromColumns(cols, real, prev.scale);
+        this.shown = series;
+        const patches: Partial<Record<SeriesName, SeriesPatch>> = {};
+        for (const name of SERIES) {
+            const patch = diffPoints(prev.points[name], series.points[name]);
+            if (patch) patches[name] = patch;
+        }
+        const markers = diffPoints(prev.markers, series.markers) ? series.markers : undefined;
+        return { full: false, patches, markers };
+    }
+}
@@ -0,0 +1,11 @@
+import { SeriesDiffer } from './chartSeries';
+import type { ChartRequest } from './chartSeries';
+
+// Un worker por grafico: convierte y compara fuera del hilo principal.
+// Las respuestas salen en el mismo orden que las peticiones.
+const differ = new SeriesDiffer();
+
+self.onmessage = (event: MessageEvent<ChartRequest>) => {
+    const { seq, history, full } = event.data;
+    self.postMessage({ seq, ...differ.next(history, full) });
+};
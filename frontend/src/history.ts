@@ -0,0 +1,183 @@
+// Historial de /analyze en formato columnar (format=columnar): arrays paralelos
+// por campo, tiempos en epoch (segundos) y lineas fundamentales en run-length.
+// El formato por filas (por defecto) sigue aceptandose en todas partes.
+
+export interface RunLength<T> {
+  values: T[];
+  lengths: number[];
+}
+
+type Num = number | null;
+
+export interface ColumnarHistory {
+  length: number;
+  projections: number; // Las ultimas N filas son la proyeccion a futuro
+  time: number[];
+  open: Num[];
+  high: Num[];
+  low: Num[];
+  close: Num[];
+  volume: number[];
+  rsi: Num[];
+  sma_50: Num[];
+  ema_200: Num[];
+  upper_band: Num[];
+  lower_band: Num[];
+  graham_number: RunLength<Num>;
+  lynch_line: RunLength<Num>;
+  burry_line: RunLength<Num>;
+  signal: ('BUY' | 'SELL' | null)[];
+}
+
+export type AnalysisHistory = any[] | ColumnarHistory;
+
+// Columnas ya expandidas (fundamentales incluidos) que consume el grafico
+export interface HistoryColumns {
+  time: (number | string)[];
+  open: Num[];
+  high: Num[];
+  low: Num[];
+  close: Num[];
+  volume: number[];
+  upper_band: Num[];
+  lower_band: Num[];
+  sma_50: Num[];
+  ema_200: Num[];
+  graham_number: Num[];
+  lynch_line: Num[];
+  burry_line: Num[];
+  signal: (string | null)[];
+}
+
+export const isColumnar = (history: AnalysisHistory | undefined): history is ColumnarHistory =>
+  !!history && !Array.isArray(history);
+
+export function runLength<T>(values: T[]): RunLength<T> {
+  const runs: RunLength<T> = { values: [], lengths: [] };
+  for (const value of values) {
+    const last = runs.values.length - 1;
+    if (last >= 0 && runs.values[last] === value) runs.lengths[last]++;
+    else {
+      runs.values.push(value);
+      runs.lengths.push(1);
+    }
+  }
+  return runs;
+}
+
+export function expandRuns<T>(runs: RunLength<T>): T[] {
+  const out: T[] = [];
+  runs.values.forEach((value, i) => {
+    for (let k = 0; k < runs.lengths[i]; k++) out.push(value);
+  });
+  return out;
+}
+
+const lastRun = <T>(runs: RunLength<T>): T | undefined => runs.values[runs.values.length - 1];
+
+// Ultima fila (incluida la proyeccion), con la misma forma que el formato por filas
+export function lastRow(history: AnalysisHistory): any {
+  if (!isColumnar(history)) return history[history.length - 1];
+  const i = history.length - 1;
+  return {
+    time: history.time[i],
+    open: history.open[i],
+    high: history.high[i],
+    low: history.low[i],
+    close: history.close[i],
+    volume: history.volume[i],
+    rsi: history.rsi[i],
+    sma_50: history.sma_50[i],
+    ema_200: history.ema_200[i],
+    upper_band: history.upper_band[i],
+    lower_band: history.lower_band[i],
+    graham_number: lastRun(history.graham_number),
+    lynch_line: lastRun(history.lynch_line),
+    burry_line: lastRun(history.burry_line),
+    signal: history.signal[i],
+    is_projection: history.projections > 0,
+  };
+}
+
+// Filas de proyeccion al final del historial (una vez ordenado por tiempo)
+export function projectionCount(history: AnalysisHistory): number {
+  if (isColumnar(history)) return history.projections;
+  return history.filter(row => row.is_projection).length;
+}
+
+export function toColumns(history: AnalysisHistory): HistoryColumns {
+  if (isColumnar(history)) {
+    return {
+      time: history.time,
+      open: history.open,
+      high: history.high,
+      low: history.low,
+      close: history.close,
+      volume: history.volume,
+      upper_band: history.upper_band,
+      lower_band: history.lower_band,
+      sma_50: history.sma_50,
+      ema_200: history.ema_200,
+      graham_number: expandRuns(history.graham_number),
+      lynch_line: expandRuns(history.lynch_line),
+      burry_line: expandRuns(history.burry_line),
+      signal: history.signal,
+    };
+  }
+
+  const rows = [...history].sort((a, b) => (new Date(a.time).getTime() - new Date(b.time).getTime()));
+  const column = (field: string) => rows.map(item => item[field] ?? null);
+  return {
+    time: rows.map(item => item.time),
+    open: column('open'),
+    high: column('high'),
+    low: column('low'),
+    close: column('close'),
+    volume: rows.map(item => item.volume || 0),
+    upper_band: column('upper_band'),
+    lower_band: column('lower_band'),
+    sma_50: column('sma_50'),
+    ema_200: column('ema_200'),
+    graham_number: column('graham_number'),
+    lynch_line: column('lynch_line'),
+    burry_line: column('burry_line'),
+    signal: column('signal'),
+  };
+}
+
+// Tiempo de la ultima vela real (cursor `since` para pedir deltas)
+export function lastBarTime(history: ColumnarHistory): number | null {
+  const i = history.length - history.projections - 1;
+  return i >= 0 ? history.time[i] : null;
+}
+
+// Aplica un delta de /analyze?since=...: se conservan las velas anteriores a
+// `since` y se anade todo lo que trae el delta (incluida la nueva proyeccion)
+export function mergeHistory(prev: ColumnarHistory, delta: ColumnarHistory, since: number): ColumnarHistory {
+  let keep = prev.length - prev.projections;
+  while (keep > 0 && prev.time[keep - 1] >= since) keep--;
+
+  const cut = <T>(a: T[], b: T[]): T[] => a.slice(0, keep).concat(b);
+  const cutRuns = <T>(a: RunLength<T>, b: RunLength<T>): RunLength<T> =>
+    runLength(cut(expandRuns(a), expandRuns(b)));
+
+  return {
+    length: keep + delta.length,
+    projections: delta.projections,
+    time: cut(prev.time, delta.time),
+    open: cut(prev.open, delta.open),
+    high: cut(prev.high, delta.high),
+    low: cut(prev.low, delta.low),
+    close: cut(prev.close, delta.close),
+    volume: cut(prev.volume, delta.volume),
+    rsi: cut(prev.rsi, delta.rsi),
+    sma_50: cut(prev.sma_50, delta.sma_50),
+    ema_200: cut(prev.ema_200, delta.ema_200),
+    upper_band: cut(prev.upper_band, delta.upper_band),
+    lower_band: cut(prev.lower_band, delta.lower_band),
+    graham_number: cutRuns(prev.graham_number, delta.graham_number),
+    lynch_line: cutRuns(prev.lynch_line, delta.lynch_line),
+    burry_line: cutRuns(prev.burry_line, delta.burry_line),
+    signal: cut(prev.signal, delta.signal),
+  };
+}